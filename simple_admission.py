@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import wave
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+MB = 1024 * 1024
+
+# 分析一段音频的内存模型：固定开销 + 每秒音频的内存（MB）
+# FFmpeg解码为44.1kHz单声道WAV，Praat把Sound按double保存（约0.34MB/秒），加上Pitch对象和中间结果
+BASE_MB = 80
+PER_SECOND_MB = 44100 * 8 * 1.5 / MB
+
+# 音频指纹（simple_fingerprint）：读取开头最多 MAX_SECONDS 秒的16位PCM并转为float32（每秒6字节×采样率），
+# 再分块计算频谱（每块约8MB）
+FINGERPRINT_MAX_SECONDS = 120
+FINGERPRINT_PER_SECOND_MB = 44100 * 6 / MB
+FINGERPRINT_BLOCK_MB = 8
+
+# 压缩音频（mp3/m4a等）按128kbps估计时长
+COMPRESSED_BYTES_PER_SECOND = 16000
+
+# 无法得知大小的URL按这个时长估计（秒）
+DEFAULT_URL_SECONDS = 60
+
+def probe_duration(file_path):
+    """
+    估计音频时长：WAV读取文件头，其他格式按文件大小估计
+
+    参数:
+        file_path: 音频文件路径
+
+    返回:
+        时长（秒），文件不存在时返回None
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return None
+
+    try:
+        with wave.open(file_path, 'rb') as f:
+            if f.getframerate():
+                return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    return size / COMPRESSED_BYTES_PER_SECOND
+
+def estimate_memory_mb(duration):
+    """
+    估计分析一段音频的峰值内存
+
+    参数:
+        duration: 音频时长（秒）
+
+    返回:
+        估计内存（MB）
+    """
+    duration = max(duration, 1.0)
+    fingerprint_mb = min(duration, FINGERPRINT_MAX_SECONDS) * FINGERPRINT_PER_SECOND_MB + FINGERPRINT_BLOCK_MB
+    return BASE_MB + duration * PER_SECOND_MB + fingerprint_mb
+
+def estimate_request_mb(request):
+    """
+    根据请求估计分析所需的内存
+
+    参数:
+        request: 请求字典，包含 file 或 url
+
+    返回:
+        估计内存（MB）
+    """
+    duration = None
+    if request.get('file'):
+        duration = probe_duration(request['file'])
+    if duration is None:
+        duration = DEFAULT_URL_SECONDS
+    return estimate_memory_mb(duration)
+
+def default_budget_mb():
+    """
+    默认的内存预算：物理内存的一半
+
+    返回:
+        预算（MB），无法获取物理内存时返回0（不限制）
+    """
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 0
+    return total / MB / 2
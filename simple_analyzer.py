@@ -7,6 +7,8 @@ import simple_logger
 import simple_config
 import simple_ffmpeg
 import simple_utils
+import simple_cancel
+import simple_cache
 
 log = simple_logger.get_logger(__name__)
 conf = simple_config.get_config()
@@ -23,9 +25,14 @@ def download_audio(url):
     """
     unique_id = simple_utils.generate_unique_id()
     download_path = simple_utils.download_path(unique_id, url)
+    simple_cancel.track_path(download_path)
     
     log.info(f"开始下载音频: {url}")
-    simple_utils.download_file(url, download_path)
+    url_cache = simple_cache.get_url_cache()
+    if url_cache is not None:
+        url_cache.download(url, download_path)
+    else:
+        simple_utils.download_file(url, download_path)
     log.info(f"音频下载完成: {download_path}")
     
     return download_path
@@ -42,6 +49,7 @@ def convert_audio(download_path):
     """
     unique_id = simple_utils.generate_unique_id()
     wav_path = simple_utils.decode_path(unique_id)
+    simple_cancel.track_path(wav_path)
     
     # 确保目录存在
     os.makedirs(os.path.dirname(wav_path), exist_ok=True)
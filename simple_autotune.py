@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import simple_logger
+import simple_config
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 吞吐量与最优值相差不超过该比例时选择更少的工作进程（更省内存、交互延迟更稳定）
+_THROUGHPUT_TOLERANCE = 0.05
+
+# 调优配置文件路径（--tuned-config），通过环境变量传给工作进程
+TUNED_CONFIG_ENV = 'VOICE_ANALYZER_TUNED_CONFIG'
+
+_tuned = None
+
+def tuned_config_path():
+    """调优配置文件路径：TUNED_CONFIG_ENV 指定的路径，默认位于临时目录（打包环境中也可写）"""
+    return os.environ.get(TUNED_CONFIG_ENV) or os.path.join(conf.temp_dir, 'tuned_config.json')
+
+def load_tuned_config(path=None):
+    """
+    读取 autotune 生成的调优配置
+
+    参数:
+        path: 配置文件路径，默认为 tuned_config_path()
+
+    返回:
+        配置字典，文件不存在或无法解析时返回空字典
+    """
+    global _tuned
+    if path is None and _tuned is not None:
+        return _tuned
+
+    config_path = path or tuned_config_path()
+    tuned = {}
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                tuned = json.load(f)
+            log.info(f"已加载调优配置: {config_path}")
+        except Exception as e:
+            log.warning(f"调优配置读取失败，使用默认值: {config_path}, 错误: {str(e)}")
+            tuned = {}
+
+    if path is None:
+        _tuned = tuned
+    return tuned
+
+def find_samples(limit=8):
+    """
+    查找用于校准的样本WAV（temp/wav 中按文件名排序的前若干个）
+
+    参数:
+        limit: 最多使用的样本数
+
+    返回:
+        WAV文件路径列表
+    """
+    return sorted(glob.glob(os.path.join(conf.wav_dir, '*.wav')))[:limit]
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return round(values[index], 4)
+
+def _summary(values):
+    return {
+        'mean': round(sum(values) / len(values), 4) if values else None,
+        'p50': _percentile(values, 50),
+        'p95': _percentile(values, 95),
+    }
+
+def measure_stages(samples):
+    """
+    在当前进程中逐个运行各阶段，测量单个请求的阶段耗时
+
+    参数:
+        samples: WAV文件路径列表
+
+    返回:
+        {'convert': 统计, 'pitch': 统计, 'score': 统计}
+    """
+    import simple_analyzer
+    import simple_judger
+    import simple_model
+    import simple_utils
+
+    simple_model.ensure_loaded()
+    timings = {'convert': [], 'pitch': [], 'score': []}
+    for sample in samples:
+        started = time.perf_counter()
+        wav_path = simple_analyzer.analyze_local_file(sample)
+        converted = time.perf_counter()
+        try:
+            pitch_data = simple_judger.create_praat(wav_path).praat()
+            extracted = time.perf_counter()
+            simple_judger.score_pitch(pitch_data)
+            scored = time.perf_counter()
+        finally:
+            simple_utils.delete_file(wav_path)
+
+        timings['convert'].append(converted - started)
+        timings['pitch'].append(extracted - converted)
+        timings['score'].append(scored - extracted)
+
+    return {stage: _summary(values) for stage, values in timings.items()}
+
+def concurrency_levels(max_workers=None):
+    """
+    要测量的并发级别：1、2、4……直到CPU核数（包含CPU核数本身）
+
+    参数:
+        max_workers: 最大并发级别，默认为CPU核数
+    """
+    limit = max_workers or os.cpu_count() or 1
+    levels = []
+    level = 1
+    while level < limit:
+        levels.append(level)
+        level *= 2
+    levels.append(limit)
+    return levels
+
+@contextlib.contextmanager
+def _caches_disabled():
+    """
+    校准期间关闭结果缓存、基频轨迹缓存、URL下载缓存、音频指纹索引和特征库
+
+    工作进程从环境变量读取缓存设置；不关闭时第一轮之后测量的只是SQLite缓存命中的速度。
+    """
+    import simple_cache
+    import simple_features
+
+    overrides = {
+        simple_cache.CACHE_MB_ENV: '0',
+        simple_cache.PITCH_CACHE_MB_ENV: '0',
+        simple_cache.URL_CACHE_MB_ENV: '0',
+        simple_cache.FINGERPRINT_MB_ENV: '0',
+        simple_features.FEATURE_STORE_ENV: '0',
+    }
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def measure_throughput(handler, samples, workers, rounds=2):
+    """
+    启动指定数量的工作进程并发分析样本，测量吞吐量和延迟
+
+    参数:
+        handler: 请求处理函数（与服务模式相同，必须可被pickle）
+        samples: WAV文件路径列表
+        workers: 工作进程数量
+        rounds: 每个样本分析的轮数
+
+    返回:
+        {'workers', 'requests', 'seconds', 'throughput', 'latency': 统计, 'errors'}
+    """
+    from simple_pool import WorkerPool
+    import simple_threads
+
+    requests = [
+        {'id': f"{n}-{i}", 'file': sample}
+        for n in range(rounds)
+        for i, sample in enumerate(samples)
+    ]
+    latencies = []
+    errors = 0
+
+    def run(request):
+        started = time.perf_counter()
+        response = pool.submit(request)
+        return time.perf_counter() - started, response
+
+    budget = simple_threads.parse_thread_budget(None, workers)
+    # 工作进程启动和模型加载不计入测量时间
+    with _caches_disabled(), WorkerPool(handler, workers, thread_budget=budget) as pool:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            started = time.perf_counter()
+            for latency, response in executor.map(run, requests):
+                latencies.append(latency)
+                if response.get('status') != 'ok':
+                    errors += 1
+            seconds = time.perf_counter() - started
+
+    return {
+        'workers': workers,
+        'requests': len(requests),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(requests) / seconds, 3) if seconds > 0 else None,
+        'latency': _summary(latencies),
+        'errors': errors,
+    }
+
+def choose_workers(levels):
+    """
+    选择吞吐量最高的并发级别；相差不超过 _THROUGHPUT_TOLERANCE 时选择更少的工作进程
+
+    参数:
+        levels: measure_throughput 的结果列表
+
+    返回:
+        工作进程数量
+    """
+    usable = [level for level in levels if level['throughput'] and not level['errors']]
+    if not usable:
+        return 1
+    best = max(level['throughput'] for level in usable)
+    for level in sorted(usable, key=lambda level: level['workers']):
+        if level['throughput'] >= best * (1 - _THROUGHPUT_TOLERANCE):
+            return level['workers']
+
+def autotune(handler, samples=None, max_workers=None, rounds=2, output=None):
+    """
+    在本机上校准并写出调优配置
+
+    参数:
+        handler: 请求处理函数（与服务模式相同）
+        samples: 样本WAV列表，默认为 find_samples()
+        max_workers: 测量的最大并发级别，默认为CPU核数
+        rounds: 每个并发级别下每个样本分析的轮数
+        output: 配置文件路径，默认为 tuned_config_path()
+
+    返回:
+        调优配置字典
+    """
+    import simple_threads
+
+    samples = samples or find_samples()
+    if not samples:
+        raise RuntimeError(f"没有可用于校准的样本WAV: {conf.wav_dir}")
+
+    log.info(f"开始校准，样本数: {len(samples)}")
+    stages = measure_stages(samples)
+    log.info(f"阶段耗时: {stages}")
+
+    levels = []
+    for workers in concurrency_levels(max_workers):
+        result = measure_throughput(handler, samples, workers, rounds)
+        log.info(f"并发 {workers}: 吞吐量 {result['throughput']}/秒, 延迟 {result['latency']}")
+        levels.append(result)
+
+    workers = choose_workers(levels)
+    chosen = next(level for level in levels if level['workers'] == workers)
+
+    # 流水线模式按阶段耗时的比例分配FFmpeg和Praat的并发数
+    convert = stages['convert']['mean'] or 0
+    pitch = stages['pitch']['mean'] or 0
+    ffmpeg_share = convert / (convert + pitch) if convert + pitch > 0 else 0.5
+
+    tuned = {
+        'version': 1,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': sys.version.split()[0],
+        'samples': len(samples),
+        'stages': stages,
+        'levels': levels,
+        'workers': workers,
+        'thread_budget': simple_threads.parse_thread_budget(None, workers),
+        'job_seconds': chosen['latency']['mean'],
+        'pipeline': {
+            'ffmpeg_concurrency': max(1, round(workers * ffmpeg_share)),
+            'praat_concurrency': workers,
+        },
+    }
+
+    output = output or tuned_config_path()
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(tuned, f, ensure_ascii=False, indent=2)
+    log.info(f"调优配置已写入: {output}（工作进程数 {workers}）")
+
+    global _tuned
+    _tuned = None
+    return tuned
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import json
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import simple_logger
+import simple_model
+import simple_threads
+
+log = simple_logger.get_logger(__name__)
+
+# 目录模式下识别的音频扩展名
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.aac', '.ogg', '.webm', '.flac', '.amr', '.silk')
+
+# 每个工作进程最多同时排队的任务数，避免一次性提交全部条目
+_INFLIGHT_PER_WORKER = 4
+
+def _is_url(text):
+    return text.startswith('http://') or text.startswith('https://')
+
+def _make_item(source, gender=None, item_id=None):
+    """根据路径或URL生成请求字典"""
+    item = {'id': item_id if item_id is not None else source, 'gender': gender}
+    if _is_url(source):
+        item['url'] = source
+    else:
+        item['file'] = source
+    return item
+
+def _parse_manifest_line(line, default_gender):
+    """
+    解析清单文件中的一行
+
+    支持两种格式:
+        JSON对象: {"file"|"url": ..., "gender": 0|1, "id": ...}
+        纯文本:   路径或URL[,性别] （也可以使用制表符分隔）
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    if line.startswith('{'):
+        item = json.loads(line)
+        source = item.get('file') or item.get('url')
+        if not source:
+            raise ValueError(f"清单条目缺少 file 或 url: {line}")
+        gender = item.get('gender', default_gender)
+        return _make_item(source, gender, item.get('id'))
+
+    gender = default_gender
+    for sep in ('\t', ','):
+        if sep in line:
+            source, gender_text = line.rsplit(sep, 1)
+            if gender_text.strip() in ('0', '1'):
+                line = source.strip()
+                gender = int(gender_text)
+            break
+    return _make_item(line, gender)
+
+def collect_items(source, default_gender=None):
+    """
+    收集批量分析的条目
+
+    参数:
+        source: 目录、通配符模式或清单文件路径
+        default_gender: 条目未指定性别时使用的默认性别
+
+    返回:
+        请求字典的生成器
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield _make_item(os.path.join(root, name), default_gender)
+    elif glob.has_magic(source):
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path):
+                yield _make_item(path, default_gender)
+    elif os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    item = _parse_manifest_line(line, default_gender)
+                except Exception as e:
+                    log.error(f"清单第 {line_no} 行解析失败: {str(e)}")
+                    yield {'id': f"line:{line_no}", 'error': f"清单解析失败: {str(e)}"}
+                    continue
+                if item is not None:
+                    yield item
+    else:
+        raise FileNotFoundError(f"批量输入不存在: {source}")
+
+def _init_worker(thread_budget=None, cpu_sets=None, counter=None):
+    """
+    工作进程初始化：标准输出留给结果，日志改写到标准错误，应用线程预算后预先加载模型
+
+    参数:
+        thread_budget: 线程预算字典
+        cpu_sets: 每个工作进程绑定的CPU列表，None为不绑定
+        counter: 进程间共享的计数器，用于给工作进程分配编号
+    """
+    sys.stdout = sys.stderr
+    simple_logger.set_stream(sys.stderr)
+
+    cpus = None
+    if cpu_sets and counter is not None:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        cpus = cpu_sets[index % len(cpu_sets)]
+    if thread_budget:
+        simple_threads.apply_thread_budget(thread_budget, cpus)
+
+    simple_model.ensure_loaded()
+
+def _run_timed(handler, item):
+    """在工作进程中执行请求并记录开始和结束时间"""
+    started_at = time.time()
+    response = handler(item)
+    return response, started_at, time.time()
+
+def run_batch(handler, items, workers=None, output=None, ordered=False, thread_budget=None, pin_cpus=False,
+              journal=None, max_attempts=1):
+    """
+    使用进程池批量分析
+
+    每个工作进程只加载一次模型，结果完成后立即以一行JSON写出；
+    单个条目失败只会记录错误，不会中断整个批次。工作进程崩溃（例如内存不足被杀死）时重建进程池，
+    崩溃时正在处理的条目逐个单独重新执行，只有单独执行时仍然崩溃的条目记录为失败。
+
+    参数:
+        handler: 请求处理函数，接收请求字典，返回响应字典（必须可被pickle）
+        items: 请求字典的可迭代对象
+        workers: 工作进程数量，默认为CPU核数
+        output: 输出流或 simple_sinks.ResultSink（由调用方关闭），默认为标准输出
+        ordered: 是否按输入顺序输出结果
+        thread_budget: 每个工作进程的线程预算，默认按工作进程数平均分配CPU
+        pin_cpus: 是否把每个工作进程绑定到各自的CPU上
+        journal: 记录每个结果的任务表（simple_jobdb.JobStore），None为不记录
+        max_attempts: 有任务表时每个条目最多尝试的次数，失败的条目在本次运行中重新提交，只输出最后一次的结果
+
+    返回:
+        (成功数, 失败数)
+    """
+    # simple_sinks 会导入numpy，不能放在模块顶部：工作进程反序列化 _init_worker 时会导入本模块，此时线程预算还未应用
+    import simple_sinks
+
+    sink = output if isinstance(output, simple_sinks.ResultSink) else simple_sinks.JsonLinesSink(output or sys.stdout)
+    if journal is not None:
+        journal.before_commit = sink.flush
+    workers = workers or os.cpu_count() or 1
+    thread_budget = thread_budget or simple_threads.parse_thread_budget(None, workers)
+    cpu_sets = simple_threads.cpu_sets(workers, max(thread_budget.values())) if pin_cpus else None
+    ctx = multiprocessing.get_context('spawn')
+    max_inflight = workers * _INFLIGHT_PER_WORKER
+    succeeded = failed = 0
+
+    def emit(finished_item):
+        nonlocal succeeded, failed
+        response, started_at, finished_at = finished_item
+        if response.get('status') == 'ok':
+            succeeded += 1
+        else:
+            failed += 1
+        sink.write(response, started_at, finished_at)
+        if journal is not None:
+            journal.record(response, started_at, finished_at)
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=ctx,
+                                   initializer=_init_worker,
+                                   initargs=(thread_budget, cpu_sets, ctx.Value('i', 0)))
+
+    def restart(executor):
+        """某个工作进程崩溃后整个进程池不可用：未完成的条目都成为嫌疑条目，重建进程池"""
+        for seq, item, _ in pending.values():
+            suspects.append((seq, item))
+        pending.clear()
+        log.error(f"工作进程异常退出，重建进程池，{len(suspects)} 个条目将逐个单独重新执行")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return new_executor()
+
+    def submit(seq, item, isolated=False):
+        nonlocal executor
+        try:
+            future = executor.submit(_run_timed, handler, item)
+        except BrokenProcessPool:
+            executor = restart(executor)
+            future = executor.submit(_run_timed, handler, item)
+        pending[future] = (seq, item, isolated)
+
+    items = iter(items)
+    # Future -> (序号, 条目, 是否单独执行)
+    pending = {}
+    # 进程池崩溃时正在处理的条目：无法知道是哪一个导致的崩溃，逐个单独重新执行
+    suspects = deque()
+    finished = {}
+    next_seq = 0
+    emit_seq = 0
+
+    executor = new_executor()
+    try:
+        exhausted = False
+        while True:
+            isolating = suspects or any(isolated for _, _, isolated in pending.values())
+            # 补充任务直到达到排队上限（按序输出时已完成但未输出的条目也计入上限）
+            while not isolating and not exhausted and len(pending) + len(finished) < max_inflight:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                seq = next_seq
+                next_seq += 1
+                if 'error' in item:
+                    finished[seq] = ({'id': item['id'], 'status': 'error', 'error': item['error']}, None, None)
+                    continue
+                if sink.detail:
+                    item = dict(item, detail=True)
+                submit(seq, item)
+            if suspects and not pending:
+                submit(*suspects.popleft(), isolated=True)
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                broken = False
+                again = []
+                for future in done:
+                    seq, item, isolated = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        if not isolated:
+                            suspects.append((seq, item))
+                            continue
+                        log.error(f"条目 {item['id']} 单独执行时工作进程仍然异常退出")
+                        result = ({'id': item['id'], 'status': 'error', 'error': f"工作进程异常退出: {str(e)}"}, None, None)
+                    except Exception as e:
+                        log.error(f"条目 {item['id']} 分析失败: {str(e)}")
+                        result = ({'id': item['id'], 'status': 'error', 'error': str(e)}, None, None)
+                    if (journal is not None and result[0].get('status') != 'ok'
+                            and journal.retry(result[0], max_attempts, result[1], result[2])):
+                        again.append((seq, item, isolated))
+                        continue
+                    finished[seq] = result
+                if broken:
+                    executor = restart(executor)
+                for seq, item, isolated in again:
+                    if isolated:
+                        # 导致崩溃的条目重试时仍然单独执行
+                        suspects.appendleft((seq, item))
+                    else:
+                        submit(seq, item)
+
+            if ordered:
+                while emit_seq in finished:
+                    emit(finished.pop(emit_seq))
+                    emit_seq += 1
+            else:
+                for seq in sorted(finished):
+                    emit(finished.pop(seq))
+
+            if exhausted and not pending and not suspects:
+                break
+    finally:
+        executor.shutdown()
+
+    sink.flush()
+    log.info(f"批量分析完成: 成功 {succeeded} 个，失败 {failed} 个")
+    return succeeded, failed
@@ -0,0 +1,733 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import simple_logger
+import simple_config
+import simple_utils
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 结果格式或打分逻辑变化时递增，旧的缓存条目自动失效
+CACHE_VERSION = 1
+
+# 缓存上限的环境变量（由命令行参数设置，工作进程继承）
+CACHE_MB_ENV = 'VOICE_ANALYZER_CACHE_MB'
+CACHE_ENTRIES_ENV = 'VOICE_ANALYZER_CACHE_ENTRIES'
+PITCH_CACHE_MB_ENV = 'VOICE_ANALYZER_PITCH_CACHE_MB'
+URL_CACHE_MB_ENV = 'VOICE_ANALYZER_URL_CACHE_MB'
+URL_CACHE_TTL_ENV = 'VOICE_ANALYZER_URL_CACHE_TTL'
+FINGERPRINT_MB_ENV = 'VOICE_ANALYZER_FINGERPRINT_MB'
+
+# 默认缓存上限（MB），0为禁用缓存
+DEFAULT_CACHE_MB = 256
+DEFAULT_PITCH_CACHE_MB = 512
+DEFAULT_URL_CACHE_MB = 1024
+DEFAULT_FINGERPRINT_MB = 64
+
+# 下载的音频最多保留多久（秒），超过后重新完整下载；有效期内每次使用前都用条件请求向服务器确认
+DEFAULT_URL_CACHE_TTL = 7 * 24 * 3600
+
+# 每个进程在内存中保留的基频轨迹数
+PITCH_MEMORY_ENTRIES = 32
+
+# 查找近似重复时只比较时长相差不超过该比例（且至少0.5秒以内）的指纹，最多比较的候选数
+FINGERPRINT_DURATION_TOLERANCE = 0.02
+FINGERPRINT_CANDIDATES = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    seed INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS pitch_tracks (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pitch_tracks_accessed ON pitch_tracks (accessed);
+CREATE TABLE IF NOT EXISTS url_entries (
+    key TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS url_entries_accessed ON url_entries (accessed);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    key TEXT PRIMARY KEY,
+    duration REAL NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints (duration);
+CREATE INDEX IF NOT EXISTS fingerprints_accessed ON fingerprints (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_fingerprint = None
+
+def _open(path):
+    """打开缓存数据库（多个进程共享，使用WAL模式）"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _count(conn, name, amount=1):
+    """累加统计计数（在调用方的事务中执行）"""
+    conn.execute(
+        'INSERT INTO counters (name, value) VALUES (?, ?) '
+        'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+        (name, amount)
+    )
+
+def _evict(conn, table, max_bytes, max_entries):
+    """
+    在调用方的事务中淘汰最久未访问的条目，直到满足上限
+
+    返回:
+        被淘汰条目的键列表
+    """
+    if not max_bytes and not max_entries:
+        return []
+    entries, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {table}").fetchone()
+    evicted = []
+    for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY accessed"):
+        if (not max_bytes or total <= max_bytes) and (not max_entries or entries <= max_entries):
+            break
+        evicted.append(key)
+        total -= size
+        entries -= 1
+    if evicted:
+        conn.executemany(f"DELETE FROM {table} WHERE key = ?", [(key,) for key in evicted])
+        log.debug(f"缓存 {table} 淘汰 {len(evicted)} 个条目")
+    return evicted
+
+def library_fingerprint():
+    """
+    当前模型库和分析参数的摘要：模型文件内容、基频范围和缓存版本，任何一项变化时缓存键随之变化
+
+    返回:
+        十六进制摘要字符串
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha1()
+        for file_name in ('voice_model.csv', 'voice_analyzer_mapping.csv'):
+            path = os.path.join(conf.model_dir, file_name)
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            except OSError:
+                # 模型文件不存在时使用内置示例模型
+                digest.update(f"missing:{file_name}".encode('utf-8'))
+        digest.update(json.dumps([CACHE_VERSION, conf.pitch_min, conf.pitch_max]).encode('utf-8'))
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+def cache_key(audio_digest, gender):
+    """
+    由音频内容摘要、性别、模型库和分析参数生成缓存键
+
+    参数:
+        audio_digest: 音频文件内容的摘要
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+
+    返回:
+        缓存键字符串
+    """
+    text = json.dumps([audio_digest, gender, library_fingerprint()])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def pitch_key(audio_digest):
+    """
+    基频轨迹的缓存键：音频内容摘要 + FFmpeg转换参数 + Praat脚本和基频范围（与性别和模型库无关）
+
+    参数:
+        audio_digest: 音频文件内容的摘要
+
+    返回:
+        缓存键字符串
+    """
+    import simple_ffmpeg
+    import simple_praat
+    text = json.dumps([
+        audio_digest, simple_ffmpeg._command, simple_praat._praat_script, conf.pitch_min, conf.pitch_max, CACHE_VERSION
+    ])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def seed_for_key(key):
+    """
+    缓存键对应的随机种子：辅音色的随机选择使用该种子，缓存条目被淘汰后重新分析也得到相同的结果
+
+    参数:
+        key: 缓存键
+
+    返回:
+        整数种子
+    """
+    return int(key[:15], 16)
+
+class ResultCache:
+    def __init__(self, path, max_bytes=0, max_entries=0):
+        """
+        打开（或创建）按内容寻址的分析结果缓存
+
+        多个进程可以共享同一个缓存文件；超过 max_bytes 或 max_entries 时按最近访问时间淘汰。
+
+        参数:
+            path: SQLite数据库文件路径
+            max_bytes: 结果总大小上限（字节），0为不限制
+            max_entries: 条目数上限，0为不限制
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = _open(path)
+
+    def get(self, key):
+        """
+        查找缓存的结果
+
+        参数:
+            key: 缓存键
+
+        返回:
+            (结果字典, 随机种子)，未命中时返回None
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT result, seed FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                _count(self._conn, 'misses')
+                return None
+            self._conn.execute('UPDATE entries SET accessed = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+            _count(self._conn, 'hits')
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, seed, result):
+        """
+        保存分析结果，超过上限时淘汰最久未访问的条目
+
+        参数:
+            key: 缓存键
+            seed: 分析时使用的随机种子
+            result: 结果字典（simple_judger.result_to_dict(result, detail=True)）
+        """
+        text = json.dumps(result, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, seed, result, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, seed, text, size, now, now)
+            )
+            evicted = _evict(self._conn, 'entries', self.max_bytes, self.max_entries)
+            if evicted:
+                _count(self._conn, 'evictions', len(evicted))
+
+    def stats(self):
+        """
+        获取缓存统计（所有共享该缓存文件的进程的累计值）
+
+        返回:
+            {'entries', 'bytes', 'max_bytes', 'max_entries', 'hits', 'misses', 'evictions', 'hit_rate'}
+        """
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+    def clear(self):
+        """删除所有条目和统计"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.execute("DELETE FROM counters WHERE name NOT LIKE 'pitch_%' AND name NOT LIKE 'url_%' "
+                               "AND name NOT LIKE 'fingerprint_%'")
+
+class PitchCache:
+    def __init__(self, path, max_bytes=0, memory_entries=PITCH_MEMORY_ENTRIES):
+        """
+        打开（或创建）基频轨迹缓存
+
+        每条轨迹保存帧时间和基频两列（截取片段时按时间切片，无需重新提取），
+        最近使用的轨迹保存在进程内存中，所有轨迹保存在SQLite中（与结果缓存共用数据库文件），
+        超过 max_bytes 时按最近访问时间淘汰。
+
+        参数:
+            path: SQLite数据库文件路径
+            max_bytes: 磁盘上轨迹总大小上限（字节），0为不限制
+            memory_entries: 内存中保留的轨迹数
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = _open(path)
+
+    def get(self, key):
+        """
+        查找基频轨迹
+
+        参数:
+            key: pitch_key 生成的缓存键
+
+        返回:
+            (帧数, 2) 的float64数组，两列为帧时间和基频，未命中时返回None
+        """
+        with self._lock:
+            track = self._memory.get(key)
+            if track is not None:
+                self._memory.move_to_end(key)
+                return track
+
+            with self._conn:
+                row = self._conn.execute('SELECT data FROM pitch_tracks WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    _count(self._conn, 'pitch_misses')
+                    return None
+                self._conn.execute(
+                    'UPDATE pitch_tracks SET accessed = ?, hits = hits + 1 WHERE key = ?', (time.time(), key)
+                )
+                _count(self._conn, 'pitch_hits')
+            import numpy as np
+            track = np.frombuffer(row[0], dtype=np.float64).reshape(-1, 2)
+            self._remember(key, track)
+            return track
+
+    def put(self, key, track):
+        """
+        保存基频轨迹
+
+        参数:
+            key: pitch_key 生成的缓存键
+            track: (帧数, 2) 的数组，两列为帧时间和基频
+        """
+        import numpy as np
+        track = np.ascontiguousarray(track, dtype=np.float64).reshape(-1, 2)
+        data = track.tobytes()
+        now = time.time()
+        with self._lock:
+            self._remember(key, track)
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO pitch_tracks (key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, data, len(data), now, now)
+                )
+                evicted = _evict(self._conn, 'pitch_tracks', self.max_bytes, 0)
+                if evicted:
+                    _count(self._conn, 'pitch_evictions', len(evicted))
+
+    def _remember(self, key, track):
+        """放入内存，超过条目数时丢弃最久未使用的轨迹"""
+        self._memory[key] = track
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """获取基频轨迹缓存统计"""
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pitch_tracks').fetchone()
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+            memory = len(self._memory)
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'memory_entries': memory,
+            'hits': counters.get('pitch_hits', 0),
+            'misses': counters.get('pitch_misses', 0),
+            'evictions': counters.get('pitch_evictions', 0),
+        }
+
+    def clear(self):
+        """删除所有轨迹和统计"""
+        with self._lock, self._conn:
+            self._memory.clear()
+            self._conn.execute('DELETE FROM pitch_tracks')
+            self._conn.execute("DELETE FROM counters WHERE name LIKE 'pitch_%'")
+
+class FingerprintIndex:
+    def __init__(self, path, max_bytes=0):
+        """
+        打开（或创建）音频指纹索引
+
+        记录每段已分析音频的声学指纹（simple_fingerprint）和内容摘要（与结果缓存共用数据库文件）。
+        重新编码、转码或转发后的副本字节不同、摘要也不同，但指纹几乎相同，
+        通过指纹找到原音频的摘要后即可复用它的结果和基频轨迹。
+
+        参数:
+            path: SQLite数据库文件路径
+            max_bytes: 指纹总大小上限（字节），0为不限制
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = _open(path)
+
+    def find(self, fingerprint, duration, exclude=None):
+        """
+        查找近似重复的音频
+
+        参数:
+            fingerprint: simple_fingerprint.compute 得到的uint32数组
+            duration: 音频时长（秒）
+            exclude: 不参与匹配的摘要（音频自身）
+
+        返回:
+            (原音频的摘要, 比特错误率)，没有匹配时返回None
+        """
+        import numpy as np
+        import simple_fingerprint
+
+        tolerance = max(0.5, duration * FINGERPRINT_DURATION_TOLERANCE)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, data FROM fingerprints WHERE duration BETWEEN ? AND ? AND key != ? '
+                'ORDER BY ABS(duration - ?) LIMIT ?',
+                (duration - tolerance, duration + tolerance, exclude or '', duration, FINGERPRINT_CANDIDATES)
+            ).fetchall()
+
+        best = None
+        for key, data in rows:
+            rate = simple_fingerprint.bit_error_rate(fingerprint, np.frombuffer(data, dtype=np.uint32))
+            if rate <= simple_fingerprint.MATCH_THRESHOLD and (best is None or rate < best[1]):
+                best = (key, rate)
+
+        with self._lock, self._conn:
+            if best is None:
+                _count(self._conn, 'fingerprint_misses')
+            else:
+                self._conn.execute(
+                    'UPDATE fingerprints SET accessed = ?, hits = hits + 1 WHERE key = ?', (time.time(), best[0])
+                )
+                _count(self._conn, 'fingerprint_hits')
+        return best
+
+    def add(self, digest, fingerprint, duration):
+        """
+        记录音频的指纹
+
+        参数:
+            digest: 音频内容摘要
+            fingerprint: uint32数组
+            duration: 音频时长（秒）
+        """
+        import numpy as np
+        data = np.asarray(fingerprint, dtype=np.uint32).tobytes()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO fingerprints (key, duration, data, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (digest, duration, data, len(data), now, now)
+            )
+            evicted = _evict(self._conn, 'fingerprints', self.max_bytes, 0)
+            if evicted:
+                _count(self._conn, 'fingerprint_evictions', len(evicted))
+
+    def stats(self):
+        """获取指纹索引统计"""
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fingerprints').fetchone()
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': counters.get('fingerprint_hits', 0),
+            'misses': counters.get('fingerprint_misses', 0),
+            'evictions': counters.get('fingerprint_evictions', 0),
+        }
+
+    def clear(self):
+        """删除所有指纹和统计"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM fingerprints')
+            self._conn.execute("DELETE FROM counters WHERE name LIKE 'fingerprint_%'")
+
+class UrlCache:
+    def __init__(self, path, directory, max_bytes=0, ttl=DEFAULT_URL_CACHE_TTL):
+        """
+        打开（或创建）URL下载缓存
+
+        下载的音频保存在 directory 中，URL、ETag、Last-Modified 等信息保存在SQLite中（与结果缓存共用数据库文件）。
+        再次下载同一URL时发送条件请求，服务器返回304时直接使用本地保存的音频；
+        内容不变时音频摘要也不变，因此下游的结果缓存和基频轨迹缓存同样会命中。
+
+        参数:
+            path: SQLite数据库文件路径
+            directory: 保存音频的目录
+            max_bytes: 保存的音频总大小上限（字节），0为不限制
+            ttl: 音频最多保留的秒数，超过后重新完整下载
+        """
+        self.path = path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = _open(path)
+        os.makedirs(directory, exist_ok=True)
+
+    def _file_path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    @staticmethod
+    def _link(src, dest):
+        """把缓存的音频放到下载路径（优先使用硬链接，删除下载文件不影响缓存）"""
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    def _lookup(self, url):
+        """查找未过期且文件存在的条目"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT file_name, etag, last_modified, fetched FROM url_entries WHERE key = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        file_name, etag, last_modified, fetched = row
+        if time.time() - fetched > self.ttl or not os.path.exists(self._file_path(file_name)):
+            self._remove([url])
+            return None
+        return file_name, etag, last_modified
+
+    def _remove(self, urls):
+        """删除条目和对应的音频文件"""
+        with self._lock, self._conn:
+            for url in urls:
+                row = self._conn.execute('SELECT file_name FROM url_entries WHERE key = ?', (url,)).fetchone()
+                self._conn.execute('DELETE FROM url_entries WHERE key = ?', (url,))
+                if row is not None:
+                    _unlink(self._file_path(row[0]))
+
+    def download(self, url, save_path):
+        """
+        下载URL到 save_path，优先使用缓存
+
+        参数:
+            url: 音频文件URL
+            save_path: 保存路径
+
+        返回:
+            save_path
+        """
+        entry = self._lookup(url)
+        headers = {}
+        if entry is not None:
+            _, etag, last_modified = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        file_name = hashlib.sha256(url.encode('utf-8')).hexdigest() + os.path.splitext(save_path)[1]
+        tmp_path = self._file_path(f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            status, response_headers = simple_utils.fetch_file(url, tmp_path, headers or None)
+            if status == 304 and entry is None:
+                # 没有发送条件请求却收到304，没有可用的缓存：绕过中间缓存无条件重新下载
+                log.warning(f"未发送条件请求却收到304，重新下载: {url}")
+                status, response_headers = simple_utils.fetch_file(url, tmp_path, {'Cache-Control': 'no-cache'})
+                if status == 304:
+                    raise RuntimeError(f"下载失败，服务器对无条件请求返回304: {url}")
+            if status == 304:
+                try:
+                    self._link(self._file_path(entry[0]), save_path)
+                except FileNotFoundError:
+                    # 刚被其他进程淘汰，去掉条件请求重新下载
+                    self._remove([url])
+                    return self.download(url, save_path)
+                with self._lock, self._conn:
+                    self._conn.execute('UPDATE url_entries SET accessed = ? WHERE key = ?', (time.time(), url))
+                    _count(self._conn, 'url_not_modified')
+                log.info(f"URL未修改，使用缓存的音频: {url}")
+                return save_path
+
+            etag = response_headers.get('ETag')
+            last_modified = response_headers.get('Last-Modified')
+            if not etag and not last_modified:
+                # 服务器不支持条件请求，不缓存
+                os.replace(tmp_path, save_path)
+                with self._lock, self._conn:
+                    _count(self._conn, 'url_uncacheable')
+                return save_path
+
+            os.replace(tmp_path, self._file_path(file_name))
+            self._link(self._file_path(file_name), save_path)
+            now = time.time()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO url_entries (key, file_name, etag, last_modified, size, fetched, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, file_name, etag, last_modified, os.path.getsize(self._file_path(file_name)), now, now)
+                )
+                _count(self._conn, 'url_downloads')
+            self._evict(now)
+            return save_path
+        finally:
+            _unlink(tmp_path)
+
+    def _evict(self, now):
+        """删除过期的条目，再按最近使用时间淘汰超过大小上限的条目（连同音频文件）"""
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                'SELECT key FROM url_entries WHERE fetched < ?', (now - self.ttl,)
+            )]
+        self._remove(expired)
+        with self._lock, self._conn:
+            names = dict(self._conn.execute('SELECT key, file_name FROM url_entries'))
+            evicted = _evict(self._conn, 'url_entries', self.max_bytes, 0)
+            if evicted:
+                _count(self._conn, 'url_evictions', len(evicted))
+        for key in evicted:
+            _unlink(self._file_path(names[key]))
+
+    def stats(self):
+        """获取URL下载缓存统计"""
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM url_entries').fetchone()
+            counters = dict(self._conn.execute('SELECT name, value FROM counters'))
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'downloads': counters.get('url_downloads', 0),
+            'not_modified': counters.get('url_not_modified', 0),
+            'uncacheable': counters.get('url_uncacheable', 0),
+            'evictions': counters.get('url_evictions', 0),
+        }
+
+    def clear(self):
+        """删除所有条目、音频文件和统计"""
+        with self._lock:
+            urls = [row[0] for row in self._conn.execute('SELECT key FROM url_entries')]
+        self._remove(urls)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM counters WHERE name LIKE 'url_%'")
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+@simple_utils.per_process
+def get_cache():
+    """
+    获取本进程的结果缓存（首次调用时按环境变量中的上限打开）
+
+    返回:
+        ResultCache 对象，缓存被禁用（VOICE_ANALYZER_CACHE_MB=0）或无法打开时返回None
+    """
+    max_mb = float(os.environ.get(CACHE_MB_ENV, DEFAULT_CACHE_MB))
+    if max_mb <= 0:
+        return None
+    try:
+        return ResultCache(
+            os.path.join(conf.temp_dir, 'result_cache.db'),
+            int(max_mb * 1024 * 1024),
+            int(os.environ.get(CACHE_ENTRIES_ENV, 0))
+        )
+    except sqlite3.Error as e:
+        log.warning(f"结果缓存无法打开，不使用缓存: {str(e)}")
+        return None
+
+@simple_utils.per_process
+def get_pitch_cache():
+    """
+    获取本进程的基频轨迹缓存
+
+    返回:
+        PitchCache 对象，被禁用（VOICE_ANALYZER_PITCH_CACHE_MB=0）或无法打开时返回None
+    """
+    max_mb = float(os.environ.get(PITCH_CACHE_MB_ENV, DEFAULT_PITCH_CACHE_MB))
+    if max_mb <= 0:
+        return None
+    try:
+        return PitchCache(os.path.join(conf.temp_dir, 'result_cache.db'), int(max_mb * 1024 * 1024))
+    except sqlite3.Error as e:
+        log.warning(f"基频轨迹缓存无法打开，不使用缓存: {str(e)}")
+        return None
+
+@simple_utils.per_process
+def get_url_cache():
+    """
+    获取本进程的URL下载缓存
+
+    返回:
+        UrlCache 对象，被禁用（VOICE_ANALYZER_URL_CACHE_MB=0）或无法打开时返回None
+    """
+    max_mb = float(os.environ.get(URL_CACHE_MB_ENV, DEFAULT_URL_CACHE_MB))
+    if max_mb <= 0:
+        return None
+    try:
+        return UrlCache(
+            os.path.join(conf.temp_dir, 'result_cache.db'),
+            os.path.join(conf.temp_dir, 'url_cache'),
+            int(max_mb * 1024 * 1024),
+            float(os.environ.get(URL_CACHE_TTL_ENV, DEFAULT_URL_CACHE_TTL))
+        )
+    except (sqlite3.Error, OSError) as e:
+        log.warning(f"URL下载缓存无法打开，不使用缓存: {str(e)}")
+        return None
+
+@simple_utils.per_process
+def get_fingerprint_index():
+    """
+    获取本进程的音频指纹索引
+
+    返回:
+        FingerprintIndex 对象，被禁用（VOICE_ANALYZER_FINGERPRINT_MB=0）或无法打开时返回None
+    """
+    max_mb = float(os.environ.get(FINGERPRINT_MB_ENV, DEFAULT_FINGERPRINT_MB))
+    if max_mb <= 0:
+        return None
+    try:
+        return FingerprintIndex(os.path.join(conf.temp_dir, 'result_cache.db'), int(max_mb * 1024 * 1024))
+    except sqlite3.Error as e:
+        log.warning(f"音频指纹索引无法打开，不使用指纹: {str(e)}")
+        return None
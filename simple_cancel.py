@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import threading
+import subprocess
+import contextlib
+import contextvars
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+class AnalysisCancelled(BaseException):
+    """
+    分析被取消
+
+    与 KeyboardInterrupt、asyncio.CancelledError 一样继承自 BaseException，
+    保证各处用于兜底的 except Exception 不会把取消当作普通错误吞掉。
+    """
+
+class CancelToken:
+    def __init__(self):
+        """
+        初始化取消令牌
+
+        分析过程中启动的FFmpeg/Praat子进程和生成的临时文件都登记在令牌上，
+        取消时立即终止整个子进程组，并在分析退出后删除未完成的临时文件。
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._paths = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        """是否已被取消"""
+        return self._event.is_set()
+
+    def cancel(self, reason='已取消'):
+        """
+        取消分析：终止所有登记的子进程组
+
+        参数:
+            reason: 取消原因
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            processes = list(self._processes)
+
+        log.warning(f"取消分析: {reason}")
+        for process in processes:
+            kill_process_group(process)
+
+    def check(self):
+        """已被取消时抛出 AnalysisCancelled"""
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+
+    def add_process(self, process):
+        """登记子进程（如果已被取消则立即终止）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._processes.add(process)
+                return
+        kill_process_group(process)
+
+    def remove_process(self, process):
+        """取消登记子进程"""
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_path(self, path):
+        """登记分析过程中生成的临时文件"""
+        with self._lock:
+            self._paths.append(path)
+
+    def cleanup(self):
+        """删除登记的临时文件"""
+        from simple_utils import delete_file
+
+        with self._lock:
+            paths, self._paths = self._paths, []
+        for path in paths:
+            delete_file(path)
+
+_current = contextvars.ContextVar('simple_cancel_token', default=None)
+
+# 为True时FFmpeg/Praat留在调用方的进程组中，不再各自创建进程组
+_shared_group = False
+
+def share_process_group():
+    """
+    之后启动的子进程留在当前进程组中（fork模式的子进程自己是进程组长，
+    主进程超时或子进程退出后终止整个进程组，FFmpeg/Praat不会成为孤儿进程）
+    """
+    global _shared_group
+    _shared_group = True
+
+def current():
+    """获取当前上下文的取消令牌，没有时返回None"""
+    return _current.get()
+
+@contextlib.contextmanager
+def scope(token):
+    """
+    在当前上下文中启用取消令牌
+
+    参数:
+        token: CancelToken对象
+    """
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+def check():
+    """当前上下文的分析已被取消时抛出 AnalysisCancelled"""
+    token = current()
+    if token is not None:
+        token.check()
+
+def track_path(path):
+    """登记临时文件，分析被取消时删除"""
+    token = current()
+    if token is not None:
+        token.add_path(path)
+    return path
+
+def kill_process_group(process):
+    """
+    终止子进程及其整个进程组（shell=True 时包括shell启动的实际程序）
+
+    参数:
+        process: subprocess.Popen对象
+    """
+    try:
+        if os.name == 'nt':
+            subprocess.run(
+                ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        elif _shared_group:
+            # 子进程不是进程组长，只能终止它本身；shell启动的程序在调用方退出后随进程组一起终止
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    except Exception as e:
+        log.error(f"终止子进程 {process.pid} 失败: {str(e)}")
+        process.kill()
+
+def run_process(args, shell=False, universal_newlines=False):
+    """
+    在独立的进程组中运行子进程（调用过 share_process_group 时留在当前进程组中），并登记到当前的取消令牌
+
+    参数:
+        args: 命令（shell=True 时为字符串）
+        shell: 是否通过shell执行
+        universal_newlines: 是否以文本方式读取输出
+
+    返回:
+        (返回码, 标准输出, 标准错误)
+    """
+    check()
+
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    elif not _shared_group:
+        kwargs['start_new_session'] = True
+
+    process = subprocess.Popen(
+        args,
+        shell=shell,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=universal_newlines,
+        **kwargs
+    )
+
+    token = current()
+    if token is not None:
+        token.add_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    except BaseException:
+        # 被信号或取消打断时不留下孤儿进程
+        kill_process_group(process)
+        process.wait()
+        raise
+    finally:
+        if token is not None:
+            token.remove_process(process)
+
+    check()
+    return process.returncode, stdout, stderr
+
+def install_signal_handlers(token, raise_now=True, signals=None):
+    """
+    收到 SIGTERM/SIGINT 时取消分析
+
+    参数:
+        token: CancelToken对象
+        raise_now: 是否在信号处理函数中直接抛出 AnalysisCancelled（分析在主线程中运行时使用）
+        signals: 要处理的信号列表，默认为 SIGINT 和 SIGTERM
+    """
+    def handler(signum, frame):
+        # 只在第一次收到信号时打断当前代码，避免打断取消后的清理过程
+        first = not token.cancelled
+        token.cancel(f"收到信号 {signum}")
+        if raise_now and first:
+            raise AnalysisCancelled(token.reason)
+
+    if signals is None:
+        signals = [signal.SIGINT]
+        if hasattr(signal, 'SIGTERM'):
+            signals.append(signal.SIGTERM)
+    for signum in signals:
+        signal.signal(signum, handler)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+
+def encode_frame(message):
+    """
+    将消息编码为一帧（一行紧凑的UTF-8 JSON）
+
+    参数:
+        message: 消息字典
+
+    返回:
+        以换行结尾的JSON字符串
+    """
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+class ResultChannel:
+    def __init__(self, stream):
+        """
+        初始化结果通道
+
+        结果通道只承载分帧的JSON消息，每帧一行，日志一律不写入这里，
+        调用方可以逐行解析而无需在日志文本中查找JSON。
+
+        参数:
+            stream: 文本输出流
+        """
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_fd(cls, fd):
+        """
+        基于已打开的文件描述符创建结果通道（例如父进程传入的第3个管道）
+
+        参数:
+            fd: 文件描述符
+        """
+        return cls(os.fdopen(fd, 'w', encoding='utf-8', newline='\n'))
+
+    def send(self, message):
+        """
+        发送一帧消息
+
+        参数:
+            message: 消息字典
+        """
+        frame = encode_frame(message)
+        with self._lock:
+            self._stream.write(frame)
+            self._stream.flush()
+
+    def send_result(self, result_dict):
+        """发送分析结果帧"""
+        self.send({'type': 'result', 'result': result_dict})
+
+    def send_error(self, error):
+        """发送错误帧"""
+        self.send({'type': 'error', 'error': error})
+
+    def close(self):
+        """关闭结果通道"""
+        try:
+            self._stream.close()
+        except Exception:
+            pass
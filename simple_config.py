@@ -3,6 +3,7 @@
 
 import os
 import sys
+import threading
 
 class Config:
     def __init__(self):
@@ -10,11 +11,11 @@ class Config:
         if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
             # PyInstaller打包后的路径
             self.base_dir = sys._MEIPASS
-            print(f"运行在PyInstaller打包环境中，基础目录: {self.base_dir}")
+            print(f"运行在PyInstaller打包环境中，基础目录: {self.base_dir}", file=sys.stderr)
         else:
             # 正常运行环境
             self.base_dir = os.path.dirname(os.path.abspath(__file__))
-            print(f"运行在正常环境中，基础目录: {self.base_dir}")
+            print(f"运行在正常环境中，基础目录: {self.base_dir}", file=sys.stderr)
         
         # 基本路径配置
         self.temp_dir = os.path.join(self.base_dir, "temp")
@@ -29,7 +30,7 @@ class Config:
                 try:
                     os.makedirs(dir_path)
                 except Exception as e:
-                    print(f"警告: 无法创建目录 {dir_path}: {str(e)}")
+                    print(f"警告: 无法创建目录 {dir_path}: {str(e)}", file=sys.stderr)
                     # 如果在打包环境中无法创建目录，使用临时目录
                     if getattr(sys, 'frozen', False):
                         import tempfile
@@ -46,9 +47,9 @@ class Config:
                         break
         
         # 打印路径信息，便于调试
-        print(f"模型目录: {self.model_dir}")
-        print(f"临时目录: {self.temp_dir}")
-        print(f"WAV目录: {self.wav_dir}")
+        print(f"模型目录: {self.model_dir}", file=sys.stderr)
+        print(f"临时目录: {self.temp_dir}", file=sys.stderr)
+        print(f"WAV目录: {self.wav_dir}", file=sys.stderr)
         
         # Praat配置 - Windows系统下的默认安装路径
         if os.name == 'nt':  # Windows系统
@@ -71,12 +72,12 @@ class Config:
             for path in possible_paths:
                 if os.path.exists(path):
                     self.praat_path = path
-                    print(f"找到Praat路径: {self.praat_path}")
+                    print(f"找到Praat路径: {self.praat_path}", file=sys.stderr)
                     break
             else:
                 # 如果都不存在，使用默认值
                 self.praat_path = os.path.join(self.base_dir, "praat", "Praat.exe")
-                print(f"警告: 未找到Praat可执行文件，将使用默认路径: {self.praat_path}")
+                print(f"警告: 未找到Praat可执行文件，将使用默认路径: {self.praat_path}", file=sys.stderr)
         else:
             self.praat_path = "praat"  # 非Windows系统
         
@@ -87,10 +88,31 @@ class Config:
         self.pitch_min = 80
         self.pitch_max = 500
 
+class _LazyConfig:
+    """
+    配置的延迟加载代理
+    
+    模块导入时只拿到这个代理，第一次访问配置项时才创建 Config（创建目录、查找Praat），
+    保证导入任何 simple_* 模块都没有副作用。
+    """
+    def __getattr__(self, name):
+        return getattr(load_config(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(load_config(), name, value)
+
 _config = None
+_config_lock = threading.Lock()
+_lazy_config = _LazyConfig()
 
-def get_config():
+def load_config():
+    """立即创建并返回配置对象（多个线程同时首次访问时只创建一次）"""
     global _config
     if _config is None:
-        _config = Config()
-    return _config 
\ No newline at end of file
+        with _config_lock:
+            if _config is None:
+                _config = Config()
+    return _config
+
+def get_config():
+    return _lazy_config 
\ No newline at end of file
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+import simple_logger
+import simple_config
+import simple_utils
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 特征库路径的环境变量（由命令行参数设置，工作进程继承），值为0时不记录特征
+FEATURE_STORE_ENV = 'VOICE_ANALYZER_FEATURE_STORE'
+
+# 直方图的计算方式变化时递增，旧特征库需要重新建立
+FEATURE_VERSION = 1
+
+# 重新打分时每次从特征库读取的录音数
+RESCORE_CHUNK_ROWS = 20000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    key TEXT PRIMARY KEY,
+    gender INTEGER,
+    frames INTEGER NOT NULL,
+    histogram BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def histogram_bins():
+    """直方图覆盖的基频值（Hz，取整后的 pitch_min 到 pitch_max）"""
+    return np.arange(conf.pitch_min, conf.pitch_max + 1)
+
+def pitch_histogram(pitch_data):
+    """
+    计算基频分布直方图，与 simple_sound.get_pitch_percentage 的百分比相同，按基频值排成定长向量
+
+    参数:
+        pitch_data: 包含 pitch 列的DataFrame
+
+    返回:
+        float32数组，第i个元素为基频 pitch_min+i 所占的比例；没有有效基频时返回None
+    """
+    pitch = pitch_data['pitch'].to_numpy(dtype=float)
+    pitch = pitch[~np.isnan(pitch)].astype(int)
+    if len(pitch) == 0:
+        return None
+    # Praat按 pitch_min/pitch_max 提取基频，超出范围的值只计入总数（与模型比较时只有双方都有同一个超出范围的值才会影响得分）
+    offsets = pitch - conf.pitch_min
+    offsets = offsets[(offsets >= 0) & (offsets < len(histogram_bins()))]
+    counts = np.bincount(offsets, minlength=len(histogram_bins()))
+    return (counts / len(pitch)).astype(np.float32)
+
+def model_matrix(models):
+    """
+    把模型的基频分布排成矩阵
+
+    参数:
+        models: VoiceModel列表
+
+    返回:
+        (模型数, 直方图长度) 的float64数组
+    """
+    bins = histogram_bins()
+    matrix = np.zeros((len(models), len(bins)))
+    for i, model in enumerate(models):
+        percentage = model.pitch_percentage
+        ids = percentage['id'].to_numpy(dtype=int) - conf.pitch_min
+        inside = (ids >= 0) & (ids < len(bins))
+        matrix[i, ids[inside]] = percentage['percentage_cnt'].to_numpy(dtype=float)[inside]
+    return matrix
+
+def similarities(histograms, matrix):
+    """
+    一次计算多段录音与多个模型的相似度（与 simple_sound.compare_pitch_similarity 相同：分布乘积之和，限制在0到1之间）
+
+    参数:
+        histograms: (录音数, 直方图长度) 的数组
+        matrix: model_matrix 得到的模型矩阵
+
+    返回:
+        (录音数, 模型数) 的相似度矩阵
+    """
+    return np.clip(np.asarray(histograms, dtype=np.float64) @ matrix.T, 0.0, 1.0)
+
+class FeatureStore:
+    def __init__(self, path):
+        """
+        打开（或创建）特征库
+
+        每段分析过的录音按内容摘要保存一行：基频分布直方图（float32字节）、帧数和最近一次请求的性别。
+        更换或试验新的模型库时用 rescore 对全部直方图一次性重新打分，无需重新处理音频。
+
+        参数:
+            path: SQLite数据库文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._check_meta()
+
+    def _check_meta(self):
+        """直方图长度和计算方式必须与特征库一致，否则不同录音的直方图无法放在一起比较"""
+        expected = {'version': str(FEATURE_VERSION), 'pitch_min': str(conf.pitch_min), 'pitch_max': str(conf.pitch_max)}
+        with self._conn:
+            stored = dict(self._conn.execute('SELECT name, value FROM meta'))
+            if not stored:
+                self._conn.executemany('INSERT INTO meta (name, value) VALUES (?, ?)', expected.items())
+                return
+        if stored != expected:
+            raise ValueError(f"特征库 {self.path} 的参数 {stored} 与当前配置 {expected} 不同")
+
+    def put(self, key, histogram, frames, gender=None):
+        """
+        保存一段录音的直方图
+
+        参数:
+            key: 音频内容摘要
+            histogram: pitch_histogram 得到的向量
+            frames: 有效基频的帧数
+            gender: 请求的性别
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO features (key, gender, frames, histogram, updated) VALUES (?, ?, ?, ?, ?)',
+                (key, gender, frames, np.asarray(histogram, dtype=np.float32).tobytes(), time.time())
+            )
+
+    def count(self):
+        """特征库中的录音数"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM features').fetchone()[0]
+
+    def iter_chunks(self, chunk_rows=RESCORE_CHUNK_ROWS):
+        """
+        按块读取全部直方图
+
+        返回:
+            (摘要列表, 性别数组（未指定为-1）, (行数, 直方图长度) 的float32数组) 的生成器
+        """
+        dims = len(histogram_bins())
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT rowid, key, gender, histogram FROM features WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last, chunk_rows)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            keys = [row[1] for row in rows]
+            genders = np.array([-1 if row[2] is None else row[2] for row in rows], dtype=np.int8)
+            histograms = np.frombuffer(b''.join(row[3] for row in rows), dtype=np.float32).reshape(len(rows), dims)
+            yield keys, genders, histograms
+
+    def close(self):
+        self._conn.close()
+
+def _main_models(scores, genders, models):
+    """
+    按每段录音的性别在对应的模型中选出相似度最高的模型
+
+    返回:
+        (模型下标数组（没有可选模型时为-1）, 相似度数组)
+    """
+    model_genders = np.array([int(model.gender) for model in models])
+    # 性别未指定时与全部模型比较，否则只与同性别的模型比较
+    allowed = (genders[:, None] < 0) | (genders[:, None] == model_genders[None, :])
+    masked = np.where(allowed, scores, -1.0)
+    best = masked.argmax(axis=1)
+    best_scores = masked[np.arange(len(best)), best]
+    best[best_scores < 0] = -1
+    return best, best_scores
+
+def rescore(store, models, baseline=None, output=None, chunk_rows=RESCORE_CHUNK_ROWS):
+    """
+    用模型库对特征库中的全部录音重新打分（每块一次矩阵乘法）
+
+    参数:
+        store: FeatureStore 对象
+        models: 新模型库的VoiceModel列表
+        baseline: 对比的模型库（通常是当前使用的模型库），None为不对比
+        output: 每段录音一行JSON的输出流，None为只统计
+        chunk_rows: 每块的录音数
+
+    返回:
+        统计字典：录音数、主音色改变的录音数、每个主音色的录音数和耗时
+    """
+    started = time.monotonic()
+    matrix = model_matrix(models)
+    baseline_matrix = model_matrix(baseline) if baseline else None
+    # 按名称对比主音色（下标-1对应末尾的None）
+    names = np.array([model.name for model in models] + [None], dtype=object)
+    if baseline:
+        baseline_names = np.array([model.name for model in baseline] + [None], dtype=object)
+    total = changed = 0
+    main_counts = {}
+
+    for keys, genders, histograms in store.iter_chunks(chunk_rows):
+        best, best_scores = _main_models(similarities(histograms, matrix), genders, models)
+        if baseline_matrix is not None:
+            previous, _ = _main_models(similarities(histograms, baseline_matrix), genders, baseline)
+
+        for index, count in zip(*np.unique(best, return_counts=True)):
+            main_counts[names[index]] = main_counts.get(names[index], 0) + int(count)
+        if baseline_matrix is not None:
+            moved = names[best] != baseline_names[previous]
+            changed += int(moved.sum())
+
+        if output is not None:
+            lines = []
+            for i, key in enumerate(keys):
+                row = {'id': key, 'gender': None if genders[i] < 0 else int(genders[i]), 'main': None}
+                if best[i] >= 0:
+                    model = models[best[i]]
+                    row['main'] = {'id': model.id, 'name': model.name, 'score': round(float(best_scores[i]), 6)}
+                if baseline_matrix is not None:
+                    row['baseline'] = baseline[previous[i]].name if previous[i] >= 0 else None
+                    row['changed'] = bool(moved[i])
+                lines.append(json.dumps(row, ensure_ascii=False))
+            output.write('\n'.join(lines) + '\n')
+        total += len(keys)
+        log.info(f"已重新打分 {total} 段录音")
+
+    summary = {
+        'recordings': total,
+        'models': len(models),
+        'main_counts': main_counts,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    if baseline_matrix is not None:
+        summary['changed'] = changed
+    return summary
+
+@simple_utils.per_process
+def get_feature_store():
+    """
+    获取本进程的特征库（路径取自环境变量，默认为 temp/features.db）
+
+    返回:
+        FeatureStore 对象，被禁用（VOICE_ANALYZER_FEATURE_STORE=0）或无法打开时返回None
+    """
+    path = os.environ.get(FEATURE_STORE_ENV) or os.path.join(conf.temp_dir, 'features.db')
+    if path == '0':
+        return None
+    try:
+        return FeatureStore(path)
+    except (sqlite3.Error, ValueError) as e:
+        log.warning(f"特征库无法打开，不记录特征: {str(e)}")
+        return None
@@ -4,6 +4,7 @@
 import subprocess
 import simple_config
 import simple_logger
+import simple_cancel
 import os
 import sys
 
@@ -86,6 +87,22 @@ def get_ffmpeg_path():
     
     return 'ffmpeg'
 
+def command_args(src, dest):
+    """
+    生成不经过shell执行的FFmpeg命令参数列表（参数与 _command 相同）
+    
+    参数:
+        src: 源文件路径
+        dest: 目标文件路径
+    
+    返回:
+        命令参数列表
+    """
+    return [
+        get_ffmpeg_path(), '-v', 'error', '-vn', '-y', '-i', src,
+        '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '1', '-f', 'wav', dest
+    ]
+
 def execute_ffmpeg_command(command):
     """执行 FFmpeg 命令"""
     # 获取 FFmpeg 路径
@@ -104,18 +121,15 @@ def execute_ffmpeg_command(command):
     log.info(f"执行FFmpeg命令: {command}")
     
     try:
-        # 使用 subprocess.Popen 获取更详细的错误信息
-        process = subprocess.Popen(
-            command, 
-            shell=True, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
+        # FFmpeg在独立的进程组中运行，分析被取消时连同shell一起终止
+        returncode, stdout, stderr = simple_cancel.run_process(
+            command,
+            shell=True,
             universal_newlines=True
         )
-        stdout, stderr = process.communicate()
         
-        if process.returncode != 0:
-            log.error(f"FFmpeg 执行失败，返回码: {process.returncode}")
+        if returncode != 0:
+            log.error(f"FFmpeg 执行失败，返回码: {returncode}")
             log.error(f"错误输出: {stderr}")
             return False
         
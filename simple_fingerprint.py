@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import wave
+import numpy as np
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+# 指纹使用的采样率：转换后的WAV按整数倍降采样到约5.5kHz
+FINGERPRINT_RATE = 5512
+
+# 每帧的样本数和帧移（约0.37秒的窗口，每0.023秒一个子指纹；帧间重叠大，起点错开半个帧移时指纹变化也不大）
+FRAME_SIZE = 2048
+HOP_SIZE = 128
+
+# 300Hz到2000Hz之间按对数划分33个频带，相邻频带的能量差得到32位的子指纹
+BAND_EDGES = np.geomspace(300.0, 2000.0, 34)
+
+# 比较两个指纹时允许的最大帧偏移（不同编码器在开头补的静音长度不同）
+MAX_OFFSET = 8
+
+# 比特错误率不超过该值时视为同一段音频（重新编码的副本通常在0.1左右，不同录音约为0.5）
+MATCH_THRESHOLD = 0.2
+
+# 帧数太少的音频不计算指纹（误判的概率太高）
+MIN_FRAMES = 64
+
+# 只对开头这么多秒计算指纹（内存和耗时与时长无关；重新编码的副本开头相同，足以区分不同录音）
+MAX_SECONDS = 120
+
+# 每次计算频谱的帧数（每块约8MB的中间数组，峰值内存不随音频时长增长）
+BLOCK_FRAMES = 256
+
+# 0到255每个字节中为1的位数
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def read_pcm(wav_path, max_seconds=None):
+    """
+    读取 simple_ffmpeg.convert 生成的16位PCM WAV
+
+    参数:
+        wav_path: WAV文件路径
+        max_seconds: 最多读取的秒数，None为全部读取
+
+    返回:
+        (单声道float32样本, 采样率, 整个文件的时长秒数)
+    """
+    with wave.open(wav_path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"只支持16位PCM WAV: {wav_path}")
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        total = f.getnframes()
+        count = total if max_seconds is None else min(total, int(max_seconds * rate))
+        samples = np.frombuffer(f.readframes(count), dtype='<i2').astype(np.float32)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate, total / rate if rate else 0.0
+
+def compute(samples, rate):
+    """
+    计算音频指纹
+
+    参照 Haitsma-Kalker 的方法：每帧在33个对数频带上求能量，
+    相邻频带能量差在时间上的变化取符号，得到每帧一个32位整数。
+    只依赖频谱的相对形状，对码率、重新编码和音量变化不敏感。
+
+    参数:
+        samples: 单声道样本
+        rate: 采样率
+
+    返回:
+        uint32数组（每帧一个子指纹），音频太短时返回None
+    """
+    factor = max(1, int(round(rate / FINGERPRINT_RATE)))
+    if factor > 1:
+        samples = samples[:len(samples) - len(samples) % factor].reshape(-1, factor).mean(axis=1)
+    rate = rate / factor
+
+    frames = 1 + (len(samples) - FRAME_SIZE) // HOP_SIZE if len(samples) >= FRAME_SIZE else 0
+    if frames < MIN_FRAMES + 1:
+        return None
+    window = np.hanning(FRAME_SIZE)
+    bins = np.searchsorted(np.fft.rfftfreq(FRAME_SIZE, 1.0 / rate), BAND_EDGES)
+    energy = np.empty((frames, len(BAND_EDGES) - 1))
+    offsets = np.arange(FRAME_SIZE)[None, :]
+    # 分块计算频谱，只保留每帧各频带的能量
+    for start in range(0, frames, BLOCK_FRAMES):
+        stop = min(start + BLOCK_FRAMES, frames)
+        index = offsets + HOP_SIZE * np.arange(start, stop)[:, None]
+        spectrum = np.abs(np.fft.rfft(samples[index] * window, axis=1)) ** 2
+        energy[start:stop] = np.add.reduceat(spectrum, bins[:-1], axis=1)[:, :len(BAND_EDGES) - 1]
+    diff = np.diff(energy, axis=1)
+    bits = (diff[1:] - diff[:-1]) > 0
+    weights = (1 << np.arange(31, -1, -1, dtype=np.uint64))
+    return (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+def fingerprint_file(wav_path):
+    """
+    计算WAV文件的指纹
+
+    只读取开头 MAX_SECONDS 秒计算指纹，时长仍为整个文件的时长
+
+    返回:
+        (uint32数组, 时长秒数)，音频太短时指纹为None
+    """
+    samples, rate, duration = read_pcm(wav_path, MAX_SECONDS)
+    return compute(samples, rate), duration
+
+def bit_error_rate(a, b, max_offset=MAX_OFFSET):
+    """
+    两个指纹在允许的帧偏移范围内的最小比特错误率
+
+    参数:
+        a, b: uint32数组
+        max_offset: 最大帧偏移
+
+    返回:
+        0到1之间的比特错误率
+    """
+    best = 1.0
+    for offset in range(-max_offset, max_offset + 1):
+        x = a[offset:] if offset > 0 else a
+        y = b[-offset:] if offset < 0 else b
+        length = min(len(x), len(y))
+        if length < MIN_FRAMES:
+            continue
+        errors = _POPCOUNT[np.bitwise_xor(x[:length], y[:length]).view(np.uint8)].sum()
+        best = min(best, errors / (32.0 * length))
+    return best
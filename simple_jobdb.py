@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import sqlite3
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+# 条目状态
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# 结果累积多少条或多少秒后在一个事务中提交
+DEFAULT_COMMIT_EVERY = 200
+DEFAULT_COMMIT_SECONDS = 5.0
+
+# 读取待处理条目时每页的条数
+_PAGE_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    input TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    queued_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+class JobStore:
+    def __init__(self, path, commit_every=DEFAULT_COMMIT_EVERY, commit_seconds=DEFAULT_COMMIT_SECONDS):
+        """
+        打开（或创建）批量任务的SQLite任务表
+
+        每个条目记录输入、状态、尝试次数、结果和耗时；结果先在内存中累积，
+        每 commit_every 条或 commit_seconds 秒在一个事务中批量提交。
+        进程崩溃时最多丢失最后一批未提交的结果，这些条目在重新运行时会被再次分析。
+
+        参数:
+            path: 数据库文件路径
+            commit_every: 每批提交的结果数
+            commit_seconds: 两次提交之间的最长间隔（秒）
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_seconds = commit_seconds
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._buffer = []
+        self._last_commit = time.monotonic()
+        # 提交前调用的函数：结果输出有缓存时先写出输出，保证任务表中完成的条目在输出中一定存在
+        self.before_commit = None
+
+    def add(self, items):
+        """
+        加入条目（ID已存在的条目保持原状态，因此可以用相同的输入重复执行）
+
+        参数:
+            items: 请求字典的可迭代对象
+
+        返回:
+            新加入的条目数
+        """
+        now = time.time()
+        before = self._conn.total_changes
+        rows = []
+        with self._conn:
+            for item in items:
+                rows.append((str(item['id']), json.dumps(item, ensure_ascii=False), now))
+                if len(rows) >= _PAGE_SIZE:
+                    self._conn.executemany('INSERT OR IGNORE INTO jobs (id, input, queued_at) VALUES (?, ?, ?)', rows)
+                    rows = []
+            if rows:
+                self._conn.executemany('INSERT OR IGNORE INTO jobs (id, input, queued_at) VALUES (?, ?, ?)', rows)
+        added = self._conn.total_changes - before
+        log.info(f"任务表 {self.path} 新加入 {added} 个条目")
+        return added
+
+    def requeue_failed(self, max_attempts):
+        """
+        把尝试次数未达上限的失败条目重新设为待处理
+
+        参数:
+            max_attempts: 每个条目最多尝试的次数
+
+        返回:
+            重新排队的条目数
+        """
+        with self._conn:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ? WHERE status = ? AND attempts < ?', (PENDING, FAILED, max_attempts)
+            )
+        if cursor.rowcount:
+            log.info(f"重试 {cursor.rowcount} 个失败的条目")
+        return cursor.rowcount
+
+    def pending_items(self):
+        """
+        按加入顺序逐页读取待处理的条目
+
+        返回:
+            请求字典的生成器
+        """
+        last_seq = 0
+        while True:
+            rows = self._conn.execute(
+                'SELECT seq, input FROM jobs WHERE status = ? AND seq > ? ORDER BY seq LIMIT ?',
+                (PENDING, last_seq, _PAGE_SIZE)
+            ).fetchall()
+            if not rows:
+                return
+            for seq, text in rows:
+                last_seq = seq
+                yield json.loads(text)
+
+    def record(self, response, started_at=None, finished_at=None):
+        """
+        记录一个条目的结果（累积到一定数量后批量提交）
+
+        参数:
+            response: 响应字典
+            started_at: 开始分析的时间戳
+            finished_at: 分析完成的时间戳
+        """
+        ok = response.get('status') == 'ok'
+        seconds = finished_at - started_at if started_at is not None and finished_at is not None else None
+        self._buffer.append((
+            DONE if ok else FAILED,
+            json.dumps(response, ensure_ascii=False) if ok else None,
+            None if ok else response.get('error'),
+            started_at,
+            finished_at,
+            seconds,
+            str(response.get('id')),
+        ))
+        if len(self._buffer) >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_seconds:
+            self.flush()
+
+    def retry(self, response, max_attempts, started_at=None, finished_at=None):
+        """
+        失败的条目尝试次数未达上限时记录这次尝试并保持待处理状态，由调用方在本次运行中重新提交
+
+        参数:
+            response: 失败的响应字典
+            max_attempts: 每个条目最多尝试的次数
+            started_at: 开始分析的时间戳
+            finished_at: 分析完成的时间戳
+
+        返回:
+            是否需要重试；不重试时调用方照常用 record 记录失败
+        """
+        item_id = str(response.get('id'))
+        row = self._conn.execute('SELECT attempts FROM jobs WHERE id = ?', (item_id,)).fetchone()
+        if row is None or row[0] + 1 >= max_attempts:
+            return False
+        seconds = finished_at - started_at if started_at is not None and finished_at is not None else None
+        with self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET attempts = attempts + 1, error = ?, started_at = ?, finished_at = ?, seconds = ? '
+                'WHERE id = ?',
+                (response.get('error'), started_at, finished_at, seconds, item_id)
+            )
+        log.warning(f"条目 {item_id} 第 {row[0] + 1} 次尝试失败，重新排队: {response.get('error')}")
+        return True
+
+    def flush(self):
+        """提交累积的结果"""
+        if self._buffer:
+            if self.before_commit is not None:
+                self.before_commit()
+            with self._conn:
+                self._conn.executemany(
+                    'UPDATE jobs SET status = ?, result = ?, error = ?, attempts = attempts + 1, '
+                    'started_at = ?, finished_at = ?, seconds = ? WHERE id = ?',
+                    self._buffer
+                )
+            log.debug(f"已提交 {len(self._buffer)} 个结果")
+            self._buffer = []
+        self._last_commit = time.monotonic()
+
+    def stats(self):
+        """
+        获取任务表统计
+
+        返回:
+            {'pending': n, 'done': n, 'failed': n, 'seconds': 已完成条目的平均耗时}
+        """
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for status, count in self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'):
+            counts[status] = count
+        average = self._conn.execute('SELECT AVG(seconds) FROM jobs WHERE status = ?', (DONE,)).fetchone()[0]
+        counts['seconds'] = round(average, 3) if average is not None else None
+        return counts
+
+    def close(self):
+        """提交剩余结果并关闭数据库"""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
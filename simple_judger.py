@@ -31,16 +31,22 @@ class ResultRow:
         return f"ResultRow(id={self.id}, name={self.name}, score={self.score})"
 
 class VoiceResult:
-    def __init__(self, result_list, gender=None):
+    # 分析出错时使用的默认结果（不写入结果缓存）
+    fallback = False
+    
+    def __init__(self, result_list, gender=None, similarities=None, rng=None):
         """
         初始化声音分析结果
         
         参数:
             result_list: 排序后的(模型,得分)元组列表
             gender: 性别 (0为男性，1为女性，None为自动判断)
+            similarities: 与参与比较的每个模型的(模型,相似度)元组列表，默认结果为空
+            rng: 选择映射模型使用的随机数生成器，默认为 random 模块
         """
         # 保存性别参数
         self.gender = gender
+        self.similarities = similarities or []
         
         # 打印原始得分列表
         log.info("原始得分列表:")
@@ -101,7 +107,7 @@ class VoiceResult:
             mapping = simple_model.mapping_models().get(model.name, [])
             
             if mapping:
-                sub_model = random.choice(mapping)
+                sub_model = (rng or random).choice(mapping)
                 log.info(f"辅音色 {i} 使用映射模型: {sub_model.name}")
                 self.sub.append(ResultRow(
                     sub_model.id,
@@ -148,35 +154,11 @@ class VoiceResult:
         # 寻找最佳匹配的异性音色
         opposite_gender = 1 if main_gender == 0 else 0
         
-        # 如果指定了性别，需要额外获取异性音色的模型
+        # 如果指定了性别，结果中只有同性别的模型，从加载模型库时预先计算的表中查找最相似的异性音色
         if self.gender is not None:
-            # 获取异性音色的模型
-            opposite_models = simple_model.male_models() if self.gender == 1 else simple_model.female_models()
-            
-            # 获取第一个主音色的基频分布
-            main_model = None
-            for model, _ in self.all_results:
-                if model.name == self.main.name:
-                    main_model = model
-                    break
-            
-            if main_model is None:
-                log.warning("无法找到主音色的模型")
-                return None
-            
-            # 计算与异性音色的相似度
-            opposite_results = []
-            for model in opposite_models:
-                similarity = simple_sound.compare_pitch_similarity(main_model.pitch_percentage, model.pitch_percentage)
-                opposite_results.append((model, similarity))
-                log.info(f"主音色与{model.name}的相似度: {similarity * 100:.2f}%")
-            
-            # 按相似度降序排序
-            opposite_results.sort(key=lambda x: -x[1])
-            
-            # 返回最相似的异性音色
-            if opposite_results:
-                best_model, _ = opposite_results[0]
+            best_model = simple_model.opposite_model(self.main.name)
+            if best_model is not None:
+                log.info(f"主音色最相似的异性音色: {best_model.name}")
                 return ResultRow(best_model.id, best_model.name, "")
         else:
             # 如果未指定性别，从现有结果中查找
@@ -212,165 +194,169 @@ def get_models_by_gender(gender):
     else:
         return simple_model.female_models()
 
-def judge_voice(file_path, gender=None):
+def create_praat(file_path):
+    """
+    为音频文件创建Praat分析对象
+    
+    参数:
+        file_path: 音频文件路径
+    
+    返回:
+        Praat对象
+    """
+    # 从文件路径中提取文件名和扩展名
+    file_name = os.path.basename(file_path)
+    name, ext = os.path.splitext(file_name)
+    name = name.strip('.')  # 移除可能的点号
+    ext = ext.lstrip('.')   # 移除扩展名前的点号
+    
+    # 使用Praat提取基频特征
+    script_path = os.path.join(conf.script_dir, f"{name}.praat")
+    
+    return Praat(
+        script_path,
+        file_path,  # 直接传递完整的文件路径
+        name,
+        ext,
+        conf.csv_path
+    )
+
+def default_result(gender=None):
+    """
+    创建默认的分析结果（基频数据缺失或分析出错时使用，标记为 fallback，不写入结果缓存）
+    
+    参数:
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+    
+    返回:
+        VoiceResult对象
+    """
+    if gender is None:
+        # 如果未指定性别，同时使用男性和女性模型
+        male_models = simple_model.male_models()[:2]
+        female_models = simple_model.female_models()[:2]
+        models = male_models + female_models
+    else:
+        models = get_models_by_gender(gender)[:4]
+    
+    results = [(model, 0.25) for model in models]
+    result = VoiceResult(results, gender)
+    result.fallback = True
+    return result
+
+def score_pitch(pitch_data, gender=None, rng=None):
+    """
+    根据基频数据与模型库比较，得出声音类型
+    
+    参数:
+        pitch_data: 包含基频数据的DataFrame
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+        rng: 随机选择辅音色使用的随机数生成器（random.Random），默认为 random 模块
+    
+    返回:
+        VoiceResult对象
+    """
+    # 检查是否有有效的基频数据
+    if pitch_data.empty:
+        log.warning("基频数据为空，使用默认值")
+        return default_result(gender)
+    # 将基频数据输出到日志
+    log.debug(f"pitch_data: {pitch_data}")
+    
+    pitch_percentage = simple_sound.get_pitch_percentage(pitch_data)
+    log.debug(f"pitch_percentage: {pitch_percentage}")
+    
+    if gender is None:
+        # 如果未指定性别，同时与男性和女性模型进行比较
+        models = simple_model.male_models() + simple_model.female_models()
+    else:
+        # 如果指定了性别，只与相应性别的模型比较
+        models = get_models_by_gender(gender)
+    
+    # 计算与每个模型的相似度
+    results = []
+    for model in models:
+        similarity = simple_sound.compare_pitch_similarity(pitch_percentage, model.pitch_percentage)
+        results.append((model, similarity))
+        log.info(f"与{model.name}的相似度: {similarity * 100:.2f}%")
+    
+    # 按相似度降序排序
+    results.sort(key=lambda x: -x[1])
+    
+    # 获取主音色（得分最高的）
+    main_result = [results[0]]
+    
+    # 从剩余结果中随机选择3个辅音色
+    remaining_results = results[1:]
+    # 如果剩余结果不足3个，则全部使用
+    if len(remaining_results) <= 3:
+        secondary_results = remaining_results
+    else:
+        # 随机选择3个辅音色
+        secondary_results = (rng or random).sample(remaining_results, 3)
+    
+    # 合并主音色和随机选择的辅音色
+    final_results = main_result + secondary_results
+    log.info("最终选择的结果:")
+    for i, (model, score) in enumerate(final_results):
+        log.info(f"  {i}. {model.name}: {score * 100:.2f}%")
+    
+    # 创建结果对象
+    return VoiceResult(final_results, gender, similarities=results, rng=rng)
+
+def judge_voice(file_path, gender=None, progress=None, seed=None, on_pitch=None):
     """
     判断声音类型
     
     参数:
         file_path: 音频文件路径
         gender: 性别 (0为男性，1为女性，None为自动判断)
+        progress: 进度事件发送器（simple_progress.ProgressReporter）
+        seed: 随机选择辅音色的种子，相同的种子和输入得到相同的结果；None为不固定
+        on_pitch: 提取到非空基频数据后调用的函数（例如写入基频轨迹缓存）
     
     返回:
         VoiceResult对象
     """
     try:
-        # 从文件路径中提取文件名和扩展名
-        file_name = os.path.basename(file_path)
-        name, ext = os.path.splitext(file_name)
-        name = name.strip('.')  # 移除可能的点号
-        ext = ext.lstrip('.')   # 移除扩展名前的点号
-        
         log.info(f"开始分析声音: {file_path}, 性别: {gender}")
         
-        # 使用Praat提取基频特征
-        script_path = os.path.join(conf.script_dir, f"{name}.praat")
-        
-        praat = Praat(
-            script_path,
-            file_path,  # 直接传递完整的文件路径
-            name,
-            ext,
-            conf.csv_path
-        )
-        
-        pitch_data = praat.praat()
-        
-        # 检查是否有有效的基频数据
-        if pitch_data.empty:
-            log.warning("基频数据为空，使用默认值")
-            # 创建一个默认的结果
-            if gender is None:
-                # 如果未指定性别，同时使用男性和女性模型
-                male_models = simple_model.male_models()[:2]
-                female_models = simple_model.female_models()[:2]
-                models = male_models + female_models
-            else:
-                models = get_models_by_gender(gender)[:4]
-            
-            results = [(model, 0.25) for model in models]
-            return VoiceResult(results, gender)
-        # 将基频数据输出到日志
-        log.info(f"pitch_data: {pitch_data}")
+        pitch_data = create_praat(file_path).praat()
+        if progress:
+            progress('pitch_extracted', frames=len(pitch_data))
+        if on_pitch is not None and not pitch_data.empty:
+            on_pitch(pitch_data)
+    except Exception as e:
+        log.error(f"声音分析失败: {str(e)}")
+        # 创建一个默认的结果，如果连默认结果都无法创建，抛出异常
+        return default_result(gender)
+    
+    return judge_pitch(pitch_data, gender, progress, seed)
+
+def judge_pitch(pitch_data, gender=None, progress=None, seed=None):
+    """
+    根据已提取的基频数据判断声音类型（切换性别或模型库时无需重新提取基频）
+    
+    参数:
+        pitch_data: 包含基频数据的DataFrame
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+        progress: 进度事件发送器（simple_progress.ProgressReporter）
+        seed: 随机选择辅音色的种子，相同的种子和输入得到相同的结果；None为不固定
+    
+    返回:
+        VoiceResult对象
+    """
+    try:
+        rng = random.Random(seed) if seed is not None else None
+        result = score_pitch(pitch_data, gender, rng)
+        if progress:
+            progress('scored')
         
-        # 将基频数据保存到文件
-        # pitch_data_file = os.path.join(conf.csv_path, f"{name}_pitch_data.csv")
-        # try:
-        #     pitch_data.to_csv(pitch_data_file, index=False)
-        #     log.info(f"基频数据已保存到文件: {pitch_data_file}")
-        # except Exception as e:
-        #     log.error(f"保存基频数据到文件失败: {str(e)}")
-        pitch_percentage = simple_sound.get_pitch_percentage(pitch_data)
-        log.info(f"pitch_percentage: {pitch_percentage}")
-        # 如果未指定性别，同时与男性和女性模型进行比较
-        if gender is None:
-            # 获取男性和女性模型
-            male_models = simple_model.male_models()
-            female_models = simple_model.female_models()
-            
-            # 计算与所有模型的相似度
-            results = []
-            
-            # 与男性模型比较
-            for model in male_models:
-                similarity = simple_sound.compare_pitch_similarity(pitch_percentage, model.pitch_percentage)
-                results.append((model, similarity))
-                log.info(f"与{model.name}的相似度: {similarity * 100:.2f}%")
-            
-            # 与女性模型比较
-            for model in female_models:
-                similarity = simple_sound.compare_pitch_similarity(pitch_percentage, model.pitch_percentage)
-                results.append((model, similarity))
-                log.info(f"与{model.name}的相似度: {similarity * 100:.2f}%")
-            
-            # 按相似度降序排序
-            results.sort(key=lambda x: -x[1])
-            
-            # 获取主音色（得分最高的）
-            main_result = [results[0]]
-            
-            # 从剩余结果中随机选择3个辅音色
-            remaining_results = results[1:]
-            import random
-            # 如果剩余结果不足3个，则全部使用
-            if len(remaining_results) <= 3:
-                secondary_results = remaining_results
-            else:
-                # 随机选择3个辅音色
-                secondary_results = random.sample(remaining_results, 3)
-            
-            # 合并主音色和随机选择的辅音色
-            final_results = main_result + secondary_results
-            log.info("最终选择的结果:")
-            for i, (model, score) in enumerate(final_results):
-                log.info(f"  {i}. {model.name}: {score * 100:.2f}%")
-            
-            # 创建结果对象
-            return VoiceResult(final_results, gender)
-        else:
-            # 如果指定了性别，只与相应性别的模型比较
-            # 获取相应性别的模型
-            models = get_models_by_gender(gender)
-            
-            # 计算与每个模型的相似度
-            results = []
-            for model in models:
-                similarity = simple_sound.compare_pitch_similarity(pitch_percentage, model.pitch_percentage)
-                results.append((model, similarity))
-                log.info(f"与{model.name}的相似度: {similarity * 100:.2f}%")
-            
-            # 按相似度降序排序
-            results.sort(key=lambda x: -x[1])
-            
-            # 获取主音色（得分最高的）
-            main_result = [results[0]]
-            
-            # 从剩余结果中随机选择3个辅音色
-            remaining_results = results[1:]
-            import random
-            # 如果剩余结果不足3个，则全部使用
-            if len(remaining_results) <= 3:
-                secondary_results = remaining_results
-            else:
-                # 随机选择3个辅音色
-                secondary_results = random.sample(remaining_results, 3)
-            
-            # 合并主音色和随机选择的辅音色
-            final_results = main_result + secondary_results
-            log.info("最终选择的结果:")
-            for i, (model, score) in enumerate(final_results):
-                log.info(f"  {i}. {model.name}: {score * 100:.2f}%")
-            
-            # 创建结果对象
-            return VoiceResult(final_results, gender)
+        return result
     except Exception as e:
         log.error(f"声音分析失败: {str(e)}")
-        # 创建一个默认的结果
-        try:
-            if gender is None:
-                # 如果未指定性别，同时使用男性和女性模型
-                male_models = simple_model.male_models()[:2]
-                female_models = simple_model.female_models()[:2]
-                models = male_models + female_models
-            else:
-                models = get_models_by_gender(gender)[:4]
-            
-            results = [(model, 0.25) for model in models]
-            return VoiceResult(results, gender)
-        except:
-            # 如果连默认结果都无法创建，抛出异常
-            raise
-    finally:
-        pass
+        # 创建一个默认的结果，如果连默认结果都无法创建，抛出异常
+        return default_result(gender)
 
 def format_result(result):
     """
@@ -395,4 +381,72 @@ def format_result(result):
     for sub in result.sub:
         output.append(f"  {sub.name} {sub.score}%")
     
-    return "\n".join(output) 
\ No newline at end of file
+    return "\n".join(output)
+
+
+def result_to_dict(result, detail=False):
+    """
+    将分析结果转换为可序列化为JSON的字典
+    
+    参数:
+        result: VoiceResult对象
+        detail: 是否附带与每个模型的相似度（批量结果写入列式存储时使用）
+    
+    返回:
+        包含主音色、辅音色和最佳匹配异性音色的字典
+    """
+    result_dict = {
+        'main': {
+            'id': result.main.id,
+            'name': result.main.name,
+            'score': result.main.score
+        },
+        'sub': [
+            {
+                'id': sub.id,
+                'name': sub.name,
+                'score': sub.score
+            } for sub in result.sub
+        ]
+    }
+    
+    # 添加最佳匹配的异性音色
+    opposite_match = result.get_opposite_gender_match()
+    if opposite_match:
+        result_dict['opposite_match'] = {
+            'id': opposite_match.id,
+            'name': opposite_match.name
+        }
+    
+    if detail:
+        result_dict['similarities'] = [
+            {'id': model.id, 'score': float(score)} for model, score in result.similarities
+        ]
+    
+    return result_dict
+
+def result_from_dict(data, gender=None):
+    """
+    由 result_to_dict 的结果还原分析结果（用于结果缓存）
+    
+    参数:
+        data: result_to_dict(result, detail=True) 返回的字典
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+    
+    返回:
+        VoiceResult对象
+    """
+    models = {str(model.id): model for model in simple_model.male_models() + simple_model.female_models()}
+    result = VoiceResult.__new__(VoiceResult)
+    result.gender = gender
+    result.main = ResultRow(data['main']['id'], data['main']['name'], data['main']['score'])
+    result.sub = [ResultRow(sub['id'], sub['name'], sub['score']) for sub in data.get('sub', [])]
+    opposite = data.get('opposite_match')
+    result.opposite_match = ResultRow(opposite['id'], opposite['name'], "") if opposite else None
+    result.similarities = [
+        (models[str(entry['id'])], entry['score'])
+        for entry in data.get('similarities', [])
+        if str(entry['id']) in models
+    ]
+    result.all_results = list(result.similarities)
+    return result
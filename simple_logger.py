@@ -6,6 +6,11 @@ import sys
 import io
 import os
 
+# 所有由 get_logger 创建的控制台处理器，便于统一切换输出流
+_console_handlers = []
+# 通过 set_stream 指定的输出流，为None时使用标准输出
+_stream = None
+
 def get_logger(name):
     logger = logging.getLogger(name)
     if not logger.handlers:
@@ -16,7 +21,9 @@ def get_logger(name):
             os.environ['PYTHONIOENCODING'] = 'utf-8'
         
         # 创建控制台处理器，确保使用UTF-8编码
-        if sys.platform == 'win32':
+        if _stream is not None:
+            console_stream = _stream
+        elif sys.platform == 'win32':
             # Windows系统特殊处理
             console_stream = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
         else:
@@ -31,5 +38,27 @@ def get_logger(name):
         
         # 添加处理器到日志器
         logger.addHandler(console_handler)
+        _console_handlers.append(console_handler)
+    
+    return logger
+
+def set_log_file(path):
+    """
+    将所有日志写入指定文件（追加模式）
+    
+    参数:
+        path: 日志文件路径
+    """
+    set_stream(open(path, 'a', encoding='utf-8'))
+
+def set_stream(stream):
+    """
+    将所有日志处理器切换到指定的输出流
     
-    return logger 
\ No newline at end of file
+    参数:
+        stream: 新的输出流（例如 sys.stderr）
+    """
+    global _stream
+    _stream = stream
+    for handler in _console_handlers:
+        handler.setStream(stream)
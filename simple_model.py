@@ -5,11 +5,11 @@ import os
 import csv
 import io
 import sys
-import pandas as pd
+import threading
 import simple_logger
 import simple_config
 from simple_sound import get_pitch_percentage
-from simple_praat import Praat
+from simple_praat import read_pitch_csv
 
 log = simple_logger.get_logger(__name__)
 conf = simple_config.get_config()
@@ -52,19 +52,60 @@ class VoiceSubModel:
 _male_models = []
 _female_models = []
 _mapping_models = {}
+_opposite_models = {}
+_similarity = None
+_model_path = None
+_loaded = False
+_load_lock = threading.Lock()
+
+def ensure_loaded():
+    """确保模型已加载（首次调用时才读取模型文件，导入本模块时不做任何加载）"""
+    if _loaded:
+        return
+    with _load_lock:
+        if not _loaded:
+            # 尝试加载模型，如果失败则创建示例模型
+            if not load_models_from_csv():
+                create_sample_models()
 
 def male_models():
     """获取男性声音模型列表"""
+    ensure_loaded()
     return _male_models
 
 def female_models():
     """获取女性声音模型列表"""
+    ensure_loaded()
     return _female_models
 
 def mapping_models():
     """获取模型映射字典"""
+    ensure_loaded()
     return _mapping_models
 
+def opposite_model(name):
+    """
+    获取与指定模型最相似的异性模型（加载模型库时预先计算）
+    
+    参数:
+        name: 模型名称
+    
+    返回:
+        VoiceModel对象，没有异性模型时返回None
+    """
+    ensure_loaded()
+    return _opposite_models.get(name)
+
+def model_similarity():
+    """
+    获取模型两两之间的相似度矩阵（加载模型库时预先计算）
+    
+    返回:
+        (模型名称列表（男性模型在前）, 相似度矩阵)
+    """
+    ensure_loaded()
+    return _similarity['names'], _similarity['matrix']
+
 def load_models_from_csv(model_file='voice_model.csv', mapping_file='voice_analyzer_mapping.csv'):
     """
     从CSV文件加载声音模型
@@ -73,10 +114,80 @@ def load_models_from_csv(model_file='voice_model.csv', mapping_file='voice_analy
         model_file: 模型CSV文件路径
         mapping_file: 映射CSV文件路径
     """
+    global _loaded
+    
+    loaded = _load_models_from_csv(model_file, mapping_file)
+    if loaded:
+        # 回退到示例模型时已在 create_sample_models 中计算
+        if _model_path is not None:
+            _build_tables()
+        _loaded = True
+    return loaded
+
+# 读取CSV文件时依次尝试的编码
+_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'latin-1']
+
+def read_model_file(model_path):
+    """
+    读取模型CSV文件（不影响当前加载的模型，可用于比较其他模型库）
+    
+    参数:
+        model_path: 模型CSV文件路径
+    
+    返回:
+        VoiceModel列表（按文件顺序，ID从1开始），无法读取时返回None
+    """
+    # 尝试不同的编码方式读取文件
+    all_models = []
+    for encoding in _ENCODINGS:
+        try:
+            with open(model_path, 'r', encoding=encoding) as csvfile:
+                reader = csv.DictReader(csvfile)
+                all_models = list(reader)
+            log.info(f"成功使用 {encoding} 编码读取模型文件")
+            break
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            log.error(f"读取模型文件时出错 ({encoding}): {str(e)}")
+            continue
+    
+    if not all_models:
+        log.error("无法使用任何编码读取模型文件")
+        return None
+    
+    log.info(f"CSV文件中包含 {len(all_models)} 个模型记录")
+    
+    # 然后处理每个模型
+    models = []
+    model_id = 1  # 自动生成模型ID
+    for m in all_models:
+        try:
+            name = m['name']
+            gender = int(m['gender'])
+            raw_data = m['raw_data']
+            
+            # 解析基频数据
+            pitch_data = read_pitch_csv(io.StringIO(raw_data))
+            pitch_percentage = get_pitch_percentage(pitch_data)
+            
+            # 创建模型对象
+            models.append(VoiceModel(name, model_id, pitch_percentage, gender))
+            model_id += 1  # 递增模型ID
+        except Exception as e:
+            log.error(f"处理模型记录时出错: {str(e)}")
+            continue
+    return models
+
+def _load_models_from_csv(model_file, mapping_file):
+    """从CSV文件加载声音模型（由 load_models_from_csv 调用）"""
+    global _model_path
+    
     # 清空现有模型
     _male_models.clear()
     _female_models.clear()
     _mapping_models.clear()
+    _model_path = None
     
     model_path = os.path.join(conf.model_dir, model_file)
     mapping_path = os.path.join(conf.model_dir, mapping_file)
@@ -115,56 +226,19 @@ def load_models_from_csv(model_file='voice_model.csv', mapping_file='voice_analy
     
     # 加载模型
     try:
-        # 尝试不同的编码方式读取文件
-        encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
-        all_models = []
-        
-        for encoding in encodings:
-            try:
-                with open(model_path, 'r', encoding=encoding) as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    all_models = list(reader)
-                log.info(f"成功使用 {encoding} 编码读取模型文件")
-                break
-            except UnicodeDecodeError:
-                continue
-            except Exception as e:
-                log.error(f"读取模型文件时出错 ({encoding}): {str(e)}")
-                continue
-        
-        if not all_models:
-            log.error("无法使用任何编码读取模型文件")
+        _model_path = model_path
+        models = read_model_file(model_path)
+        if models is None:
             return False
-        
-        log.info(f"CSV文件中包含 {len(all_models)} 个模型记录")
-        
-        # 然后处理每个模型
-        model_id = 1  # 自动生成模型ID
-        for m in all_models:
-            try:
-                name = m['name']
-                gender = int(m['gender'])
-                raw_data = m['raw_data']
-                
-                # 解析基频数据
-                pitch_data = pd.read_csv(io.StringIO(raw_data), names=['pitch'])
-                pitch_percentage = get_pitch_percentage(pitch_data)
-                
-                # 创建模型对象
-                model = VoiceModel(name, model_id, pitch_percentage, gender)
-                model_id += 1  # 递增模型ID
-                
-                # 添加到相应的模型列表
-                if gender == 0:
-                    _male_models.append(model)
-                else:
-                    _female_models.append(model)
-                
-                # 初始化映射
-                _mapping_models[name] = []
-            except Exception as e:
-                log.error(f"处理模型记录时出错: {str(e)}")
-                continue
+        for model in models:
+            # 添加到相应的模型列表
+            if model.gender == 0:
+                _male_models.append(model)
+            else:
+                _female_models.append(model)
+            
+            # 初始化映射
+            _mapping_models[model.name] = []
         
         log.info(f"已加载 {len(_male_models)} 个男性声音模型和 {len(_female_models)} 个女性声音模型")
         
@@ -173,7 +247,7 @@ def load_models_from_csv(model_file='voice_model.csv', mapping_file='voice_analy
             # 尝试不同的编码方式读取文件
             all_mappings = []
             
-            for encoding in encodings:
+            for encoding in _ENCODINGS:
                 try:
                     with open(mapping_path, 'r', encoding=encoding) as csvfile:
                         reader = csv.DictReader(csvfile)
@@ -221,10 +295,15 @@ def load_models_from_csv(model_file='voice_model.csv', mapping_file='voice_analy
 
 def create_sample_models():
     """创建示例模型（当没有CSV文件时使用）"""
+    import pandas as pd
+    
+    global _loaded, _model_path
+    
     # 清空现有模型
     _male_models.clear()
     _female_models.clear()
     _mapping_models.clear()
+    _model_path = None
     
     # 创建示例男性模型
     male_types = ["暖男音", "青叔音", "大叔音", "青年音", "公子音", "少年音", "正太音", "青受音"]
@@ -256,8 +335,131 @@ def create_sample_models():
             _mapping_models[name].append(VoiceSubModel(sub_id, sub_name))
     
     log.info(f"已创建 {len(_male_models)} 个示例男性模型和 {len(_female_models)} 个示例女性模型")
+    _build_tables()
+    _loaded = True
     return True
 
-# 尝试加载模型，如果失败则创建示例模型
-if not load_models_from_csv():
-    create_sample_models() 
\ No newline at end of file
+# 相似度表的格式或计算方式变化时递增，旧的表文件自动失效
+_TABLE_VERSION = 1
+
+def similarity_matrix(models):
+    """
+    计算模型两两之间的相似度（与 simple_sound.compare_pitch_similarity 的结果相同，一次矩阵乘法完成）
+    
+    参数:
+        models: VoiceModel列表
+    
+    返回:
+        (模型数, 模型数) 的相似度矩阵
+    """
+    import numpy as np
+    
+    ids = sorted({int(i) for model in models for i in model.pitch_percentage.get('id', [])})
+    position = {pitch: i for i, pitch in enumerate(ids)}
+    dense = np.zeros((len(models), len(ids)))
+    present = np.zeros((len(models), len(ids)))
+    valid = np.ones(len(models), dtype=bool)
+    for row, model in enumerate(models):
+        percentage = model.pitch_percentage
+        if percentage.empty or not {'id', 'percentage_cnt'}.issubset(percentage.columns):
+            valid[row] = False
+            continue
+        columns = [position[int(i)] for i in percentage['id']]
+        # 与pandas求和一致，NaN按0计
+        dense[row, columns] = np.nan_to_num(percentage['percentage_cnt'].to_numpy(dtype=float))
+        present[row, columns] = 1.0
+    
+    matrix = np.clip(dense @ dense.T, 0.0, 1.0)
+    # 没有共同基频值或基频数据为空时与compare_pitch_similarity一样使用默认相似度
+    matrix[(present @ present.T) == 0] = 0.25
+    matrix[~valid, :] = 0.25
+    matrix[:, ~valid] = 0.25
+    return matrix
+
+def _table_paths():
+    """相似度表文件：优先保存在模型文件旁，模型目录不可写时保存在临时目录"""
+    name = os.path.splitext(os.path.basename(_model_path))[0] + '.similarity.json'
+    return [os.path.join(os.path.dirname(_model_path), name), os.path.join(conf.temp_dir, name)]
+
+def _library_digest():
+    """模型文件内容和基频范围的摘要，模型库变化时相似度表重新计算"""
+    import hashlib
+    import json
+    
+    digest = hashlib.sha1()
+    with open(_model_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps([_TABLE_VERSION, conf.pitch_min, conf.pitch_max]).encode('utf-8'))
+    return digest.hexdigest()
+
+def _read_table(digest, names):
+    """读取与当前模型库一致的相似度表，没有时返回None"""
+    import json
+    
+    for path in _table_paths():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if table.get('digest') == digest and table.get('names') == names:
+            log.info(f"使用已保存的模型相似度表: {path}")
+            return table
+    return None
+
+def _write_table(table):
+    """保存相似度表（写入临时文件后替换，多个进程同时加载时不会读到不完整的文件）"""
+    import json
+    
+    for path in _table_paths():
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            log.info(f"模型相似度表已保存: {path}")
+            return
+        except OSError as e:
+            log.debug(f"无法保存模型相似度表 {path}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def _build_tables():
+    """
+    计算模型两两之间的相似度矩阵和每个模型最相似的异性模型
+    
+    每次加载模型库时执行一次；从文件加载的模型库把结果保存在模型文件旁，下次启动时直接读取。
+    """
+    global _similarity, _opposite_models
+    import numpy as np
+    
+    models = _male_models + _female_models
+    names = [model.name for model in models]
+    
+    table = None
+    digest = None
+    if _model_path is not None:
+        try:
+            digest = _library_digest()
+            table = _read_table(digest, names)
+        except OSError as e:
+            log.warning(f"无法读取模型文件计算摘要: {str(e)}")
+    
+    if table is None:
+        matrix = similarity_matrix(models)
+        genders = np.array([int(model.gender) for model in models])
+        opposite = {}
+        for i, model in enumerate(models):
+            candidates = np.flatnonzero(genders != genders[i])
+            if len(candidates):
+                # 相似度相同时取模型库中靠前的模型
+                opposite[model.name] = names[candidates[np.argmax(matrix[i, candidates])]]
+        table = {'digest': digest, 'names': names, 'similarity': matrix.tolist(), 'opposite': opposite}
+        if digest is not None:
+            _write_table(table)
+    
+    by_name = {model.name: model for model in models}
+    _similarity = {'names': names, 'matrix': np.array(table['similarity'])}
+    _opposite_models = {name: by_name[other] for name, other in table['opposite'].items() if other in by_name}
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import atexit
+import asyncio
+import simple_logger
+import simple_config
+import simple_utils
+import simple_ffmpeg
+import simple_judger
+import simple_model
+import simple_autotune
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+class _Job:
+    def __init__(self, future, gender, url=None, file_path=None):
+        """
+        初始化流水线中的一个分析任务
+
+        参数:
+            future: 用于返回结果的Future
+            gender: 性别 (0为男性，1为女性，None为自动判断)
+            url: 音频文件URL
+            file_path: 本地音频文件路径
+        """
+        self.future = future
+        self.gender = gender
+        self.url = url
+        self.file_path = file_path
+        self.wav_path = None
+        self.pitch_data = None
+
+class AnalysisPipeline:
+    def __init__(self, download_concurrency=4, ffmpeg_concurrency=None, praat_concurrency=None, queue_size=16):
+        """
+        初始化分阶段的异步分析流水线
+
+        下载、FFmpeg转换、Praat提取和打分四个阶段各自拥有独立的并发数，
+        阶段之间通过有界队列连接，使网络、解码和基频提取可以同时工作。
+
+        参数:
+            download_concurrency: 同时进行的下载数量
+            ffmpeg_concurrency: 同时运行的FFmpeg进程数量，默认取调优配置，没有时为CPU核数的一半
+            praat_concurrency: 同时运行的Praat进程数量，默认取调优配置，没有时为CPU核数
+            queue_size: 阶段之间队列的最大长度
+        """
+        cpu_count = os.cpu_count() or 1
+        tuned = simple_autotune.load_tuned_config().get('pipeline', {})
+        self.download_concurrency = download_concurrency
+        self.ffmpeg_concurrency = ffmpeg_concurrency or tuned.get('ffmpeg_concurrency') or max(1, cpu_count // 2)
+        self.praat_concurrency = praat_concurrency or tuned.get('praat_concurrency') or cpu_count
+        self.queue_size = queue_size
+        self.loop = None
+        self._tasks = []
+
+    async def start(self):
+        """启动各阶段的工作协程"""
+        self.loop = asyncio.get_running_loop()
+        await asyncio.to_thread(simple_model.ensure_loaded)
+        self._download_queue = asyncio.Queue(self.queue_size)
+        self._ffmpeg_queue = asyncio.Queue(self.queue_size)
+        self._praat_queue = asyncio.Queue(self.queue_size)
+        self._score_queue = asyncio.Queue(self.queue_size)
+
+        stages = [
+            ('下载', self._download_queue, self._download, self._ffmpeg_queue, self.download_concurrency),
+            ('FFmpeg', self._ffmpeg_queue, self._convert, self._praat_queue, self.ffmpeg_concurrency),
+            ('Praat', self._praat_queue, self._extract_pitch, self._score_queue, self.praat_concurrency),
+            ('打分', self._score_queue, self._score, None, 1),
+        ]
+        for name, queue, process, next_queue, concurrency in stages:
+            for _ in range(concurrency):
+                self._tasks.append(asyncio.create_task(self._run_stage(name, queue, process, next_queue)))
+
+        log.info(f"分析流水线已启动: 下载 {self.download_concurrency}, FFmpeg {self.ffmpeg_concurrency}, Praat {self.praat_concurrency}")
+        return self
+
+    async def close(self):
+        """停止所有工作协程"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log.info("分析流水线已关闭")
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _run_stage(self, name, queue, process, next_queue):
+        """
+        阶段工作协程：从输入队列取任务，处理后放入下一阶段的队列
+
+        参数:
+            name: 阶段名称
+            queue: 输入队列
+            process: 处理函数（协程）
+            next_queue: 下一阶段的队列，最后一个阶段为None
+        """
+        while True:
+            job = await queue.get()
+            try:
+                if job.future.done():
+                    continue
+                await process(job)
+                if next_queue is not None:
+                    await next_queue.put(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"{name}阶段失败: {str(e)}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def _download(self, job):
+        unique_id = simple_utils.generate_unique_id()
+        download_path = simple_utils.download_path(unique_id, job.url)
+
+        log.info(f"开始下载音频: {job.url}")
+        await asyncio.to_thread(simple_utils.download_file, job.url, download_path)
+        job.file_path = download_path
+
+    async def _convert(self, job):
+        unique_id = simple_utils.generate_unique_id()
+        wav_path = simple_utils.decode_path(unique_id)
+        os.makedirs(os.path.dirname(wav_path), exist_ok=True)
+
+        args = simple_ffmpeg.command_args(job.file_path, wav_path)
+        log.info(f"开始转换音频: {job.file_path} -> {wav_path}")
+
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+
+        if process.returncode != 0:
+            log.error(f"错误输出: {stderr.decode('utf-8', errors='replace')}")
+            raise RuntimeError(f"音频转换失败: {job.file_path}")
+        if not os.path.exists(wav_path) or os.path.getsize(wav_path) == 0:
+            raise RuntimeError("音频转换失败: 输出文件不存在或为空")
+
+        log.info(f"音频转换完成: {wav_path}")
+        job.wav_path = wav_path
+
+    async def _extract_pitch(self, job):
+        praat = simple_judger.create_praat(job.wav_path)
+        csv_file = None
+        try:
+            args, csv_file = praat.prepare()
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+
+            # 与 judge_voice 保持一致：Praat失败时使用空的基频数据，由打分阶段给出默认结果
+            if process.returncode != 0:
+                log.error(f"Praat分析失败，返回码: {process.returncode}, 错误输出: {stderr.decode('utf-8', errors='replace')}")
+            job.pitch_data = praat.read_result(csv_file)
+        except Exception as e:
+            log.error(f"Praat分析失败: {str(e)}")
+            job.pitch_data = praat.read_result('')
+        finally:
+            praat.cleanup(csv_file)
+
+    async def _score(self, job):
+        try:
+            result = await asyncio.to_thread(simple_judger.score_pitch, job.pitch_data, job.gender)
+        except Exception as e:
+            log.error(f"声音分析失败: {str(e)}")
+            result = simple_judger.default_result(job.gender)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def analyze(self, url=None, file_path=None, gender=None):
+        """
+        通过流水线分析一个音频
+
+        参数:
+            url: 音频文件URL
+            file_path: 本地音频文件路径
+            gender: 性别 (0为男性，1为女性，None为自动判断)
+
+        返回:
+            VoiceResult对象
+        """
+        if not self._tasks:
+            raise RuntimeError('流水线未启动或已关闭，请先 await start() 或使用 async with')
+        if asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError('流水线只能在启动它的事件循环中使用')
+        if bool(url) == bool(file_path):
+            raise ValueError('必须且只能指定URL或文件路径之一')
+        if file_path and not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+        job = _Job(self.loop.create_future(), gender, url, file_path)
+        if url:
+            await self._download_queue.put(job)
+        else:
+            await self._ffmpeg_queue.put(job)
+        return await job.future
+
+_default_pipeline = None
+
+def _close_default_pipeline():
+    """进程退出时关闭默认流水线（事件循环已关闭或仍在运行时无法再等待关闭，直接丢弃）"""
+    global _default_pipeline
+    pipeline, _default_pipeline = _default_pipeline, None
+    if pipeline is None or not pipeline._tasks:
+        return
+    loop = pipeline.loop
+    if loop.is_closed() or loop.is_running():
+        return
+    try:
+        loop.run_until_complete(pipeline.close())
+    except Exception as e:
+        log.warning(f"关闭默认流水线失败: {str(e)}")
+
+atexit.register(_close_default_pipeline)
+
+async def analyze(url=None, file_path=None, gender=None):
+    """
+    使用默认流水线异步分析一个音频
+
+    参数:
+        url: 音频文件URL
+        file_path: 本地音频文件路径
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+
+    返回:
+        VoiceResult对象
+    """
+    global _default_pipeline
+    loop = asyncio.get_running_loop()
+    if _default_pipeline is None or _default_pipeline.loop is not loop:
+        _default_pipeline = await AnalysisPipeline().start()
+    return await _default_pipeline.analyze(url, file_path, gender)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import queue
+import signal
+import threading
+import multiprocessing
+import simple_logger
+import simple_model
+import simple_cancel
+import simple_threads
+
+log = simple_logger.get_logger(__name__)
+
+# 取消请求后等待工作进程自行清理并返回的时间（秒），超时后强制终止并补充新的工作进程
+CANCEL_GRACE = 5
+
+def get_rss_mb():
+    """
+    获取当前进程的常驻内存(RSS)，单位MB
+
+    返回:
+        RSS大小，无法获取时返回None
+    """
+    try:
+        # Linux 下直接读取 /proc，得到的是当前值而不是峰值
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        pass
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 返回字节，其他系统返回KB
+        if sys.platform == 'darwin':
+            return peak / (1024 * 1024)
+        return peak / 1024
+    except Exception:
+        return None
+
+def _worker_main(conn, handler, max_requests, max_rss_mb, thread_budget=None, cpus=None):
+    """
+    工作进程主循环
+
+    参数:
+        conn: 与主进程通信的管道
+        handler: 请求处理函数
+        max_requests: 处理多少个请求后退出（0为不限制）
+        max_rss_mb: 内存超过多少MB后退出（0为不限制）
+        thread_budget: 线程预算字典
+        cpus: 绑定的CPU列表，None为不绑定
+    """
+    # 必须在加载模型（导入numpy）之前应用线程预算
+    if thread_budget:
+        simple_threads.apply_thread_budget(thread_budget, cpus)
+
+    # 启动时加载模型，之后处理请求不再需要冷启动
+    simple_model.ensure_loaded()
+
+    served = 0
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+
+        if request is None:
+            break
+
+        # 主进程发送 SIGTERM 表示取消当前请求：立即打断分析，终止FFmpeg/Praat进程组，返回 cancelled 响应
+        token = simple_cancel.CancelToken()
+        cancellable = hasattr(signal, 'SIGTERM') and os.name != 'nt'
+        if cancellable:
+            simple_cancel.install_signal_handlers(token, signals=[signal.SIGTERM])
+        try:
+            with simple_cancel.scope(token):
+                response = handler(request)
+        except simple_cancel.AnalysisCancelled as e:
+            # 信号落在handler自身的取消处理之外
+            token.cleanup()
+            response = {'id': request.get('id'), 'status': 'cancelled', 'error': str(e) or '已取消'}
+        finally:
+            if cancellable:
+                # 请求已处理完，迟到的取消信号不能打断与主进程的通信
+                signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        served += 1
+
+        # 达到请求数上限或内存上限时通知主进程回收本进程
+        recycle = False
+        if max_requests and served >= max_requests:
+            recycle = True
+        if max_rss_mb:
+            rss = get_rss_mb()
+            if rss is not None and rss > max_rss_mb:
+                log.warning(f"工作进程 {os.getpid()} 内存 {rss:.1f}MB 超过上限 {max_rss_mb}MB")
+                recycle = True
+
+        try:
+            conn.send((response, recycle))
+        except (EOFError, OSError):
+            break
+
+        if recycle:
+            break
+
+    conn.close()
+
+class _Worker:
+    def __init__(self, process, conn, slot):
+        """
+        初始化工作进程句柄
+
+        参数:
+            process: 工作进程对象
+            conn: 与工作进程通信的管道
+            slot: 工作进程的编号（决定绑定的CPU），回收后由新进程沿用
+        """
+        self.process = process
+        self.conn = conn
+        self.slot = slot
+        self.request = None
+        self.ticket = None
+        self.cancelled = False
+
+class WorkerPool:
+    def __init__(self, handler, workers=None, max_requests=0, max_rss_mb=0, thread_budget=None, pin_cpus=False):
+        """
+        初始化预先启动的工作进程池
+
+        每个工作进程各自加载模型并常驻，处理指定数量的请求或内存超限后被回收并重新启动。
+
+        参数:
+            handler: 请求处理函数，接收请求字典，返回响应字典（必须可被pickle）
+            workers: 工作进程数量，默认为CPU核数
+            max_requests: 每个工作进程处理多少个请求后回收（0为不限制）
+            max_rss_mb: 工作进程内存超过多少MB后回收（0为不限制）
+            thread_budget: 每个工作进程的线程预算，默认按工作进程数平均分配CPU
+            pin_cpus: 是否把每个工作进程绑定到各自的CPU上
+        """
+        self.handler = handler
+        self.size = workers or os.cpu_count() or 1
+        self.thread_budget = thread_budget or simple_threads.parse_thread_budget(None, self.size)
+        self.cpu_sets = simple_threads.cpu_sets(self.size, max(self.thread_budget.values())) if pin_cpus else None
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.recycled = 0
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _spawn(self, slot):
+        """启动一个新的工作进程"""
+        cpus = self.cpu_sets[slot % len(self.cpu_sets)] if self.cpu_sets else None
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.handler, self.max_requests, self.max_rss_mb, self.thread_budget, cpus),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        worker = _Worker(process, parent_conn, slot)
+        with self._lock:
+            self._workers.append(worker)
+        log.info(f"工作进程已启动: {process.pid}")
+        return worker
+
+    def _retire(self, worker):
+        """回收一个工作进程"""
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        try:
+            worker.conn.close()
+        except Exception:
+            pass
+        worker.process.join(timeout=5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        log.info(f"工作进程已回收: {worker.process.pid}")
+
+    def start(self):
+        """启动所有工作进程"""
+        for slot in range(self.size):
+            self._idle.put(self._spawn(slot))
+        log.info(f"工作进程池已启动，进程数: {self.size}")
+        return self
+
+    def submit(self, request, ticket=None):
+        """
+        将请求交给空闲的工作进程处理（阻塞直到返回结果）
+
+        参数:
+            request: 请求字典
+            ticket: 调用方为本次处理分配的唯一编号，用于 cancel（None为不可取消）
+
+        返回:
+            响应字典
+        """
+        if self._closed:
+            raise RuntimeError("工作进程池已关闭")
+
+        worker = self._idle.get()
+        reusable = False
+        try:
+            with self._lock:
+                worker.request = request
+                worker.ticket = ticket
+                worker.cancelled = False
+            worker.conn.send(request)
+            response, recycle = worker.conn.recv()
+            reusable = not recycle
+        except (EOFError, OSError) as e:
+            if worker.cancelled:
+                # 取消后未在宽限时间内返回，已被强制终止
+                return {'id': request.get('id'), 'status': 'cancelled', 'error': '已取消'}
+            # 工作进程崩溃，补充一个新的工作进程后返回错误
+            log.error(f"工作进程 {worker.process.pid} 异常退出: {str(e)}")
+            return {
+                'id': request.get('id'),
+                'status': 'error',
+                'error': f"工作进程异常退出: {str(e)}"
+            }
+        finally:
+            with self._lock:
+                worker.request = None
+                worker.ticket = None
+            # 无论以何种方式结束，工作进程都要回到空闲队列：需要回收、崩溃或与主进程的通信
+            # 中途出错（例如请求无法pickle、等待结果时被中断，管道状态未知）时换成新的工作进程
+            if reusable:
+                self._idle.put(worker)
+            else:
+                self._retire(worker)
+                self.recycled += 1
+                self._idle.put(self._spawn(worker.slot))
+        return response
+
+    def cancel(self, ticket):
+        """
+        取消正在处理的请求（向处理该请求的工作进程发送 SIGTERM，仅限POSIX系统）
+
+        工作进程超过 CANCEL_GRACE 秒仍未返回时强制终止，由 submit 补充新的工作进程。
+
+        参数:
+            ticket: 提交请求时传入的编号
+
+        返回:
+            是否找到了正在处理该请求的工作进程
+        """
+        if os.name == 'nt':
+            raise RuntimeError("Windows下不支持取消进程池中的请求")
+        if ticket is None:
+            return False
+
+        with self._lock:
+            for worker in self._workers:
+                if worker.ticket == ticket and not worker.cancelled:
+                    log.info(f"取消请求 {worker.request.get('id')}，工作进程: {worker.process.pid}")
+                    worker.cancelled = True
+                    os.kill(worker.process.pid, signal.SIGTERM)
+                    timer = threading.Timer(CANCEL_GRACE, self._kill_cancelled, (worker, ticket))
+                    timer.daemon = True
+                    timer.start()
+                    return True
+        return False
+
+    def _kill_cancelled(self, worker, ticket):
+        """取消后宽限时间已到，工作进程仍在处理该请求时强制终止"""
+        with self._lock:
+            if worker.ticket != ticket or not worker.process.is_alive():
+                return
+            log.warning(f"工作进程 {worker.process.pid} 取消后未及时返回，强制终止")
+            worker.process.kill()
+
+    def stats(self):
+        """获取进程池状态"""
+        with self._lock:
+            pids = [w.process.pid for w in self._workers]
+        return {
+            'workers': self.size,
+            'idle': self._idle.qsize(),
+            'recycled': self.recycled,
+            'pids': pids,
+            'thread_budget': self.thread_budget
+        }
+
+    def close(self):
+        """关闭所有工作进程"""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+        for worker in workers:
+            self._retire(worker)
+        log.info("工作进程池已关闭")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -5,15 +5,15 @@ import subprocess
 import traceback
 import os
 import sys
-import pandas as pd
 import simple_logger
 import simple_config
+import simple_cancel
 from simple_utils import delete_file
 
 log = simple_logger.get_logger(__name__)
 conf = simple_config.get_config()
 
-# Praat脚本模板，用于提取音频的基频特征
+# Praat脚本模板，用于提取音频的基频特征（每行输出 帧时间,基频）
 # 使用最简单的脚本格式，避免路径问题
 _praat_script = u"""
 Read from file: "{wav_file}"
@@ -27,12 +27,81 @@ for i to numberOfFrames
     time = Get time from frame number: i
     pitch = Get value at time: time, "Hertz", "Linear"
     if pitch <> undefined
-        appendFileLine: "{csv_path}", pitch
+        appendFileLine: "{csv_path}", fixed$(time, 4), ",", pitch
     endif
 endfor
 echo "{csv_path}"
 """
 
+# 基频数据的列：帧时间（秒）和基频（Hz）
+PITCH_COLUMNS = ['time', 'pitch']
+
+def empty_pitch():
+    """空的基频数据"""
+    import pandas as pd
+    return pd.DataFrame(columns=PITCH_COLUMNS)
+
+def read_pitch_csv(source):
+    """
+    读取基频CSV
+
+    Praat脚本每行输出 帧时间,基频；模型文件的 raw_data 等旧数据每行只有基频，此时帧时间为NaN
+
+    参数:
+        source: CSV文件路径或StringIO对象
+
+    返回:
+        包含 time 和 pitch 列的DataFrame
+    """
+    import numpy as np
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(source, header=None)
+    except pd.errors.EmptyDataError:
+        return empty_pitch()
+    if df.shape[1] >= 2:
+        df = df.iloc[:, :2]
+        df.columns = PITCH_COLUMNS
+    else:
+        df.columns = ['pitch']
+        df.insert(0, 'time', np.nan)
+    return df
+
+def get_praat_path():
+    """
+    获取Praat可执行文件路径
+    
+    返回:
+        Praat可执行文件路径
+    """
+    praat_path = conf.praat_path
+    
+    # 检查Praat可执行文件是否存在
+    if not os.path.exists(praat_path):
+        log.warning(f"Praat可执行文件不存在: {praat_path}")
+        
+        # 如果在PyInstaller环境中，尝试从资源目录加载
+        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+            # 尝试其他可能的路径
+            alternative_paths = [
+                os.path.join(sys._MEIPASS, 'praat', 'Praat.exe'),
+                os.path.join(sys._MEIPASS, 'Praat.exe'),
+                os.path.join(os.path.dirname(sys.executable), 'praat', 'Praat.exe'),
+                os.path.join(os.path.dirname(sys.executable), 'Praat.exe')
+            ]
+            
+            for alt_path in alternative_paths:
+                log.info(f"尝试替代Praat路径: {alt_path}")
+                if os.path.exists(alt_path):
+                    praat_path = alt_path
+                    log.info(f"找到Praat可执行文件: {praat_path}")
+                    break
+            else:
+                log.error("无法找到Praat可执行文件，分析将失败")
+    
+    return praat_path
+
 class Praat:
     def __init__(self, script_path, wav_path, voice_name, voice_suffix, csv_output_path):
         """
@@ -51,6 +120,107 @@ class Praat:
         self._wav_dir = wav_path
         self._csv_path = csv_output_path
 
+    @property
+    def script_path(self):
+        """Praat脚本路径"""
+        return self._script_path
+
+    def csv_file(self):
+        """获取本次分析输出的CSV文件路径"""
+        # 获取文件名（不含扩展名）
+        voice_name = os.path.splitext(os.path.basename(self._wav_dir))[0]
+        return os.path.join(self._csv_path, f"{voice_name}.csv")
+
+    def prepare(self):
+        """
+        生成Praat脚本
+        
+        返回:
+            (命令参数列表, CSV文件路径)
+        """
+        # 确保路径使用正斜杠，Praat在Windows下也需要使用正斜杠
+        full_wav_path = self._wav_dir
+        
+        # 检查音频文件是否存在
+        if not os.path.exists(full_wav_path):
+            raise FileNotFoundError(f"音频文件不存在: {full_wav_path}")
+        
+        # 创建CSV文件路径
+        csv_file = self.csv_file()
+        
+        log.info(f"处理音频文件: {full_wav_path}")
+        
+        # 将完整的WAV文件路径转换为Praat可接受的格式
+        wav_file_path = full_wav_path.replace('\\', '/')
+        csv_file_path = csv_file.replace('\\', '/')
+        
+        # 确保目录存在
+        os.makedirs(os.path.dirname(self._script_path), exist_ok=True)
+        os.makedirs(self._csv_path, exist_ok=True)
+        
+        # 删除可能存在的旧CSV文件
+        if os.path.exists(csv_file):
+            os.remove(csv_file)
+        
+        # 生成Praat脚本
+        with open(self._script_path, mode='w', encoding='utf-8') as file:
+            script_content = _praat_script.format(
+                wav_file=wav_file_path,
+                csv_path=csv_file_path,
+                pitch_max=conf.pitch_max,
+                pitch_min=conf.pitch_min
+            )
+            file.write(script_content)
+        
+        # 检查脚本文件是否存在
+        if not os.path.exists(self._script_path):
+            raise FileNotFoundError(f"脚本文件不存在: {self._script_path}")
+        
+        praat_path = get_praat_path()
+        log.info(f"使用Praat路径: {praat_path}")
+        return [praat_path, '--run', self._script_path], csv_file
+
+    def read_result(self, csv_file, return_pandas_df=True):
+        """
+        读取Praat输出的CSV文件
+        
+        参数:
+            csv_file: CSV文件路径
+            return_pandas_df: 是否返回Pandas DataFrame对象
+        
+        返回:
+            如果return_pandas_df为True，返回包含基频数据的DataFrame
+            否则返回原始字符串
+        """
+        # 检查CSV文件是否生成
+        if not os.path.exists(csv_file):
+            log.error(f"CSV文件未生成: {csv_file}")
+            # 创建一个空的DataFrame
+            return empty_pitch() if return_pandas_df else ""
+        
+        # 解析结果
+        if return_pandas_df:
+            df = read_pitch_csv(csv_file)
+            return df
+        else:
+            with open(csv_file, 'r') as f:
+                data = f.read()
+            return data
+
+    def cleanup(self, csv_file=None):
+        """
+        清理临时文件
+        
+        参数:
+            csv_file: CSV文件路径
+        """
+        try:
+            if csv_file and os.path.exists(csv_file):
+                delete_file(csv_file)
+            delete_file(self._script_path)
+        except:
+            pass
+
     def praat(self, return_pandas_df=True):
         """
         执行Praat分析
@@ -62,110 +232,31 @@ class Praat:
             如果return_pandas_df为True，返回包含基频数据的DataFrame
             否则返回原始字符串
         """
+        csv_file = None
         try:
-            # 确保路径使用正斜杠，Praat在Windows下也需要使用正斜杠
-            full_wav_path = self._wav_dir
-            
-            # 检查音频文件是否存在
-            if not os.path.exists(full_wav_path):
-                raise FileNotFoundError(f"音频文件不存在: {full_wav_path}")
-            
-            # 获取文件名（不含扩展名）
-            voice_name = os.path.splitext(os.path.basename(full_wav_path))[0]
-            
-            # 创建CSV文件路径
-            csv_file = os.path.join(self._csv_path, f"{voice_name}.csv")
-            
-            log.info(f"处理音频文件: {full_wav_path}")
-            
-            # 将完整的WAV文件路径转换为Praat可接受的格式
-            wav_file_path = full_wav_path.replace('\\', '/')
-            csv_file_path = csv_file.replace('\\', '/')
-            
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self._script_path), exist_ok=True)
-            os.makedirs(self._csv_path, exist_ok=True)
-            
-            # 删除可能存在的旧CSV文件
-            if os.path.exists(csv_file):
-                os.remove(csv_file)
-            
-            # 生成Praat脚本
-            with open(self._script_path, mode='w', encoding='utf-8') as file:
-                script_content = _praat_script.format(
-                    wav_file=wav_file_path,
-                    csv_path=csv_file_path,
-                    pitch_max=conf.pitch_max,
-                    pitch_min=conf.pitch_min
-                )
-                file.write(script_content)
-            
-            # 检查脚本文件是否存在
-            if not os.path.exists(self._script_path):
-                raise FileNotFoundError(f"脚本文件不存在: {self._script_path}")
+            args, csv_file = self.prepare()
             
             # 执行Praat命令 - 根据可执行文件名称调整命令行参数
-            praat_path = conf.praat_path
-            
-            # 检查Praat可执行文件是否存在
-            if not os.path.exists(praat_path):
-                log.warning(f"Praat可执行文件不存在: {praat_path}")
-                
-                # 如果在PyInstaller环境中，尝试从资源目录加载
-                if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-                    # 尝试其他可能的路径
-                    alternative_paths = [
-                        os.path.join(sys._MEIPASS, 'praat', 'Praat.exe'),
-                        os.path.join(sys._MEIPASS, 'Praat.exe'),
-                        os.path.join(os.path.dirname(sys.executable), 'praat', 'Praat.exe'),
-                        os.path.join(os.path.dirname(sys.executable), 'Praat.exe')
-                    ]
-                    
-                    for alt_path in alternative_paths:
-                        log.info(f"尝试替代Praat路径: {alt_path}")
-                        if os.path.exists(alt_path):
-                            praat_path = alt_path
-                            log.info(f"找到Praat可执行文件: {praat_path}")
-                            break
-                    else:
-                        log.error("无法找到Praat可执行文件，分析将失败")
-            
-            log.info(f"使用Praat路径: {praat_path}")
-            cmd = f'"{praat_path}" --run "{self._script_path}"'
+            cmd = f'"{args[0]}" --run "{self._script_path}"'
             
             log.info(f"执行Praat命令: {cmd}")
             
-            result = subprocess.check_output(cmd, shell=True)
-            
-            # 检查CSV文件是否生成
-            if not os.path.exists(csv_file):
-                log.error(f"CSV文件未生成: {csv_file}")
-                # 创建一个空的DataFrame
-                return pd.DataFrame(columns=['pitch'])
+            # Praat在独立的进程组中运行，分析被取消时连同shell一起终止
+            returncode, stdout, stderr = simple_cancel.run_process(cmd, shell=True)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
             
-            # 解析结果
-            if return_pandas_df:
-                df = pd.read_csv(csv_file, names=['pitch'])
-                return df
-            else:
-                with open(csv_file, 'r') as f:
-                    data = f.read()
-                return data
+            return self.read_result(csv_file, return_pandas_df)
         except Exception as e:
             log.error(f"Praat分析失败: {traceback.format_exc()}")
             # 创建一个空的DataFrame作为备用
             if return_pandas_df:
-                return pd.DataFrame(columns=['pitch'])
+                return empty_pitch()
             else:
                 return ""
         finally:
             # 清理临时文件
-            try:
-                if 'csv_file' in locals() and os.path.exists(csv_file):
-                    delete_file(csv_file)
-                delete_file(self._script_path)
-            except:
-                pass
+            self.cleanup(csv_file)
 
     @staticmethod
     def parse_output(result):
@@ -173,30 +264,30 @@ class Praat:
         try:
             filename = result.decode('utf-8').replace('"', '').replace('\n', '')
             if os.path.exists(filename):
-                df = pd.read_csv(filename, names=['pitch'])
+                df = read_pitch_csv(filename)
                 delete_file(filename)
                 return df
             else:
                 log.error(f"CSV文件不存在: {filename}")
                 # 返回空的DataFrame
-                return pd.DataFrame(columns=['pitch'])
+                return empty_pitch()
         except Exception as e:
             log.error(f"解析输出失败: {str(e)}")
-            return pd.DataFrame(columns=['pitch'])
+            return empty_pitch()
 
     @staticmethod
     def _parse_output(result):
         """从CSV文件读取基频数据"""
         try:
             if isinstance(result, str):
-                df = pd.read_csv(result, names=['pitch'])
+                df = read_pitch_csv(result)
             else:
                 # 如果是StringIO对象
-                df = pd.read_csv(result, names=['pitch'])
+                df = read_pitch_csv(result)
             return df
         except Exception as e:
             log.error(f"解析CSV失败: {str(e)}")
-            return pd.DataFrame(columns=['pitch'])
+            return empty_pitch()
 
     @staticmethod
     def parse_output_raw_string(result):
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+# 各阶段完成时的进度估计（百分比）；Praat基频提取通常占大部分耗时
+STAGE_PERCENT_URL = {
+    'downloaded': 20,
+    'converted': 40,
+    'pitch_extracted': 90,
+    'scored': 100,
+}
+
+STAGE_PERCENT_FILE = {
+    'converted': 30,
+    'pitch_extracted': 90,
+    'scored': 100,
+}
+
+class ProgressReporter:
+    def __init__(self, callback=None, stages=STAGE_PERCENT_FILE, request_id=None):
+        """
+        初始化进度事件发送器
+
+        参数:
+            callback: 接收进度事件字典的回调函数，为None时不发送任何事件
+            stages: 阶段名称到进度百分比的映射
+            request_id: 请求ID，非None时附加到每个事件中
+        """
+        self.callback = callback
+        self.stages = stages
+        self.request_id = request_id
+        self.started = time.time()
+        self._last = self.started
+
+    def __call__(self, stage, **details):
+        """
+        发送一个阶段完成事件
+
+        参数:
+            stage: 阶段名称（downloaded、converted、pitch_extracted、scored）
+            details: 附加信息，例如基频帧数 frames
+        """
+        now = time.time()
+        event = {
+            'type': 'progress',
+            'stage': stage,
+            'percent': self.stages.get(stage),
+            'timestamp': now,
+            'elapsed': round(now - self.started, 3),
+            'stage_seconds': round(now - self._last, 3),
+        }
+        event.update(details)
+        if self.request_id is not None:
+            event['id'] = self.request_id
+        self._last = now
+
+        if self.callback is None:
+            return
+        try:
+            self.callback(event)
+        except Exception as e:
+            # 进度事件只用于展示和调度，发送失败不影响分析本身
+            log.warning(f"发送进度事件失败: {str(e)}")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import threading
+import contextlib
+from collections import deque
+import simple_logger
+import simple_cancel
+import simple_autotune
+
+log = simple_logger.get_logger(__name__)
+
+# 优先级：交互请求（桌面/网页界面）优先于批量请求
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+# 批量请求排队超过多少秒后按交互请求对待，保证批量任务在持续的交互负载下仍能推进
+DEFAULT_AGING = 30.0
+
+# 还没有完成过任务、也没有调优配置时估计的单个任务耗时（秒），用于计算 retry_after
+DEFAULT_JOB_SECONDS = 5.0
+
+class QueueFull(Exception):
+    """排队的任务已达上限，请求被立即拒绝"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def normalize_priority(value, default=INTERACTIVE):
+    """
+    校验请求中的 priority 字段
+
+    参数:
+        value: interactive、bulk 或 None
+        default: 未指定时使用的优先级
+
+    返回:
+        优先级名称
+    """
+    if value is None or value == '':
+        return default
+    if value not in PRIORITIES:
+        raise ValueError(f"无效的优先级: {value}（可选 {', '.join(PRIORITIES)}）")
+    return value
+
+class PriorityScheduler:
+    def __init__(self, capacity, limits=None, aging=DEFAULT_AGING, budget_mb=0, max_queue=0):
+        """
+        初始化优先级调度器
+
+        交互请求优先获得执行名额；每个优先级有各自的并发上限，
+        批量请求默认最多占用 capacity-1 个名额，为交互请求保留至少一个；
+        排队超过 aging 秒的批量请求按交互请求对待。
+
+        每个任务带有估计的内存占用（cost，MB），正在执行的任务估计总量不超过 budget_mb，
+        队首的任务放不下时等待（没有任务在执行时总会放行，避免超大任务永远无法执行）；
+        排队的任务超过 max_queue 时新任务被立即拒绝。
+
+        参数:
+            capacity: 同时执行的任务总数
+            limits: 各优先级的并发上限，例如 {'bulk': 2}
+            aging: 批量请求提升优先级前的最长排队时间（秒），0为不提升
+            budget_mb: 正在执行的任务估计内存总量上限（MB），0为不限制
+            max_queue: 排队任务数上限，0为不限制
+        """
+        self.capacity = max(1, capacity)
+        self.limits = {INTERACTIVE: self.capacity, BULK: max(1, self.capacity - 1)}
+        self.limits.update({k: v for k, v in (limits or {}).items() if v})
+        self.aging = aging
+        self.budget_mb = budget_mb
+        self.max_queue = max_queue
+        self.promoted = 0
+        self.rejected = 0
+        # 初始值取 --autotune 测得的单个请求平均耗时，之后按实际耗时更新
+        self.avg_seconds = simple_autotune.load_tuned_config().get('job_seconds') or DEFAULT_JOB_SECONDS
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._used_mb = 0.0
+        self._cond = threading.Condition()
+        # 已分到名额的 slot() 排队标识 -> 实际分配名额时的优先级（排队期间可能被提升）
+        self._granted = {}
+
+    def retry_after(self):
+        """估计排队的任务全部开始执行前需要等待的秒数"""
+        return max(1, math.ceil(self.avg_seconds * (len(self) + 1) / self.capacity))
+
+    def push(self, item, priority=INTERACTIVE, front=False, cost=0):
+        """
+        任务排队
+
+        参数:
+            item: 任务
+            priority: 优先级
+            front: 是否排在同优先级队列的最前面（重新排队的任务不受 max_queue 限制）
+            cost: 估计的内存占用（MB）
+        """
+        if not front and self.max_queue and len(self) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"排队的请求已达上限（{self.max_queue}），请稍后重试", self.retry_after())
+
+        entry = (time.monotonic(), item, cost)
+        if front:
+            self._queues[priority].appendleft(entry)
+        else:
+            self._queues[priority].append(entry)
+
+    def _eligible(self, priority):
+        return self._queues[priority] and self._running[priority] < self.limits[priority]
+
+    def pop(self):
+        """
+        取出下一个可以执行的任务（调用方执行完后必须调用 release）
+
+        返回:
+            (任务, 优先级, 估计内存)，没有可执行的任务、名额已满或内存预算不足时返回None
+        """
+        if sum(self._running.values()) >= self.capacity:
+            return None
+
+        bulk_aged = (
+            self.aging
+            and self._queues[BULK]
+            and time.monotonic() - self._queues[BULK][0][0] >= self.aging
+        )
+        if self._eligible(BULK) and bulk_aged:
+            priority = BULK
+        elif self._eligible(INTERACTIVE):
+            priority = INTERACTIVE
+        elif self._eligible(BULK):
+            priority = BULK
+        else:
+            return None
+
+        _, item, cost = self._queues[priority][0]
+        if self.budget_mb and self._used_mb > 0 and self._used_mb + cost > self.budget_mb:
+            # 队首任务等待内存释放，不让后面较小的任务插队，避免大任务饿死
+            return None
+
+        self._queues[priority].popleft()
+        if priority == BULK and bulk_aged:
+            self.promoted += 1
+        self._running[priority] += 1
+        self._used_mb += cost
+        return item, priority, cost
+
+    def release(self, priority, cost=0, seconds=None):
+        """
+        任务执行完成，归还名额和内存预算
+
+        参数:
+            priority: 任务的优先级
+            cost: 任务的估计内存（MB）
+            seconds: 任务耗时，用于估计 retry_after
+        """
+        self._running[priority] -= 1
+        self._used_mb = max(0.0, self._used_mb - cost)
+        if seconds is not None:
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+
+    def remove(self, predicate, priority=None):
+        """
+        移除第一个满足条件的排队任务
+
+        参数:
+            predicate: 接收任务、返回是否匹配的函数
+            priority: 只在该优先级的队列中查找，默认查找所有队列
+
+        返回:
+            (任务, 优先级, 估计内存)，未找到时返回None
+        """
+        for queue_priority, queue in self._queues.items():
+            if priority is not None and queue_priority != priority:
+                continue
+            for entry in queue:
+                if predicate(entry[1]):
+                    queue.remove(entry)
+                    return entry[1], queue_priority, entry[2]
+        return None
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """获取调度器状态"""
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'limits': dict(self.limits),
+                'running': dict(self._running),
+                'queued': {priority: len(queue) for priority, queue in self._queues.items()},
+                'promoted': self.promoted,
+                'budget_mb': self.budget_mb,
+                'used_mb': round(self._used_mb, 1),
+                'max_queue': self.max_queue,
+                'rejected': self.rejected,
+                'avg_seconds': round(self.avg_seconds, 3),
+            }
+
+    @contextlib.contextmanager
+    def slot(self, priority=INTERACTIVE, cost=0, ticket=None):
+        """
+        多线程使用：阻塞直到获得一个执行名额（排队已满时抛出 QueueFull，
+        排队期间当前上下文的分析被取消时抛出 AnalysisCancelled）
+
+        参数:
+            priority: 优先级
+            cost: 估计的内存占用（MB）
+            ticket: 排队标识，用于在排队期间调用 promote，默认新建
+        """
+        if ticket is None:
+            ticket = object()
+        with self._cond:
+            self.push(ticket, priority, cost=cost)
+            try:
+                while ticket not in self._granted:
+                    self._dispatch()
+                    if ticket in self._granted:
+                        break
+                    # 定时醒来，让排队的批量请求按时提升优先级，并检查是否已被取消
+                    self._cond.wait(timeout=1.0)
+                    simple_cancel.check()
+            except simple_cancel.AnalysisCancelled:
+                # 排队中被取消：移出队列；刚刚分到的名额交还给其他任务
+                if ticket in self._granted:
+                    self.release(self._granted.pop(ticket), cost)
+                    self._dispatch()
+                else:
+                    self.remove(lambda entry: entry is ticket)
+                raise
+            # 按实际分配名额时的优先级归还
+            priority = self._granted.pop(ticket)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.release(priority, cost, time.monotonic() - started)
+                self._dispatch()
+                self._cond.notify_all()
+
+    def promote(self, ticket, priority=INTERACTIVE):
+        """
+        多线程使用：把在 slot() 中排队的批量任务提升为更高的优先级（已经开始执行的任务不受影响）
+
+        参数:
+            ticket: 传给 slot() 的排队标识
+            priority: 提升后的优先级
+
+        返回:
+            是否提升了排队中的任务
+        """
+        with self._cond:
+            moved = self.remove(lambda entry: entry is ticket, BULK)
+            if moved is None:
+                return False
+            self.push(ticket, priority, cost=moved[2])
+            self._dispatch()
+            return True
+
+    def _dispatch(self):
+        """在持有锁时分配空闲名额，并唤醒获得名额的线程"""
+        granted = False
+        while True:
+            entry = self.pop()
+            if entry is None:
+                break
+            self._granted[entry[0]] = entry[1]
+            granted = True
+        if granted:
+            self._cond.notify_all()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import simple_logger
+import simple_config
+import simple_utils
+import simple_cache
+import simple_cancel
+from simple_pool import WorkerPool
+from simple_singleflight import SingleFlight, key_for_request
+from simple_scheduler import PriorityScheduler, QueueFull, normalize_priority, BULK, INTERACTIVE, DEFAULT_AGING
+from simple_admission import estimate_request_mb
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 请求体大小上限（字节）
+MAX_BODY_SIZE = 100 * 1024 * 1024
+
+# 单次批量请求最多包含的条目数
+MAX_BATCH_ITEMS = 1000
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    分析服务的HTTP请求处理器
+
+    接口:
+        GET  /health         进程池、调度器、结果缓存和基频轨迹缓存状态
+        POST /analyze/file   JSON {"file", "gender"}，或直接上传音频内容（性别通过 ?gender= 指定）
+        POST /analyze/url    JSON {"url", "gender"}
+        POST /analyze/batch  JSON {"items": [{"file"|"url", "gender", "id"}, ...]}
+        POST /cancel         JSON {"id"}
+
+    所有分析请求都可以带 priority（interactive 或 bulk），单个请求默认为 interactive，
+    批量请求中的条目默认为 bulk。
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError(f"请求体过大: {length} 字节")
+        return self.rfile.read(length) if length else b''
+
+    def _read_json(self):
+        body = self._read_body()
+        data = json.loads(body.decode('utf-8') or '{}')
+        if not isinstance(data, dict):
+            raise ValueError("请求体必须是JSON对象")
+        return data
+
+    def _submit(self, request):
+        response = self.server.submit(request)
+        if response.get('status') == 'rejected':
+            # 过载时立即拒绝，提示客户端多久后重试
+            self._send_json(503, response, {'Retry-After': str(response['retry_after'])})
+            return
+        status = {'ok': 200, 'cancelled': 409}.get(response.get('status'), 500)
+        self._send_json(status, response)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            cache = simple_cache.get_cache()
+            pitch_cache = simple_cache.get_pitch_cache()
+            url_cache = simple_cache.get_url_cache()
+            fingerprint_index = simple_cache.get_fingerprint_index()
+            self._send_json(200, {
+                'status': 'ok',
+                'pool': self.server.pool.stats(),
+                'scheduler': self.server.scheduler.stats(),
+                'coalesced': self.server.flight.stats(),
+                'cache': cache.stats() if cache is not None else None,
+                'pitch_cache': pitch_cache.stats() if pitch_cache is not None else None,
+                'url_cache': url_cache.stats() if url_cache is not None else None,
+                'fingerprint_index': fingerprint_index.stats() if fingerprint_index is not None else None
+            })
+        else:
+            self._send_json(404, {'status': 'error', 'error': f"未知路径: {path}"})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        try:
+            if parsed.path == '/analyze/file':
+                self._analyze_file(parse_qs(parsed.query))
+            elif parsed.path == '/analyze/url':
+                request = self._read_json()
+                if not request.get('url'):
+                    raise ValueError('必须指定URL')
+                self._submit({
+                    'id': request.get('id'),
+                    'url': request['url'],
+                    'gender': request.get('gender'),
+                    'priority': normalize_priority(request.get('priority'))
+                })
+            elif parsed.path == '/analyze/batch':
+                self._analyze_batch(self._read_json())
+            elif parsed.path == '/cancel':
+                request = self._read_json()
+                if request.get('id') is None:
+                    raise ValueError('必须指定要取消的请求ID')
+                cancelled = self.server.cancel(request['id'])
+                self._send_json(200, {'id': request['id'], 'status': 'ok', 'cancelled': cancelled})
+            else:
+                self._send_json(404, {'status': 'error', 'error': f"未知路径: {parsed.path}"})
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'status': 'error', 'error': str(e)})
+        except Exception as e:
+            log.error(f"处理请求失败: {str(e)}")
+            self._send_json(500, {'status': 'error', 'error': str(e)})
+
+    def _analyze_file(self, query):
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            request = self._read_json()
+            if not request.get('file'):
+                raise ValueError('必须指定文件路径')
+            self._submit({
+                'id': request.get('id'),
+                'file': request['file'],
+                'gender': request.get('gender'),
+                'priority': normalize_priority(request.get('priority'))
+            })
+            return
+
+        # 直接上传的音频内容，先保存为临时文件
+        body = self._read_body()
+        if not body:
+            raise ValueError('上传内容为空')
+
+        gender = query.get('gender', [None])[0]
+        request_id = query.get('id', [None])[0]
+        priority = normalize_priority(query.get('priority', [None])[0])
+        upload_path = os.path.join(conf.temp_dir, f"{simple_utils.generate_unique_id()}.upload")
+        try:
+            with open(upload_path, 'wb') as f:
+                f.write(body)
+            self._submit({'id': request_id, 'file': upload_path, 'gender': gender, 'priority': priority})
+        finally:
+            simple_utils.delete_file(upload_path)
+
+    def _analyze_batch(self, request):
+        items = request.get('items')
+        if not isinstance(items, list) or not items:
+            raise ValueError('items 必须是非空数组')
+        if len(items) > MAX_BATCH_ITEMS:
+            raise ValueError(f"批量请求条目过多: {len(items)} > {MAX_BATCH_ITEMS}")
+
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f"第 {i} 个条目必须是JSON对象")
+            item.setdefault('id', i)
+            item['priority'] = normalize_priority(item.get('priority'), BULK)
+
+        results = list(self.server.executor.map(self.server.submit, items))
+        self._send_json(200, {'status': 'ok', 'results': results})
+
+class AnalysisServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, scheduler=None):
+        """
+        初始化分析服务
+
+        参数:
+            address: (host, port) 监听地址
+            pool: 已启动的 WorkerPool
+            scheduler: PriorityScheduler，默认按进程池大小创建
+        """
+        super().__init__(address, AnalysisRequestHandler)
+        self.pool = pool
+        self.scheduler = scheduler if scheduler is not None else PriorityScheduler(pool.size)
+        self.executor = ThreadPoolExecutor(max_workers=pool.size)
+        self.flight = SingleFlight()
+        # 进行中的请求：内部序号 -> (请求字典, 取消令牌)；交给工作进程时也用内部序号标识，
+        # 请求ID由客户端提供，可能重复或缺失
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._inflight = {}
+        # 在调度器中排队的合并领头请求：合并键 -> 排队标识，交互请求合并进来时用于提升优先级
+        self._queued = {}
+
+    def _run(self, request, seq, key=None):
+        """按请求的优先级和估计内存排队，获得名额后交给工作进程处理；排队已满时立即拒绝"""
+        ticket = object()
+        if key is not None:
+            with self._lock:
+                self._queued[key] = ticket
+        try:
+            with self.scheduler.slot(request.get('priority', INTERACTIVE), estimate_request_mb(request), ticket):
+                self._unqueue(key, ticket)
+                return self.pool.submit(request, seq)
+        except QueueFull as e:
+            log.warning(f"请求 {request.get('id')} 被拒绝: {str(e)}")
+            return {'id': request.get('id'), 'status': 'rejected', 'error': str(e), 'retry_after': e.retry_after}
+        finally:
+            self._unqueue(key, ticket)
+
+    def _unqueue(self, key, ticket):
+        if key is not None:
+            with self._lock:
+                if self._queued.get(key) is ticket:
+                    del self._queued[key]
+
+    def submit(self, request):
+        """
+        提交分析请求：相同音频、性别和分析参数的并发请求只交给工作进程处理一次
+
+        参数:
+            request: 请求字典
+
+        返回:
+            带有本请求ID的响应字典
+        """
+        token = simple_cancel.CancelToken()
+        with self._lock:
+            seq = next(self._counter)
+            self._inflight[seq] = (request, token)
+        try:
+            key = key_for_request(request)
+            if key is not None and request.get('priority', INTERACTIVE) == INTERACTIVE:
+                # 交互请求合并到排队中的批量请求时，与fork模式一样把该批量请求提升为交互优先级
+                with self._lock:
+                    ticket = self._queued.get(key)
+                if ticket is not None and self.scheduler.promote(ticket):
+                    log.info(f"请求 {request.get('id')} 合并到排队中的批量请求，提升为交互优先级")
+            # 合并到其他请求上等待时，取消令牌让本请求退出等待，不影响正在处理的请求
+            with simple_cancel.scope(token):
+                response, shared = self.flight.do(key, lambda publish: self._run(request, seq, key))
+            if not shared:
+                return response
+            if response.get('status') == 'cancelled' and response.get('id') != request.get('id'):
+                # 被取消的是合并的另一个请求，本请求单独重新处理
+                return self._run(request, seq)
+            return dict(response, id=request.get('id'))
+        except simple_cancel.AnalysisCancelled as e:
+            return {'id': request.get('id'), 'status': 'cancelled', 'error': str(e) or '已取消'}
+        finally:
+            with self._lock:
+                del self._inflight[seq]
+
+    def cancel(self, request_id):
+        """
+        取消请求：正在工作进程中处理的请求终止处理，合并到其他请求上等待的请求退出等待
+
+        参数:
+            request_id: 请求ID
+
+        返回:
+            是否找到了要取消的请求
+        """
+        with self._lock:
+            matched = [(seq, token) for seq, (request, token) in self._inflight.items() if request.get('id') == request_id]
+        found = False
+        for seq, token in matched:
+            # 排队中或合并等待中的请求通过令牌退出，已交给工作进程的请求按内部序号取消
+            token.cancel(f"请求 {request_id} 被取消")
+            found = self.pool.cancel(seq) or found
+        return found or bool(matched)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+def serve_http(handler, host='127.0.0.1', port=8765, workers=None, max_requests=0, max_rss_mb=0,
+               bulk_limit=None, aging=DEFAULT_AGING, budget_mb=0, max_queue=0, thread_budget=None, pin_cpus=False):
+    """
+    启动本地HTTP分析服务
+
+    参数:
+        handler: 请求处理函数，接收请求字典，返回响应字典
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数量，默认为CPU核数
+        max_requests: 每个工作进程处理多少个请求后回收（0为不限制）
+        max_rss_mb: 工作进程内存超过多少MB后回收（0为不限制）
+        bulk_limit: 同时处理的批量请求数上限，默认为工作进程数减一
+        aging: 批量请求排队超过多少秒后按交互请求对待
+        budget_mb: 同时处理的请求估计内存总量上限（MB），0为不限制
+        max_queue: 排队请求数上限，超过时返回503和Retry-After（0为不限制）
+        thread_budget: 每个工作进程的线程预算，默认按工作进程数平均分配CPU
+        pin_cpus: 是否把每个工作进程绑定到各自的CPU上
+
+    返回:
+        进程退出码
+    """
+    with WorkerPool(handler, workers, max_requests, max_rss_mb, thread_budget, pin_cpus) as pool:
+        scheduler = PriorityScheduler(pool.size, {BULK: bulk_limit}, aging, budget_mb, max_queue)
+        server = AnalysisServer((host, port), pool, scheduler)
+        log.info(f"分析服务已启动: http://{host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log.info("收到中断信号，正在关闭分析服务")
+        finally:
+            server.server_close()
+    return 0
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import threading
+import simple_logger
+import simple_config
+import simple_cancel
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 跟随者等待领头请求时检查自身是否被取消的间隔（秒）
+_WAIT_INTERVAL = 0.2
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的SHA-1摘要
+
+    参数:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    返回:
+        十六进制摘要字符串
+    """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_identity(file_path):
+    """
+    本地文件的标识：绝对路径、大小和修改时间（只读取文件元数据，不读取内容）
+
+    参数:
+        file_path: 文件路径
+
+    返回:
+        标识字符串
+    """
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def request_key(url=None, file_path=None, gender=None, digest=None, quick=False):
+    """
+    生成用于合并相同分析请求的键：URL或文件内容摘要 + 性别 + 分析参数
+
+    参数:
+        url: 音频文件URL
+        file_path: 本地音频文件路径
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+        digest: 已经计算好的文件内容摘要（content_hash），避免重复读取文件
+        quick: 本地文件按路径、大小和修改时间生成键，不读取文件内容（在单线程的事件循环中使用，
+               内容相同但路径不同的文件不会合并）
+
+    返回:
+        键字符串；文件无法读取时返回None（不合并，按原流程报错）
+    """
+    if url:
+        source = f"url:{url}"
+    elif digest:
+        source = f"sha1:{digest}"
+    elif file_path:
+        try:
+            source = f"file:{file_identity(file_path)}" if quick else f"sha1:{content_hash(file_path)}"
+        except OSError:
+            return None
+    else:
+        return None
+    return json.dumps([source, gender, conf.pitch_min, conf.pitch_max])
+
+def key_for_request(request, quick=False):
+    """
+    根据请求字典生成合并键（参数不合法的请求不合并，交给handler报错）
+
+    参数:
+        request: 请求字典，包含 file 或 url、gender
+        quick: 本地文件不读取内容，见 request_key
+
+    返回:
+        键字符串或None
+    """
+    gender = request.get('gender')
+    if gender is not None:
+        try:
+            gender = int(gender)
+        except (TypeError, ValueError):
+            return None
+    if request.get('url') and request.get('file'):
+        return None
+    return request_key(request.get('url'), request.get('file'), gender, quick=quick)
+
+class _Call:
+    def __init__(self):
+        """进行中的一次计算"""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.subscribers = []
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        """
+        初始化请求合并器
+
+        相同键的并发调用只执行一次，其余调用等待并共享同一个结果（或异常）。
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def _publish(self, call, event):
+        """把领头调用的进度事件转发给所有订阅者"""
+        with self._lock:
+            subscribers = list(call.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                log.warning(f"转发进度事件失败: {str(e)}")
+
+    def do(self, key, fn, subscriber=None):
+        """
+        执行或加入一次计算
+
+        参数:
+            key: 合并键，为None时直接执行不合并
+            fn: 计算函数，接收一个进度发布函数作为参数
+            subscriber: 接收进度事件的回调函数（领头和跟随的调用都会收到）
+
+        返回:
+            (结果, 是否与其他调用共享)
+        """
+        if key is None:
+            return fn(subscriber or (lambda event: None)), False
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.executed += 1
+                else:
+                    call.waiters += 1
+                    self.shared += 1
+                if subscriber is not None:
+                    call.subscribers.append(subscriber)
+
+            if leader:
+                try:
+                    call.result = fn(lambda event: self._publish(call, event))
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+                return call.result, call.waiters > 0
+
+            # 跟随者：等待领头的调用完成，期间自身被取消时立即退出
+            try:
+                while not call.done.wait(_WAIT_INTERVAL):
+                    simple_cancel.check()
+            except BaseException:
+                # 不再等待：从这次调用中移除，领头调用不再把结果计为共享
+                with self._lock:
+                    call.waiters -= 1
+                raise
+            finally:
+                if subscriber is not None:
+                    with self._lock:
+                        if subscriber in call.subscribers:
+                            call.subscribers.remove(subscriber)
+
+            if isinstance(call.error, simple_cancel.AnalysisCancelled):
+                # 被取消的是领头的请求而不是本请求，重新执行
+                log.info("合并的领头请求已取消，重新执行")
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+    def stats(self):
+        """获取合并统计"""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {'executed': self.executed, 'shared': self.shared, 'in_flight': in_flight}
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import sqlite3
+import numpy as np
+import simple_logger
+import simple_model
+from simple_channel import encode_frame
+
+log = simple_logger.get_logger(__name__)
+
+# 辅音色最多3个，按位置展开为 sub1_*、sub2_*、sub3_* 列
+MAX_SUB = 3
+
+# 阶段名称对应的耗时列
+STAGE_COLUMNS = {
+    'downloaded': 'download_seconds',
+    'converted': 'convert_seconds',
+    'pitch_extracted': 'pitch_seconds',
+    'scored': 'score_seconds',
+}
+
+# 按文件扩展名选择输出格式
+SINK_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+}
+
+SINK_FORMATS = ('jsonl', 'parquet', 'arrow', 'sqlite')
+
+# 列名和类型（类型用于SQLite建表和Arrow schema）
+_COLUMNS = [
+    ('id', 'text'),
+    ('status', 'text'),
+    ('error', 'text'),
+    ('main_id', 'text'),
+    ('main_name', 'text'),
+    ('main_score', 'real'),
+] + [
+    (f"sub{i}_{field}", kind)
+    for i in range(1, MAX_SUB + 1)
+    for field, kind in (('id', 'text'), ('name', 'text'), ('score', 'real'))
+] + [
+    ('opposite_id', 'text'),
+    ('opposite_name', 'text'),
+] + [(column, 'real') for column in STAGE_COLUMNS.values()] + [
+    ('started_at', 'real'),
+    ('finished_at', 'real'),
+    ('seconds', 'real'),
+    ('similarity', 'vector'),
+]
+
+def sink_format(path, requested=None):
+    """
+    确定输出格式：优先使用指定的格式，否则按扩展名判断，默认为每行一个JSON
+
+    参数:
+        path: 输出文件路径，None为标准输出
+        requested: 指定的格式（jsonl、parquet、arrow、sqlite）
+
+    返回:
+        格式名称
+    """
+    if requested:
+        return requested
+    if path:
+        return SINK_EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'jsonl')
+    return 'jsonl'
+
+def model_order():
+    """相似度向量中各位置对应的模型（男性模型在前，女性模型在后）"""
+    simple_model.ensure_loaded()
+    return simple_model.male_models() + simple_model.female_models()
+
+def _text(value):
+    return None if value is None else str(value)
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def flatten(response, positions, started_at=None, finished_at=None):
+    """
+    把响应字典展开为一行
+
+    参数:
+        response: handle_request 返回的响应字典（带 detail 时包含相似度和各阶段耗时）
+        positions: 模型ID到相似度向量位置的映射
+        started_at: 开始分析的时间戳
+        finished_at: 分析完成的时间戳
+
+    返回:
+        列名到值的字典，相似度为float32数组（未参与比较的模型为NaN）
+    """
+    result = response.get('result') or {}
+    main = result.get('main') or {}
+    opposite = result.get('opposite_match') or {}
+    row = {
+        'id': _text(response.get('id')),
+        'status': response.get('status'),
+        'error': response.get('error'),
+        'main_id': _text(main.get('id')),
+        'main_name': main.get('name'),
+        'main_score': _number(main.get('score')),
+        'opposite_id': _text(opposite.get('id')),
+        'opposite_name': opposite.get('name'),
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'seconds': finished_at - started_at if started_at is not None and finished_at is not None else None,
+    }
+
+    subs = result.get('sub') or []
+    for i in range(MAX_SUB):
+        sub = subs[i] if i < len(subs) else {}
+        row[f"sub{i + 1}_id"] = _text(sub.get('id'))
+        row[f"sub{i + 1}_name"] = sub.get('name')
+        row[f"sub{i + 1}_score"] = _number(sub.get('score'))
+
+    timings = response.get('timings') or {}
+    for stage, column in STAGE_COLUMNS.items():
+        row[column] = timings.get(stage)
+
+    vector = np.full(len(positions), np.nan, dtype=np.float32)
+    for entry in result.get('similarities') or []:
+        position = positions.get(_text(entry.get('id')))
+        if position is not None:
+            vector[position] = entry['score']
+    row['similarity'] = vector
+    return row
+
+class ResultSink:
+    """批量结果的输出目标：write 可能只是缓存，flush 时批量写出，close 时写出剩余的行并关闭"""
+
+    # 是否需要在请求中附带 detail（相似度和各阶段耗时）
+    detail = False
+
+    def write(self, response, started_at=None, finished_at=None):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class JsonLinesSink(ResultSink):
+    def __init__(self, stream=None, owned=False):
+        """
+        每个结果一行JSON，立即写出（与原批量模式的输出相同）
+
+        参数:
+            stream: 输出流，默认为标准输出
+            owned: close 时是否关闭输出流
+        """
+        self.stream = stream or sys.stdout
+        self.owned = owned
+
+    def write(self, response, started_at=None, finished_at=None):
+        self.stream.write(encode_frame(response))
+        self.stream.flush()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+class _BufferedSink(ResultSink):
+    detail = True
+
+    def __init__(self, buffer_rows):
+        """
+        缓存展开后的行，达到 buffer_rows 行时批量写出
+
+        参数:
+            buffer_rows: 每批写出的行数
+        """
+        self.buffer_rows = buffer_rows
+        self.models = model_order()
+        self.positions = {str(model.id): i for i, model in enumerate(self.models)}
+        self.rows = []
+        self.written = 0
+
+    def write(self, response, started_at=None, finished_at=None):
+        self.rows.append(flatten(response, self.positions, started_at, finished_at))
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self._write_rows(self.rows)
+            self.written += len(self.rows)
+            log.debug(f"已写出 {len(self.rows)} 行结果")
+            self.rows = []
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+class SQLiteSink(_BufferedSink):
+    def __init__(self, path, buffer_rows=1000, append=False):
+        """
+        把结果批量插入SQLite
+
+        results 表每个结果一行，similarity 列为float32数组的字节（np.frombuffer 读取），
+        models 表记录相似度向量中每个位置对应的模型。
+
+        参数:
+            path: 数据库文件路径
+            buffer_rows: 每个事务插入的行数
+            append: 是否保留已有的结果（续跑任务表时使用）；否则清空 results 和 models 表
+        """
+        super().__init__(buffer_rows)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        types = {'text': 'TEXT', 'real': 'REAL', 'vector': 'BLOB'}
+        columns = ', '.join(f"{name} {types[kind]}" for name, kind in _COLUMNS)
+        current = [(i, str(model.id), model.name, int(model.gender)) for i, model in enumerate(self.models)]
+        with self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+            self._conn.execute('CREATE TABLE IF NOT EXISTS models (position INTEGER PRIMARY KEY, id TEXT, name TEXT, gender INTEGER)')
+            if not append:
+                self._conn.execute('DELETE FROM results')
+                self._conn.execute('DELETE FROM models')
+            stored = self._conn.execute('SELECT position, id, name, gender FROM models ORDER BY position').fetchall()
+            if not stored:
+                self._conn.executemany('INSERT INTO models VALUES (?, ?, ?, ?)', current)
+        if stored and stored != current:
+            # 已有结果的相似度向量按旧模型库的位置排列，追加新结果会被按错误的模型解读
+            self._conn.close()
+            raise ValueError(f"{path} 中已有结果使用的模型库与当前模型库不同，请换一个输出文件")
+        self._insert = f"INSERT INTO results VALUES ({', '.join('?' for _ in _COLUMNS)})"
+
+    def _write_rows(self, rows):
+        values = [
+            tuple(row[name].tobytes() if kind == 'vector' else row[name] for name, kind in _COLUMNS)
+            for row in rows
+        ]
+        with self._conn:
+            self._conn.executemany(self._insert, values)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+class ArrowSink(_BufferedSink):
+    def __init__(self, path, file_format='parquet', buffer_rows=10000):
+        """
+        把结果按批写入Parquet或Arrow IPC文件（需要可选依赖 pyarrow）
+
+        每 buffer_rows 行写出一个row group/record batch，similarity 列为 list<float32>，
+        向量中每个位置对应的模型ID保存在schema元数据 model_ids 中。
+
+        参数:
+            path: 输出文件路径
+            file_format: parquet 或 arrow
+            buffer_rows: 每批写出的行数
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError(f"输出 {file_format} 格式需要安装 pyarrow（pip install pyarrow）")
+
+        super().__init__(buffer_rows)
+        self.pa = pyarrow
+        types = {'text': pyarrow.string(), 'real': pyarrow.float64(), 'vector': pyarrow.list_(pyarrow.float32())}
+        self.schema = pyarrow.schema(
+            [(name, types[kind]) for name, kind in _COLUMNS],
+            metadata={'model_ids': ','.join(str(model.id) for model in self.models)}
+        )
+        if file_format == 'parquet':
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            import pyarrow.ipc
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def _write_rows(self, rows):
+        columns = []
+        for name, kind in _COLUMNS:
+            values = [row[name] for row in rows]
+            if kind == 'vector':
+                # 所有行的向量长度相同，直接由一整块float32数组构造list列
+                flat = self.pa.array(np.concatenate(values), type=self.pa.float32())
+                offsets = self.pa.array(np.arange(len(rows) + 1, dtype=np.int32) * len(self.models))
+                columns.append(self.pa.ListArray.from_arrays(offsets, flat))
+            else:
+                columns.append(self.pa.array(values, type=self.schema.field(name).type))
+        self._writer.write_batch(self.pa.RecordBatch.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+def _next_part(path):
+    """已有的Parquet/Arrow文件无法追加，续跑时写入同目录下编号递增的新文件（可作为一个数据集读取）"""
+    stem, ext = os.path.splitext(path)
+    part = 1
+    while os.path.exists(f"{stem}.{part}{ext}"):
+        part += 1
+    return f"{stem}.{part}{ext}"
+
+def open_sink(path=None, file_format=None, stream=None, append=False):
+    """
+    打开批量结果的输出目标
+
+    参数:
+        path: 输出文件路径，None为输出到 stream
+        file_format: jsonl、parquet、arrow 或 sqlite，默认按扩展名判断
+        stream: 没有指定路径时的输出流，默认为标准输出
+        append: 是否保留输出文件中已有的结果（续跑任务表时使用）
+
+    返回:
+        ResultSink 对象（由调用方负责 close）
+    """
+    file_format = sink_format(path, file_format)
+    if file_format != 'jsonl' and not path:
+        raise ValueError(f"{file_format} 格式需要用 -o 指定输出文件")
+
+    if file_format == 'sqlite':
+        return SQLiteSink(path, append=append)
+    if file_format in ('parquet', 'arrow'):
+        if append and os.path.exists(path):
+            path = _next_part(path)
+            log.info(f"续跑结果写入: {path}")
+        return ArrowSink(path, file_format)
+    if path:
+        return JsonLinesSink(open(path, 'a' if append else 'w', encoding='utf-8'), owned=True)
+    return JsonLinesSink(stream)
@@ -1,8 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import pandas as pd
-import numpy as np
 import simple_logger
 import simple_config
 
@@ -19,6 +17,8 @@ def get_pitch_percentage(pitch_tier):
     返回:
         包含基频ID和百分比的DataFrame
     """
+    import pandas as pd
+    
     # 检查是否有有效的基频数据
     if pitch_tier.empty:
         log.warning("基频数据为空，创建默认分布")
@@ -61,6 +61,8 @@ def fullfill(df):
     返回:
         补充后的DataFrame
     """
+    import pandas as pd
+    
     df['id'] = df.index
     p_list = []
     
@@ -85,6 +87,9 @@ def compare_pitch_similarity(pitch_this, pitch_that):
     返回:
         相似度得分 (0-1之间的浮点数)
     """
+    import numpy as np
+    import pandas as pd
+    
     try:
         # 检查输入数据是否有效
         if pitch_this.empty or pitch_that.empty:
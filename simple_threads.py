@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import simple_logger
+
+log = simple_logger.get_logger(__name__)
+
+# 每类库对应的线程数环境变量（必须在库导入之前设置）
+THREAD_ENV_VARS = {
+    # numpy/scipy 使用的 BLAS/LAPACK 以及 numexpr
+    'blas': ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'),
+    # librosa 依赖的 numba
+    'numba': ('NUMBA_NUM_THREADS',),
+    # src/voice_analyzer_fixed.py 中并行提取频谱特征的线程池
+    'features': ('VOICE_ANALYZER_THREADS',),
+}
+
+def default_threads(workers):
+    """
+    每个工作进程默认的线程数：CPU核数平均分给所有工作进程
+
+    参数:
+        workers: 工作进程数量
+
+    返回:
+        线程数（至少为1）
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers or 1))
+
+def parse_thread_budget(spec, workers):
+    """
+    解析线程预算
+
+    参数:
+        spec: None（按工作进程数自动分配）、"2"（所有库都用2个线程）
+              或 "blas=1,numba=2,features=1"（未指定的库自动分配）
+        workers: 工作进程数量
+
+    返回:
+        {'blas': n, 'numba': n, 'features': n}
+    """
+    threads = default_threads(workers)
+    budget = {name: threads for name in THREAD_ENV_VARS}
+    if not spec:
+        return budget
+
+    spec = str(spec).strip()
+    if spec.isdigit():
+        return {name: max(1, int(spec)) for name in THREAD_ENV_VARS}
+
+    for part in spec.split(','):
+        name, sep, value = part.partition('=')
+        name = name.strip()
+        if not sep or name not in THREAD_ENV_VARS or not value.strip().isdigit():
+            raise ValueError(f"无效的线程预算: {part}（格式为 blas=1,numba=1,features=1）")
+        budget[name] = max(1, int(value))
+    return budget
+
+def cpu_sets(workers, size):
+    """
+    把可用的CPU切成每个工作进程一块，CPU不足时循环分配
+
+    参数:
+        workers: 工作进程数量
+        size: 每块的CPU数量
+
+    返回:
+        CPU编号列表的列表，系统不支持绑定CPU时返回None
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    available = sorted(os.sched_getaffinity(0))
+    size = max(1, min(size, len(available)))
+    return [
+        [available[(i * size + j) % len(available)] for j in range(size)]
+        for i in range(max(1, workers or 1))
+    ]
+
+def apply_thread_budget(budget, cpus=None):
+    """
+    在当前进程中应用线程预算和CPU绑定
+
+    应在导入numpy/librosa之前调用；已经导入时尽量在运行时调整（需要可选依赖 threadpoolctl）。
+    设置的环境变量也会被本进程启动的子进程继承。
+
+    参数:
+        budget: parse_thread_budget 返回的字典
+        cpus: 绑定的CPU编号列表，None为不绑定
+    """
+    for name, threads in budget.items():
+        for var in THREAD_ENV_VARS[name]:
+            os.environ[var] = str(threads)
+
+    if 'numpy' in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(budget['blas'])
+        except ImportError:
+            log.debug("numpy已导入且未安装threadpoolctl，BLAS线程数要到新进程中才生效")
+
+    if 'numba' in sys.modules:
+        try:
+            import numba
+            numba.set_num_threads(min(budget['numba'], numba.config.NUMBA_NUM_THREADS))
+        except Exception as e:
+            log.debug(f"调整numba线程数失败: {str(e)}")
+
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        else:
+            log.warning("当前系统不支持绑定CPU，忽略 --pin-cpus")
+
+    log.info(f"进程 {os.getpid()} 线程预算: {budget}" + (f"，绑定CPU: {list(cpus)}" if cpus else ""))
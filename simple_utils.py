@@ -2,31 +2,251 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import uuid
-import requests
+import functools
+import threading
 import simple_logger
 import simple_config
 
 log = simple_logger.get_logger(__name__)
 conf = simple_config.get_config()
 
+# 下载限制的环境变量（由命令行参数设置，工作进程继承）
+DOWNLOAD_MAX_MB_ENV = 'VOICE_ANALYZER_DOWNLOAD_MAX_MB'
+DOWNLOAD_TIMEOUT_ENV = 'VOICE_ANALYZER_DOWNLOAD_TIMEOUT'
+
+# 单个音频的大小上限（MB，0为不限制）和读取超时（秒，连续这么久收不到数据即视为失败）
+DEFAULT_DOWNLOAD_MAX_MB = 200
+DEFAULT_DOWNLOAD_TIMEOUT = 30
+
+# 建立连接的超时和整个下载（包括重试）的最长时间（秒）
+CONNECT_TIMEOUT = 10
+DOWNLOAD_DEADLINE = 600
+
+# 失败后的重试次数和第一次重试前的等待时间（之后每次翻倍）
+DOWNLOAD_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+# 服务器暂时不可用时重试的状态码
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# 每次读取的字节数在该范围内按读取速度自动调整
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+class DownloadTooLarge(Exception):
+    """下载的文件超过大小上限（不重试）"""
+
+def per_process(factory):
+    """
+    把 factory 包装为按进程创建一次的获取函数
+
+    fork出的子进程不能继续使用父进程的SQLite连接和网络连接，进程号变化时重新调用 factory。
+    factory 返回None表示被禁用或无法创建，同一进程内不再重试。
+
+    参数:
+        factory: 无参数的创建函数
+
+    返回:
+        获取函数，返回本进程的对象或None
+    """
+    lock = threading.Lock()
+    state = {'pid': None, 'value': None}
+
+    @functools.wraps(factory)
+    def get():
+        if state['pid'] != os.getpid():
+            with lock:
+                if state['pid'] != os.getpid():
+                    state['value'] = factory()
+                    state['pid'] = os.getpid()
+        return state['value']
+    return get
+
+@per_process
+def get_session():
+    """
+    获取本进程共用的HTTP会话（连接池，同一主机的连接保持复用）
+
+    返回:
+        requests.Session 对象
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    # 重试由 fetch_file 负责（需要按已下载的字节数续传），连接池本身不重试
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _download_limits():
+    """从环境变量读取 (大小上限字节数（None为不限制）, 读取超时秒数)"""
+    max_mb = float(os.environ.get(DOWNLOAD_MAX_MB_ENV, DEFAULT_DOWNLOAD_MAX_MB))
+    timeout = float(os.environ.get(DOWNLOAD_TIMEOUT_ENV, DEFAULT_DOWNLOAD_TIMEOUT))
+    return (int(max_mb * 1024 * 1024) if max_mb > 0 else None), timeout
+
+def _expected_size(response):
+    """响应的完整文件大小（206时取自 Content-Range），未知时返回None"""
+    if response.status_code == 206:
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    # 压缩传输时 Content-Length 是压缩后的大小，不能用来判断
+    if length and length.isdigit() and not response.headers.get('Content-Encoding'):
+        return int(length)
+    return None
+
+def _retry_delay(attempt, response=None):
+    """第几次重试前的等待时间，服务器给出 Retry-After 秒数时以它为准（最多30秒）"""
+    delay = RETRY_BACKOFF * (2 ** attempt)
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        delay = max(delay, min(float(retry_after), 30.0))
+    return delay
+
 def download_file(url, save_path):
     """下载文件到指定路径"""
+    fetch_file(url, save_path)
+    return save_path
+
+def fetch_file(url, save_path, headers=None):
+    """
+    下载文件到指定路径（可带条件请求头）
+    
+    使用本进程共用的连接池；连接或读取超时、连接中断和5xx/429响应最多重试 DOWNLOAD_RETRIES 次，
+    已下载一部分时用 Range/If-Range 请求续传剩余部分（服务器不支持或文件已变化时重新下载）。
+    Content-Length 或已下载的字节数超过大小上限时立即中止。
+    
+    参数:
+        url: 文件URL
+        save_path: 保存路径
+        headers: 附加的请求头，例如 If-None-Match / If-Modified-Since
+    
+    返回:
+        (状态码, 响应头)；状态码为304时不写入文件
+    """
+    import requests
+    import simple_cancel
+    
+    max_bytes, read_timeout = _download_limits()
+    session = get_session()
+    deadline = time.monotonic() + DOWNLOAD_DEADLINE
+    received = 0
+    validator = None
+    first = None
+    attempt = 0
+    
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
         with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+            while True:
+                simple_cancel.check()
+                request_headers = dict(headers or {})
+                # 续传的 Range 按服务器发送的字节计算：要求不压缩传输，写入文件的字节数才与之一致
+                request_headers['Accept-Encoding'] = 'identity'
+                if received and validator:
+                    # 续传：条件请求头只用于第一次请求，之后以 If-Range 保证拼接的是同一个文件
+                    request_headers.pop('If-None-Match', None)
+                    request_headers.pop('If-Modified-Since', None)
+                    request_headers['Range'] = f"bytes={received}-"
+                    request_headers['If-Range'] = validator
+                
+                response = None
+                try:
+                    response = session.get(url, stream=True, headers=request_headers,
+                                           timeout=(CONNECT_TIMEOUT, read_timeout))
+                    if response.status_code == 304 and first is None:
+                        response.close()
+                        log.info(f"文件未修改: {url}")
+                        return response.status_code, response.headers
+                    if response.status_code in _RETRY_STATUS:
+                        raise requests.HTTPError(f"{response.status_code} {response.reason}", response=response)
+                    response.raise_for_status()
+                    
+                    if response.status_code != 206 and received:
+                        # 服务器不支持续传或文件已变化，从头下载
+                        log.info(f"服务器未续传，重新下载: {url}")
+                        f.seek(0)
+                        f.truncate()
+                        received = 0
+                    if first is None or not received:
+                        first = response
+                        # If-Range 不接受弱ETag
+                        etag = response.headers.get('ETag')
+                        validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+                        if response.headers.get('Content-Encoding', 'identity') != 'identity':
+                            # 服务器仍然压缩传输：已写入的是解压后的字节，无法续传，失败后从头下载
+                            validator = None
+                    
+                    expected = _expected_size(response)
+                    if max_bytes and expected and expected > max_bytes:
+                        raise DownloadTooLarge(f"文件大小 {expected} 字节超过上限 {max_bytes} 字节")
+                    
+                    received = _stream_to(response, f, received, max_bytes, deadline)
+                    if expected and received < expected:
+                        raise requests.ConnectionError(f"连接提前关闭: 已下载 {received}/{expected} 字节")
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                    # 已写入的部分保留，下次请求从这里续传
+                    received = f.tell()
+                    status = e.response.status_code if getattr(e, 'response', None) is not None else None
+                    retryable = status is None or status in _RETRY_STATUS
+                    delay = _retry_delay(attempt, response)
+                    if not retryable or attempt >= DOWNLOAD_RETRIES or time.monotonic() + delay > deadline:
+                        raise
+                    attempt += 1
+                    log.warning(f"下载失败，{delay:.1f}秒后第 {attempt} 次重试（已下载 {received} 字节）: {url}, 错误: {str(e)}")
+                    time.sleep(delay)
+                finally:
+                    if response is not None:
+                        response.close()
         
-        log.info(f"文件下载成功: {url} -> {save_path}")
-        return save_path
+        log.info(f"文件下载成功: {url} -> {save_path} ({received} 字节)")
+        return first.status_code, first.headers
     except Exception as e:
         log.error(f"文件下载失败: {url}, 错误: {str(e)}")
         raise
 
+def _stream_to(response, f, received, max_bytes, deadline):
+    """
+    把响应内容写入文件，每次读取的大小随读取速度调整
+    
+    返回:
+        写入后的总字节数
+    """
+    import requests
+    import simple_cancel
+    from urllib3.exceptions import ProtocolError, ReadTimeoutError
+    
+    chunk_size = MIN_CHUNK_SIZE * 4
+    while True:
+        # 每个数据块之间检查一次分析是否已被取消
+        simple_cancel.check()
+        started = time.monotonic()
+        if started > deadline:
+            raise requests.Timeout(f"下载超过 {DOWNLOAD_DEADLINE} 秒")
+        try:
+            chunk = response.raw.read(chunk_size, decode_content=True)
+        except ReadTimeoutError as e:
+            raise requests.Timeout(str(e))
+        except ProtocolError as e:
+            raise requests.ConnectionError(str(e))
+        if not chunk:
+            return received
+        received += len(chunk)
+        if max_bytes and received > max_bytes:
+            raise DownloadTooLarge(f"已下载超过 {received - len(chunk)} 字节，超过上限 {max_bytes} 字节")
+        f.write(chunk)
+        
+        # 读得快时加大数据块减少循环次数，读得慢时减小数据块以便及时响应取消
+        elapsed = time.monotonic() - started
+        if elapsed < 0.05 and len(chunk) == chunk_size:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+        elif elapsed > 0.5:
+            chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+
 def delete_file(file_path):
     """删除文件"""
     try:
@@ -5,78 +5,554 @@ import os
 import sys
 import argparse
 import json
+import sqlite3
 import simple_logger
 import simple_analyzer
 import simple_judger
+import simple_channel
+import simple_progress
+import simple_cancel
+import simple_singleflight
+import simple_cache
+import simple_utils
 import io
 import codecs
 import locale
 
-# 设置系统默认编码为 UTF-8
-if sys.platform == 'win32':
-    # 强制设置环境变量
-    os.environ['PYTHONIOENCODING'] = 'utf-8'
-    # 设置控制台代码页为 UTF-8
-    os.system('chcp 65001 > nul')
-    # 设置标准输出为UTF-8编码
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
-
-# 检查当前编码
-print(f"当前系统编码: {locale.getpreferredencoding()}")
-print(f"标准输出编码: {sys.stdout.encoding}")
-print(f"标准错误编码: {sys.stderr.encoding}")
-
 log = simple_logger.get_logger(__name__)
 
-def analyze_from_url(url, gender=None):
+# 合并相同的并发分析请求
+_flight = simple_singleflight.SingleFlight()
+
+def analyze_from_url(url, gender=None, progress=None, request_id=None):
     """
     从URL分析声音
     
+    同一URL、性别和分析参数的并发请求只下载和分析一次，其余请求等待并共享结果；
+    下载完成后按内容查找结果缓存，命中时不再转换和分析。
+    
     参数:
         url: 音频文件URL
         gender: 性别 (0为男性，1为女性，None为自动判断)
+        progress: 接收进度事件的回调函数
+        request_id: 附加到进度事件中的请求ID
     
     返回:
         分析结果
     """
-    try:
-        # 下载并转换音频
-        wav_path = simple_analyzer.analyze_audio(url)
-        
-        # 判断声音类型
-        result = simple_judger.judge_voice(wav_path, gender)
-        
-        return result
-    except Exception as e:
-        log.error(f"从URL分析声音失败: {str(e)}")
-        raise
+    key = simple_singleflight.request_key(url=url, gender=gender)
+    result, shared = _flight.do(
+        key,
+        lambda publish: _analyze_url(url, gender, publish),
+        _tag_progress(progress, request_id)
+    )
+    if shared:
+        log.info(f"与相同的并发请求共享分析结果: {url}")
+    return result
 
-def analyze_from_file(file_path, gender=None):
+def analyze_from_file(file_path, gender=None, progress=None, request_id=None):
     """
     从本地文件分析声音
     
+    内容相同（按SHA-1摘要）、性别和分析参数相同的并发请求只分析一次，其余请求等待并共享结果；
+    结果缓存中已有相同内容的结果时不再转换和分析。
+    
+    参数:
+        file_path: 本地音频文件路径
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+        progress: 接收进度事件的回调函数
+        request_id: 附加到进度事件中的请求ID
+    
+    返回:
+        分析结果
+    """
+    try:
+        digest = simple_singleflight.content_hash(file_path)
+    except OSError:
+        digest = None
+    key = simple_singleflight.request_key(file_path=file_path, gender=gender, digest=digest)
+    result, shared = _flight.do(
+        key,
+        lambda publish: _analyze_file(file_path, gender, publish, digest),
+        _tag_progress(progress, request_id)
+    )
+    if shared:
+        log.info(f"与相同的并发请求共享分析结果: {file_path}")
+    return result
+
+def analyze_range(start=None, end=None, file_path=None, url=None, gender=None, progress=None, request_id=None):
+    """
+    分析录音中截取的一段
+    
+    录音的带时间基频轨迹只提取一次并写入基频轨迹缓存，之后每次截取都只按帧时间切片，
+    重新统计基频分布并打分，不再运行FFmpeg和Praat。
+    
     参数:
+        start: 片段开始时间（秒），None为从头开始
+        end: 片段结束时间（秒），None为到结尾
         file_path: 本地音频文件路径
+        url: 音频文件URL（与 file_path 二选一）
         gender: 性别 (0为男性，1为女性，None为自动判断)
+        progress: 接收进度事件的回调函数
+        request_id: 附加到进度事件中的请求ID
     
     返回:
         分析结果
     """
+    if start is not None and end is not None and end <= start:
+        raise ValueError(f"无效的时间范围: {start} - {end}")
+    
+    digest = None
+    if file_path:
+        try:
+            digest = simple_singleflight.content_hash(file_path)
+        except OSError:
+            pass
+    key = simple_singleflight.request_key(url=url, file_path=file_path, gender=gender, digest=digest)
+    if key is not None:
+        key = json.dumps([key, start, end])
+    result, shared = _flight.do(
+        key,
+        lambda publish: _analyze_range(start, end, file_path, url, gender, publish, digest),
+        _tag_progress(progress, request_id)
+    )
+    if shared:
+        log.info(f"与相同的并发请求共享分析结果: {url or file_path} [{start}, {end}]")
+    return result
+
+def _tag_progress(progress, request_id):
+    """为转发给每个请求的进度事件附加各自的请求ID"""
+    if progress is None or request_id is None:
+        return progress
+    return lambda event: progress(dict(event, id=request_id))
+
+def _cached_result(digest, gender):
+    """
+    查找结果缓存
+
+    返回:
+        (缓存的结果或None, 缓存键, 随机种子)；缓存被禁用或无法计算摘要时缓存键和种子为None
+    """
+    cache = simple_cache.get_cache()
+    if cache is None or digest is None:
+        return None, None, None
+    key = simple_cache.cache_key(digest, gender)
+    try:
+        entry = cache.get(key)
+    except sqlite3.Error as e:
+        log.warning(f"读取结果缓存失败: {str(e)}")
+        entry = None
+    if entry is None:
+        return None, key, simple_cache.seed_for_key(key)
+    data, seed = entry
+    log.info(f"结果缓存命中: {key[:12]}")
+    return simple_judger.result_from_dict(data, gender), key, seed
+
+def _store_result(key, seed, result):
+    """把分析结果写入结果缓存（出错时的默认结果不缓存）"""
+    if key is None or result.fallback:
+        return
+    if not result.similarities:
+        # 没有与模型比较过（基频提取失败后的占位结果），缓存后即使Praat恢复正常也会一直返回占位结果
+        log.warning("分析结果没有模型相似度，不写入结果缓存")
+        return
+    try:
+        simple_cache.get_cache().put(key, seed, simple_judger.result_to_dict(result, detail=True))
+    except sqlite3.Error as e:
+        log.warning(f"写入结果缓存失败: {str(e)}")
+
+def _cached_pitch(cache, key):
+    """读取基频轨迹缓存，返回包含 time 和 pitch 列的DataFrame，未命中或出错时返回None"""
+    try:
+        track = cache.get(key)
+    except sqlite3.Error as e:
+        log.warning(f"读取基频轨迹缓存失败: {str(e)}")
+        return None
+    if track is None:
+        return None
+    import pandas as pd
+    return pd.DataFrame({'time': track[:, 0], 'pitch': track[:, 1]})
+
+def _store_pitch(cache, key, pitch_data):
+    """把带时间的基频轨迹写入缓存"""
+    try:
+        cache.put(key, pitch_data[['time', 'pitch']].to_numpy(dtype=float))
+    except sqlite3.Error as e:
+        log.warning(f"写入基频轨迹缓存失败: {str(e)}")
+
+def _record_features(digest, pitch_data, gender):
+    """把整段录音的基频分布直方图写入特征库（供更换模型库后批量重新打分）"""
+    import simple_features
+    store = simple_features.get_feature_store() if digest is not None else None
+    if store is None:
+        return
+    histogram = simple_features.pitch_histogram(pitch_data)
+    if histogram is None:
+        return
+    try:
+        store.put(digest, histogram, int(pitch_data['pitch'].notna().sum()), gender)
+    except sqlite3.Error as e:
+        log.warning(f"写入特征库失败: {str(e)}")
+
+def _audio_fingerprint(wav_path, digest):
+    """
+    计算转换后音频的指纹
+
+    返回:
+        (指纹索引, 指纹, 时长)，指纹索引被禁用、音频太短或无法读取时返回None
+    """
+    index = simple_cache.get_fingerprint_index() if digest is not None else None
+    if index is None:
+        return None
+    import simple_fingerprint
+    try:
+        fingerprint, duration = simple_fingerprint.fingerprint_file(wav_path)
+    except Exception as e:
+        log.warning(f"计算音频指纹失败: {str(e)}")
+        return None
+    if fingerprint is None:
+        return None
+    return index, fingerprint, duration
+
+def _judge_near_duplicate(fingerprint, digest, gender, reporter, seed, pitch_cache, pitch_key):
+    """
+    按音频指纹查找重新编码的副本：原音频的结果已缓存时直接使用，否则使用原音频的基频轨迹重新打分
+
+    返回:
+        VoiceResult对象，没有可复用的结果或基频轨迹时返回None
+    """
+    index, data, duration = fingerprint
     try:
-        # 转换音频
-        wav_path = simple_analyzer.analyze_local_file(file_path)
+        match = index.find(data, duration, exclude=digest)
+    except sqlite3.Error as e:
+        log.warning(f"查找音频指纹失败: {str(e)}")
+        return None
+    if match is None:
+        return None
+    original, rate = match
+    log.info(f"音频指纹与 {original[:12]} 近似重复（比特错误率 {rate:.3f}）")
+
+    cache = simple_cache.get_cache()
+    if cache is not None:
+        try:
+            entry = cache.get(simple_cache.cache_key(original, gender))
+        except sqlite3.Error as e:
+            log.warning(f"读取结果缓存失败: {str(e)}")
+            entry = None
+        if entry is not None:
+            reporter('scored', cached=True)
+            return simple_judger.result_from_dict(entry[0], gender)
+
+    if pitch_cache is not None:
+        pitch_data = _cached_pitch(pitch_cache, simple_cache.pitch_key(original))
+        if pitch_data is not None:
+            # 同时按本音频的摘要保存，下次直接命中
+            _store_pitch(pitch_cache, pitch_key, pitch_data)
+            reporter('pitch_extracted', frames=len(pitch_data), cached=True)
+            _record_features(digest, pitch_data, gender)
+            return simple_judger.judge_pitch(pitch_data, gender, reporter, seed)
+    return None
+
+def _judge_audio(digest, gender, reporter, seed, convert):
+    """
+    判断声音类型：基频轨迹缓存命中时直接打分；否则转换音频，
+    按音频指纹查找重新编码的副本，都没有时提取基频并写入缓存和指纹索引；
+    整段录音的基频分布同时记入特征库
+
+    参数:
+        digest: 音频内容摘要，None为不使用缓存
+        gender: 性别 (0为男性，1为女性，None为自动判断)
+        reporter: 进度事件发送器
+        seed: 随机选择辅音色的种子
+        convert: 转换音频的函数，返回WAV文件路径
+
+    返回:
+        VoiceResult对象
+    """
+    cache = simple_cache.get_pitch_cache() if digest is not None else None
+    pitch_key = simple_cache.pitch_key(digest) if cache is not None else None
+    if pitch_key is not None:
+        pitch_data = _cached_pitch(cache, pitch_key)
+        if pitch_data is not None:
+            log.info(f"基频轨迹缓存命中: {pitch_key[:12]}，只重新打分")
+            reporter('pitch_extracted', frames=len(pitch_data), cached=True)
+            _record_features(digest, pitch_data, gender)
+            return simple_judger.judge_pitch(pitch_data, gender, reporter, seed)
+    
+    wav_path = convert()
+    reporter('converted')
+    
+    fingerprint = _audio_fingerprint(wav_path, digest)
+    if fingerprint is not None:
+        result = _judge_near_duplicate(fingerprint, digest, gender, reporter, seed, cache, pitch_key)
+        if result is not None:
+            return result
+    
+    def on_pitch(pitch_data):
+        if pitch_key is not None:
+            _store_pitch(cache, pitch_key, pitch_data)
+        _record_features(digest, pitch_data, gender)
+        if fingerprint is not None:
+            index, data, duration = fingerprint
+            try:
+                index.add(digest, data, duration)
+            except sqlite3.Error as e:
+                log.warning(f"写入音频指纹失败: {str(e)}")
+    
+    return simple_judger.judge_voice(wav_path, gender, progress=reporter, seed=seed, on_pitch=on_pitch)
+
+def _analyze_url(url, gender, progress):
+    """下载、转换并分析URL音频"""
+    reporter = simple_progress.ProgressReporter(progress, simple_progress.STAGE_PERCENT_URL)
+    try:
+        # 下载音频
+        download_path = simple_analyzer.download_audio(url)
+        reporter('downloaded')
+        
+        # 按下载内容查找结果缓存
+        try:
+            digest = simple_singleflight.content_hash(download_path)
+        except OSError:
+            digest = None
+        cached, key, seed = _cached_result(digest, gender)
+        if cached is not None:
+            simple_utils.delete_file(download_path)
+            reporter('scored', cached=True)
+            return cached
         
-        # 判断声音类型
-        result = simple_judger.judge_voice(wav_path, gender)
+        # 转换音频并判断声音类型（基频轨迹已缓存时跳过转换和提取）
+        result = _judge_audio(digest, gender, reporter, seed, lambda: simple_analyzer.convert_audio(download_path))
+        _store_result(key, seed, result)
         
         return result
+    except simple_cancel.AnalysisCancelled:
+        _discard_partial_files()
+        raise
+    except Exception as e:
+        log.error(f"从URL分析声音失败: {str(e)}")
+        raise
+
+def _analyze_file(file_path, gender, progress, digest=None):
+    """转换并分析本地音频文件"""
+    reporter = simple_progress.ProgressReporter(progress, simple_progress.STAGE_PERCENT_FILE)
+    try:
+        # 转换前查找结果缓存
+        cached, key, seed = _cached_result(digest, gender)
+        if cached is not None:
+            reporter('scored', cached=True)
+            return cached
+        
+        # 转换音频并判断声音类型（基频轨迹已缓存时跳过转换和提取）
+        result = _judge_audio(digest, gender, reporter, seed, lambda: simple_analyzer.analyze_local_file(file_path))
+        _store_result(key, seed, result)
+        
+        return result
+    except simple_cancel.AnalysisCancelled:
+        _discard_partial_files()
+        raise
     except Exception as e:
         log.error(f"从文件分析声音失败: {str(e)}")
         raise
 
+def _pitch_track(file_path, url, reporter, digest=None):
+    """
+    获取录音的带时间基频轨迹：基频轨迹缓存命中时直接读取，否则转换音频、运行Praat并写入缓存
+
+    返回:
+        (包含 time 和 pitch 列的DataFrame, 音频内容摘要)
+    """
+    if url:
+        source = simple_analyzer.download_audio(url)
+        reporter('downloaded')
+        convert = lambda: simple_analyzer.convert_audio(source)
+    else:
+        source = file_path
+        convert = lambda: simple_analyzer.analyze_local_file(file_path)
+    if digest is None:
+        try:
+            digest = simple_singleflight.content_hash(source)
+        except OSError:
+            digest = None
+    
+    cache = simple_cache.get_pitch_cache() if digest is not None else None
+    pitch_key = simple_cache.pitch_key(digest) if cache is not None else None
+    if pitch_key is not None:
+        pitch_data = _cached_pitch(cache, pitch_key)
+        if pitch_data is not None:
+            log.info(f"基频轨迹缓存命中: {pitch_key[:12]}，只按时间截取并重新打分")
+            if url:
+                simple_utils.delete_file(source)
+            reporter('pitch_extracted', frames=len(pitch_data), cached=True)
+            return pitch_data, digest
+    
+    wav_path = convert()
+    reporter('converted')
+    pitch_data = simple_judger.create_praat(wav_path).praat()
+    reporter('pitch_extracted', frames=len(pitch_data))
+    if pitch_key is not None and not pitch_data.empty:
+        _store_pitch(cache, pitch_key, pitch_data)
+    return pitch_data, digest
+
+def _analyze_range(start, end, file_path, url, gender, progress, digest=None):
+    """按帧时间截取基频轨迹并打分"""
+    reporter = simple_progress.ProgressReporter(
+        progress, simple_progress.STAGE_PERCENT_URL if url else simple_progress.STAGE_PERCENT_FILE
+    )
+    try:
+        pitch_data, digest = _pitch_track(file_path, url, reporter, digest)
+        
+        selected = pitch_data['time'].notna()
+        if start is not None:
+            selected &= pitch_data['time'] >= start
+        if end is not None:
+            selected &= pitch_data['time'] < end
+        if start is not None or end is not None:
+            if not pitch_data.empty and not selected.any() and pitch_data['time'].isna().all():
+                raise ValueError('基频轨迹没有帧时间，无法按时间截取')
+            if not (selected & pitch_data['pitch'].notna()).any():
+                # 对空片段打分只会得到与真实结果无法区分的默认结果
+                raise ValueError(f"时间范围 [{start}, {end}] 内没有有效的基频")
+        segment = pitch_data[selected].reset_index(drop=True)
+        log.info(f"截取 [{start}, {end}] 的基频: {len(segment)}/{len(pitch_data)} 帧")
+        
+        seed = simple_cache.seed_for_key(simple_cache.cache_key(digest, gender)) if digest is not None else None
+        return simple_judger.judge_pitch(segment, gender, reporter, seed)
+    except simple_cancel.AnalysisCancelled:
+        _discard_partial_files()
+        raise
+    except Exception as e:
+        log.error(f"分析截取的片段失败: {str(e)}")
+        raise
+
+def _discard_partial_files():
+    """分析被取消时删除已生成的下载文件和WAV文件"""
+    token = simple_cancel.current()
+    if token is not None:
+        token.cleanup()
+
+def _collect_timings(progress, timings):
+    """记录每个阶段的耗时（秒），并把进度事件继续转发给 progress"""
+    def callback(event):
+        timings[event['stage']] = event['stage_seconds']
+        if progress is not None:
+            progress(event)
+    return callback
+
+def handle_request(request, progress=None):
+    """
+    处理一个分析请求（供常驻模式使用）
+    
+    参数:
+        request: 请求字典，包含 id、file 或 url、gender，以及可选的 progress（是否发送进度事件）、
+                 detail（是否在结果中附带与每个模型的相似度和各阶段耗时）
+                 和 start/end（只分析该时间范围内的片段，单位为秒）
+        progress: 接收进度事件的回调函数，只有请求中 progress 为真时才会使用
+    
+    返回:
+        带有请求ID的响应字典；在 simple_cancel.scope 中被取消时 status 为 cancelled
+    """
+    request_id = request.get('id')
+    if not request.get('progress'):
+        progress = None
+    detail = bool(request.get('detail'))
+    timings = {}
+    if detail:
+        progress = _collect_timings(progress, timings)
+    try:
+        gender = request.get('gender')
+        if gender is not None:
+            gender = int(gender)
+            if gender not in (0, 1):
+                raise ValueError(f"无效的性别参数: {gender}")
+        
+        if request.get('url') and request.get('file'):
+            raise ValueError('不能同时指定URL和文件路径')
+        
+        start, end = request.get('start'), request.get('end')
+        if start is not None or end is not None:
+            if not request.get('url') and not request.get('file'):
+                raise ValueError('必须指定URL或文件路径')
+            result = analyze_range(
+                float(start) if start is not None else None,
+                float(end) if end is not None else None,
+                request.get('file'), request.get('url'), gender, progress, request_id
+            )
+        elif request.get('url'):
+            result = analyze_from_url(request['url'], gender, progress, request_id)
+        elif request.get('file'):
+            result = analyze_from_file(request['file'], gender, progress, request_id)
+        else:
+            raise ValueError('必须指定URL或文件路径')
+        
+        response = {
+            'id': request_id,
+            'status': 'ok',
+            'result': simple_judger.result_to_dict(result, detail)
+        }
+        if detail:
+            response['timings'] = timings
+        return response
+    except simple_cancel.AnalysisCancelled as e:
+        log.warning(f"请求 {request_id} 已取消")
+        return {
+            'id': request_id,
+            'status': 'cancelled',
+            'error': str(e) or '已取消'
+        }
+    except Exception as e:
+        log.error(f"请求 {request_id} 分析失败: {str(e)}")
+        return {
+            'id': request_id,
+            'status': 'error',
+            'error': str(e)
+        }
+
+def setup_console_encoding():
+    """设置系统默认编码为 UTF-8（只在命令行入口调用，导入本模块时不做任何设置）"""
+    if sys.platform == 'win32':
+        # 强制设置环境变量
+        os.environ['PYTHONIOENCODING'] = 'utf-8'
+        # 设置控制台代码页为 UTF-8
+        os.system('chcp 65001 > nul')
+        # 设置标准输出为UTF-8编码
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+def _rescore(args, stream):
+    """用指定的模型库对特征库中的全部录音重新打分，并与当前模型库对比"""
+    import simple_config
+    import simple_features
+    import simple_model
+    
+    store = simple_features.get_feature_store()
+    if store is None:
+        log.error("特征库不可用")
+        return 1
+    baseline = simple_model.male_models() + simple_model.female_models()
+    if args.rescore:
+        path = args.rescore
+        if not os.path.exists(path):
+            path = os.path.join(simple_config.get_config().model_dir, path)
+        models = simple_model.read_model_file(path)
+        if not models:
+            log.error(f"无法读取模型库: {args.rescore}")
+            return 1
+    else:
+        models = baseline
+    
+    log.info(f"对特征库中的 {store.count()} 段录音重新打分，模型库共 {len(models)} 个模型")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            summary = simple_features.rescore(store, models, baseline, output)
+    else:
+        summary = simple_features.rescore(store, models, baseline)
+    stream.write(simple_channel.encode_frame(summary))
+    return 0
+
 def main():
     """主函数"""
+    setup_console_encoding()
+    
     # 确保输出编码正确
     if hasattr(sys.stdout, 'encoding') and sys.stdout.encoding != 'utf-8':
         sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
@@ -87,9 +563,237 @@ def main():
     parser.add_argument('-u', '--url', help='音频文件URL')
     parser.add_argument('-f', '--file', help='本地音频文件路径')
     parser.add_argument('-g', '--gender', type=int, choices=[0, 1], help='性别 (0为男性，1为女性，不指定则自动判断)')
-    parser.add_argument('-j', '--json', action='store_true', help='以JSON格式输出结果')
+    parser.add_argument('--start', type=float, help='只分析从该时间（秒）开始的片段，录音的基频轨迹已缓存时不再处理音频')
+    parser.add_argument('--end', type=float, help='只分析到该时间（秒）为止的片段')
+    parser.add_argument('-j', '--json', action='store_true', help='以JSON格式输出结果（标准输出只包含结果，日志写入标准错误）')
+    parser.add_argument('--result-fd', type=int, help='结果通道的文件描述符：每帧一行JSON，只包含结果消息')
+    parser.add_argument('--log-file', help='将日志写入指定文件，而不是标准输出/标准错误')
+    parser.add_argument('--serve-stdio', action='store_true', help='常驻模式：从标准输入逐行读取JSON请求，逐行输出JSON响应')
+    parser.add_argument('--zygote', action='store_true', help='与 --serve-stdio 一起使用：预热后为每个请求fork一个子进程处理（仅限支持fork的系统）')
+    parser.add_argument('--serve-http', action='store_true', help='启动本地HTTP分析服务')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP服务监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='HTTP服务监听端口')
+    parser.add_argument('--workers', type=int, help='工作进程数量（fork模式下为同时运行的子进程数量），默认为CPU核数')
+    parser.add_argument('--max-requests', type=int, default=0, help='每个工作进程处理多少个请求后回收（0为不限制）')
+    parser.add_argument('--max-rss-mb', type=int, default=0, help='工作进程内存超过多少MB后回收（0为不限制）')
+    parser.add_argument('--bulk-limit', type=int, help='常驻和服务模式中同时处理的批量（priority=bulk）请求数上限，默认为工作进程数减一')
+    parser.add_argument('--priority-aging', type=float, default=30.0, help='批量请求排队超过多少秒后按交互请求对待（0为不提升）')
+    parser.add_argument('--memory-budget-mb', type=float, help='fork和服务模式中同时处理的请求估计内存总量上限（MB），默认为物理内存的一半，0为不限制')
+    parser.add_argument('--max-queue', type=int, default=100, help='常驻和服务模式中排队请求数上限，超过时立即拒绝并返回 retry_after（0为不限制）')
+    parser.add_argument('--thread-budget', metavar='SPEC', help='每个工作进程的线程数：N，或 blas=N,numba=N,features=N；默认CPU核数除以工作进程数')
+    parser.add_argument('--pin-cpus', action='store_true', help='把每个工作进程绑定到各自的CPU上（仅限支持的系统）')
+    parser.add_argument('--batch', metavar='SOURCE', help='批量模式：目录、通配符模式或清单文件（每行一个路径/URL，可附带性别）')
+    parser.add_argument('-o', '--output', help='批量模式结果输出文件（每行一个JSON），默认输出到标准输出')
+    parser.add_argument('--ordered', action='store_true', help='批量模式按输入顺序输出结果')
+    parser.add_argument('--sink', choices=['jsonl', 'parquet', 'arrow', 'sqlite'], help='批量模式结果的格式，默认按 -o 的扩展名判断（.parquet、.arrow/.feather、.db/.sqlite），其他为每行一个JSON')
+    parser.add_argument('--job-db', metavar='PATH', help='批量模式的SQLite任务表：记录每个条目的状态和结果，中断后重新运行只处理未完成的条目（可不带 --batch 直接续跑）')
+    parser.add_argument('--queue-dir', metavar='DIR', help='多主机批量模式：共享目录（NFS等）中的工作队列，不带其他队列参数时作为工作者处理队列')
+    parser.add_argument('--enqueue', metavar='SOURCE', help='与 --queue-dir 一起使用：把目录、通配符模式或清单文件中的条目加入共享队列')
+    parser.add_argument('--queue-status', action='store_true', help='与 --queue-dir 一起使用：输出共享队列的状态')
+    parser.add_argument('--queue-export', action='store_true', help='与 --queue-dir 一起使用：把所有结果按行输出到 -o 指定的文件或标准输出')
+    parser.add_argument('--lease', type=float, default=120.0, help='共享队列的租约时长（秒），超过该时长未续约的条目被其他工作者回收')
+    parser.add_argument('--max-attempts', type=int, default=3, help='共享队列中同一条目最多被领取的次数，以及任务表中失败条目最多尝试的次数')
+    parser.add_argument('--cache-mb', type=float, help=f"结果缓存的大小上限（MB），超过时淘汰最久未访问的结果，0为禁用缓存，默认{simple_cache.DEFAULT_CACHE_MB}")
+    parser.add_argument('--cache-entries', type=int, help='结果缓存的条目数上限（0为不限制）')
+    parser.add_argument('--pitch-cache-mb', type=float, help=f"基频轨迹缓存的大小上限（MB），切换性别或模型库时只重新打分，0为禁用，默认{simple_cache.DEFAULT_PITCH_CACHE_MB}")
+    parser.add_argument('--url-cache-mb', type=float, help=f"URL下载缓存的大小上限（MB），再次分析同一URL时发送条件请求，未修改则复用已下载的音频，0为禁用，默认{simple_cache.DEFAULT_URL_CACHE_MB}")
+    parser.add_argument('--url-cache-ttl', type=float, help=f"URL下载缓存中音频的有效期（秒），默认{simple_cache.DEFAULT_URL_CACHE_TTL}")
+    parser.add_argument('--fingerprint-mb', type=float, help=f"音频指纹索引的大小上限（MB），重新编码的副本复用原音频的结果和基频轨迹，0为禁用，默认{simple_cache.DEFAULT_FINGERPRINT_MB}")
+    parser.add_argument('--download-max-mb', type=float, help=f"下载单个音频的大小上限（MB），超过时立即中止，0为不限制，默认{simple_utils.DEFAULT_DOWNLOAD_MAX_MB}")
+    parser.add_argument('--download-timeout', type=float, help=f"下载音频的读取超时（秒），超时后续传重试，默认{simple_utils.DEFAULT_DOWNLOAD_TIMEOUT}")
+    parser.add_argument('--cache-stats', action='store_true', help='输出结果缓存、基频轨迹缓存、URL下载缓存和音频指纹索引的统计后退出')
+    parser.add_argument('--cache-clear', action='store_true', help='清空结果缓存、基频轨迹缓存、URL下载缓存和音频指纹索引后退出')
+    parser.add_argument('--feature-store', metavar='PATH', help='特征库（SQLite）路径：记录每段录音的基频分布直方图，默认 temp/features.db，0为不记录')
+    parser.add_argument('--rescore', nargs='?', const='', metavar='MODEL_CSV', help='用模型库（默认为当前模型库，相对路径先在模型目录中查找）对特征库中的全部录音重新打分，输出统计；指定 -o 时每段录音的结果逐行写入该文件')
+    parser.add_argument('--autotune', action='store_true', help='校准本机性能并写出调优配置，常驻、服务和批量模式启动时自动加载')
+    parser.add_argument('--tuned-config', metavar='PATH', help='调优配置文件路径：--autotune 写入该文件，常驻、服务和批量模式从该文件加载，默认 temp/tuned_config.json')
+    parser.add_argument('--autotune-samples', type=int, default=8, help='校准时使用的样本WAV数量（取自 temp/wav）')
     
     args = parser.parse_args()
+    if args.zygote and not hasattr(os, 'fork'):
+        parser.error('--zygote 只支持提供 fork() 的系统')
+    
+    # 标准输出只用于传输结果的模式下，日志和调试信息全部改写到标准错误（或日志文件）
+    protocol_stream = sys.stdout
+    if args.serve_stdio or args.batch or args.job_db or args.queue_dir or args.cache_stats or args.cache_clear or args.rescore is not None or args.json or args.result_fd is not None:
+        sys.stdout = sys.stderr
+        simple_logger.set_stream(sys.stderr)
+    if args.log_file:
+        simple_logger.set_log_file(args.log_file)
+    
+    # 缓存和下载的上限通过环境变量传给工作进程
+    if args.cache_mb is not None:
+        os.environ[simple_cache.CACHE_MB_ENV] = str(args.cache_mb)
+    if args.cache_entries is not None:
+        os.environ[simple_cache.CACHE_ENTRIES_ENV] = str(args.cache_entries)
+    if args.pitch_cache_mb is not None:
+        os.environ[simple_cache.PITCH_CACHE_MB_ENV] = str(args.pitch_cache_mb)
+    if args.url_cache_mb is not None:
+        os.environ[simple_cache.URL_CACHE_MB_ENV] = str(args.url_cache_mb)
+    if args.url_cache_ttl is not None:
+        os.environ[simple_cache.URL_CACHE_TTL_ENV] = str(args.url_cache_ttl)
+    if args.fingerprint_mb is not None:
+        os.environ[simple_cache.FINGERPRINT_MB_ENV] = str(args.fingerprint_mb)
+    if args.download_max_mb is not None:
+        os.environ[simple_utils.DOWNLOAD_MAX_MB_ENV] = str(args.download_max_mb)
+    if args.download_timeout is not None:
+        os.environ[simple_utils.DOWNLOAD_TIMEOUT_ENV] = str(args.download_timeout)
+    if args.tuned_config:
+        import simple_autotune
+        os.environ[simple_autotune.TUNED_CONFIG_ENV] = args.tuned_config
+    if args.feature_store is not None:
+        import simple_features
+        os.environ[simple_features.FEATURE_STORE_ENV] = args.feature_store
+    if args.cache_stats or args.cache_clear:
+        stats = {}
+        for name, cache in (('results', simple_cache.get_cache()), ('pitch', simple_cache.get_pitch_cache()),
+                            ('urls', simple_cache.get_url_cache()),
+                            ('fingerprints', simple_cache.get_fingerprint_index())):
+            if cache is not None and args.cache_clear:
+                cache.clear()
+            stats[name] = cache.stats() if cache is not None else None
+        protocol_stream.write(simple_channel.encode_frame(stats))
+        return 0
+    
+    if args.rescore is not None:
+        return _rescore(args, protocol_stream)
+    
+    # 各运行模式的模块只在需要时导入，保持命令行启动足够快
+    if args.serve_stdio or args.serve_http:
+        import simple_admission
+        if args.memory_budget_mb is None:
+            args.memory_budget_mb = simple_admission.default_budget_mb()
+    
+    if args.autotune:
+        import simple_autotune
+        samples = simple_autotune.find_samples(args.autotune_samples)
+        try:
+            tuned = simple_autotune.autotune(handle_request, samples, args.workers)
+        except Exception as e:
+            log.error(f"校准失败: {str(e)}")
+            return 1
+        print(f"调优完成：工作进程数 {tuned['workers']}，线程预算 {tuned['thread_budget']}")
+        return 0
+    
+    # 未在命令行指定时使用 --autotune 生成的工作进程数和线程预算
+    tuned = {}
+    if args.serve_stdio or args.serve_http or args.batch or args.job_db or args.queue_dir:
+        import simple_autotune
+        tuned = simple_autotune.load_tuned_config()
+        if args.workers is None and tuned.get('workers'):
+            args.workers = tuned['workers']
+    
+    thread_budget = None
+    single_process = args.serve_stdio and not args.zygote
+    if args.thread_budget is None and tuned.get('thread_budget') and not single_process and args.workers == tuned.get('workers'):
+        thread_budget = tuned['thread_budget']
+    elif args.thread_budget or single_process:
+        # 单进程常驻模式一次只处理一个请求，未指定时也按一个工作进程应用默认预算，与其他模式一致
+        import simple_threads
+        try:
+            workers = 1 if single_process else args.workers or os.cpu_count() or 1
+            thread_budget = simple_threads.parse_thread_budget(args.thread_budget, workers)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.serve_stdio and args.zygote:
+        import simple_zygote
+        return simple_zygote.serve_zygote(
+            handle_request,
+            sys.stdin,
+            protocol_stream,
+            args.workers,
+            bulk_limit=args.bulk_limit,
+            aging=args.priority_aging,
+            budget_mb=args.memory_budget_mb,
+            max_queue=args.max_queue,
+            thread_budget=thread_budget,
+            pin_cpus=args.pin_cpus
+        )
+    
+    if args.serve_stdio:
+        import simple_threads
+        simple_threads.apply_thread_budget(thread_budget)
+        import simple_worker
+        return simple_worker.serve_stdio(
+            handle_request,
+            sys.stdin,
+            protocol_stream,
+            aging=args.priority_aging,
+            max_queue=args.max_queue
+        )
+    
+    if args.serve_http:
+        import simple_server
+        return simple_server.serve_http(
+            handle_request,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            max_requests=args.max_requests,
+            max_rss_mb=args.max_rss_mb,
+            bulk_limit=args.bulk_limit,
+            aging=args.priority_aging,
+            budget_mb=args.memory_budget_mb,
+            max_queue=args.max_queue,
+            thread_budget=thread_budget,
+            pin_cpus=args.pin_cpus
+        )
+    
+    if args.queue_dir:
+        import simple_workqueue
+        if args.enqueue:
+            import simple_batch
+            simple_workqueue.enqueue(args.queue_dir, simple_batch.collect_items(args.enqueue, args.gender))
+            return 0
+        if args.queue_status:
+            protocol_stream.write(simple_channel.encode_frame(simple_workqueue.queue_status(args.queue_dir)))
+            return 0
+        if args.queue_export:
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as output:
+                    _, failed = simple_workqueue.export_results(args.queue_dir, output)
+            else:
+                _, failed = simple_workqueue.export_results(args.queue_dir, protocol_stream)
+            return 1 if failed else 0
+        worker = simple_workqueue.QueueWorker(args.queue_dir, args.lease, args.max_attempts)
+        _, failed = worker.run(handle_request, args.workers, thread_budget, args.pin_cpus)
+        return 1 if failed else 0
+    
+    if args.batch or args.job_db:
+        import simple_batch
+        import simple_sinks
+        items = simple_batch.collect_items(args.batch, args.gender) if args.batch else ()
+        journal = None
+        if args.job_db:
+            import simple_jobdb
+            # 任务表记录每个条目的状态，重新运行时只处理未完成（以及可重试的失败）条目，结果追加到输出文件
+            journal = simple_jobdb.JobStore(args.job_db)
+            journal.add(items)
+            journal.requeue_failed(args.max_attempts)
+            items = journal.pending_items()
+        try:
+            sink = simple_sinks.open_sink(args.output, args.sink, protocol_stream, append=journal is not None)
+        except (ValueError, RuntimeError) as e:
+            if journal is not None:
+                journal.close()
+            parser.error(str(e))
+        try:
+            _, failed = simple_batch.run_batch(
+                handle_request, items, args.workers, sink, args.ordered, thread_budget, args.pin_cpus, journal,
+                args.max_attempts
+            )
+        finally:
+            # 先写出缓存的结果，再提交任务表
+            sink.close()
+            if journal is not None:
+                journal.close()
+        return 1 if failed else 0
+    
+    # 检查当前编码
+    print(f"当前系统编码: {locale.getpreferredencoding()}")
+    print(f"标准输出编码: {sys.stdout.encoding}")
+    print(f"标准错误编码: {sys.stderr.encoding}")
     
     # 检查参数
     if not args.url and not args.file:
@@ -98,55 +802,53 @@ def main():
     if args.url and args.file:
         parser.error('不能同时指定URL和文件路径')
     
+    channel = None
+    if args.result_fd is not None:
+        channel = simple_channel.ResultChannel.from_fd(args.result_fd)
+    
+    # 收到 SIGTERM/SIGINT 时立即终止FFmpeg/Praat进程组，删除未完成的临时文件后退出
+    token = simple_cancel.CancelToken()
+    simple_cancel.install_signal_handlers(token)
+    
     try:
         # 分析声音
-        if args.url:
-            result = analyze_from_url(args.url, args.gender)
-        else:
-            result = analyze_from_file(args.file, args.gender)
+        progress = channel.send if channel else None
+        with simple_cancel.scope(token):
+            if args.start is not None or args.end is not None:
+                result = analyze_range(args.start, args.end, args.file, args.url, args.gender, progress)
+            elif args.url:
+                result = analyze_from_url(args.url, args.gender, progress)
+            else:
+                result = analyze_from_file(args.file, args.gender, progress)
         
         # 输出结果
+        if channel:
+            channel.send_result(simple_judger.result_to_dict(result))
         if args.json:
-            # 获取最佳匹配的异性音色
-            opposite_match = result.get_opposite_gender_match()
-            
             # 转换为字典
-            result_dict = {
-                'main': {
-                    'id': result.main.id,
-                    'name': result.main.name,
-                    'score': result.main.score
-                },
-                'sub': [
-                    {
-                        'id': sub.id,
-                        'name': sub.name,
-                        'score': sub.score
-                    } for sub in result.sub
-                ]
-            }
-            
-            # 添加最佳匹配的异性音色
-            if opposite_match:
-                result_dict['opposite_match'] = {
-                    'id': opposite_match.id,
-                    'name': opposite_match.name
-                }
+            result_dict = simple_judger.result_to_dict(result)
             
-            # 使用ASCII转义序列输出JSON，避免编码问题
+            # 使用ASCII转义序列输出JSON，避免编码问题；标准输出中只有这一份结果
             json_str = json.dumps(result_dict, ensure_ascii=True, indent=2)
-            print(json_str, flush=True)
-            
-            # 同时输出一个不使用ASCII转义的版本，用于调试
-            print("DEBUG_JSON_UTF8:" + json.dumps(result_dict, ensure_ascii=False, indent=2), flush=True)
-        else:
+            print(json_str, file=protocol_stream, flush=True)
+        elif not channel:
             print(simple_judger.format_result(result), flush=True)
         
         return 0
+    except simple_cancel.AnalysisCancelled as e:
+        log.warning(f"分析已取消: {str(e)}")
+        if channel:
+            channel.send({'type': 'cancelled', 'error': str(e) or '已取消'})
+        return 130
     except Exception as e:
         log.error(f"分析失败: {str(e)}")
-        print(f"错误: {str(e)}")
+        if channel:
+            channel.send_error(str(e))
+        print(f"错误: {str(e)}", file=sys.stderr if args.json else sys.stdout)
         return 1
+    finally:
+        if channel:
+            channel.close()
 
 if __name__ == '__main__':
     # 确保异常信息也使用UTF-8编码
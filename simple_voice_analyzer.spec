@@ -29,6 +29,26 @@ a = Analysis(
         'simple_config',
         'simple_utils',
         'simple_ffmpeg',
+        'simple_worker',
+        'simple_channel',
+        'simple_progress',
+        'simple_pool',
+        'simple_server',
+        'simple_batch',
+        'simple_pipeline',
+        'simple_zygote',
+        'simple_cancel',
+        'simple_singleflight',
+        'simple_scheduler',
+        'simple_admission',
+        'simple_threads',
+        'simple_autotune',
+        'simple_workqueue',
+        'simple_jobdb',
+        'simple_sinks',
+        'simple_cache',
+        'simple_fingerprint',
+        'simple_features',
         'io',
         'codecs',
         'encodings',
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import simple_logger
+import simple_model
+import simple_cancel
+from simple_scheduler import PriorityScheduler, QueueFull, normalize_priority, DEFAULT_AGING
+from simple_channel import encode_frame
+
+log = simple_logger.get_logger(__name__)
+
+def parse_request_line(line):
+    """
+    解析一行JSON请求
+
+    参数:
+        line: 从标准输入读取的一行文本
+
+    返回:
+        请求字典，空行返回None
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("请求必须是JSON对象")
+    return request
+
+def write_response(stream, response):
+    """
+    向输出流写入一行JSON响应
+
+    参数:
+        stream: 输出流
+        response: 响应字典
+    """
+    stream.write(encode_frame(response))
+    stream.flush()
+
+def serve_stdio(handler, stdin=None, stdout=None, aging=DEFAULT_AGING, max_queue=0):
+    """
+    常驻的标准输入输出工作模式
+
+    每行读取一个JSON请求，调用handler处理后写回一行JSON响应。
+    模型只在进程启动时加载一次，后续请求无需再次冷启动。
+    请求中 progress 为真时，处理过程中的进度事件也会逐行写出。
+
+    请求在后台线程中逐个处理，主线程继续读取输入，
+    因此 {"type": "cancel", "id": ...} 可以取消排队中或正在处理的请求。
+    排队中的请求按 priority（interactive 优先于 bulk）调度。
+
+    参数:
+        handler: 处理函数，接收请求字典和进度回调，返回响应字典
+        stdin: 输入流，默认为标准输入
+        stdout: 输出流，默认为标准输出
+        aging: 批量请求排队超过多少秒后按交互请求对待
+        max_queue: 排队请求数上限，超过时立即拒绝（0为不限制）
+
+    返回:
+        进程退出码
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    # 先加载模型，之后的每个请求都不再需要冷启动
+    simple_model.ensure_loaded()
+
+    write_lock = threading.Lock()
+    state_lock = threading.Lock()
+    scheduler = PriorityScheduler(1, aging=aging, max_queue=max_queue)
+    # 请求ID -> 取消令牌（排队中和正在处理的请求）
+    active = {}
+
+    def send(message):
+        with write_lock:
+            write_response(stdout, message)
+
+    def run_next():
+        # 每个排队的请求对应一次 run_next 调用，每次取出当前优先级最高的请求
+        with state_lock:
+            entry = scheduler.pop()
+        if entry is None:
+            # 对应的请求已在排队时被取消
+            return
+        (request, token), priority, cost = entry
+        request_id = request.get('id')
+        started = time.monotonic()
+        try:
+            with simple_cancel.scope(token):
+                token.check()
+                response = handler(request, send)
+        except BaseException as e:
+            log.error(f"请求 {request_id} 处理异常: {str(e)}")
+            response = {'id': request_id, 'status': 'error', 'error': str(e)}
+        finally:
+            with state_lock:
+                scheduler.release(priority, cost, time.monotonic() - started)
+                if active.get(request_id) is token:
+                    del active[request_id]
+        send(response)
+
+    def cancel(request_id):
+        with state_lock:
+            token = active.pop(request_id, None)
+            if token is None:
+                return False
+            queued = scheduler.remove(lambda item: item[1] is token)
+        if queued is not None:
+            send({'id': request_id, 'status': 'cancelled', 'error': '已取消'})
+        else:
+            token.cancel(f"请求 {request_id} 被取消")
+        return True
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    log.info("常驻分析模式已启动，等待请求")
+    send({'type': 'ready'})
+
+    shutdown_id = None
+    shutdown = False
+    for line in stdin:
+        try:
+            request = parse_request_line(line)
+        except Exception as e:
+            log.error(f"请求解析失败: {str(e)}")
+            send({'id': None, 'status': 'error', 'error': f"请求解析失败: {str(e)}"})
+            continue
+
+        if request is None:
+            continue
+
+        if request.get('type') == 'shutdown':
+            shutdown_id = request.get('id')
+            shutdown = True
+            break
+
+        if request.get('type') == 'cancel':
+            found = cancel(request.get('id'))
+            send({'id': request.get('id'), 'status': 'ok', 'type': 'cancel', 'cancelled': found})
+            continue
+
+        try:
+            priority = normalize_priority(request.get('priority'))
+        except ValueError as e:
+            send({'id': request.get('id'), 'status': 'error', 'error': str(e)})
+            continue
+
+        token = simple_cancel.CancelToken()
+        try:
+            with state_lock:
+                scheduler.push((request, token), priority)
+                active[request.get('id')] = token
+        except QueueFull as e:
+            log.warning(f"请求 {request.get('id')} 被拒绝: {str(e)}")
+            send({'id': request.get('id'), 'status': 'rejected', 'error': str(e), 'retry_after': e.retry_after})
+            continue
+        executor.submit(run_next)
+
+    # 等待已接收的请求处理完成后退出
+    executor.shutdown(wait=True)
+    if shutdown:
+        send({'id': shutdown_id, 'status': 'ok', 'type': 'shutdown'})
+
+    log.info("常驻分析模式已退出")
+    return 0
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import simple_logger
+import simple_threads
+from simple_batch import _init_worker
+from simple_channel import encode_frame
+
+log = simple_logger.get_logger(__name__)
+
+# 共享目录的布局：
+#   pending/<键>~<次数>.json          等待处理的条目
+#   claimed/<键>~<次数>~<工作者>.json  被某个工作者领取的条目（租约），工作者定期更新修改时间续约
+#   results/<键>.json                  分析结果（每行一个JSON，与批量模式的输出相同）
+#   tmp/                               写入中的临时文件，写完后改名到目标目录
+# 领取和回收都通过同一文件系统内的原子改名完成，多个工作者同时改名时只有一个成功。
+PENDING = 'pending'
+CLAIMED = 'claimed'
+RESULTS = 'results'
+TMP = 'tmp'
+
+# 默认租约时长（秒）：超过该时长没有续约的条目视为工作者已退出，重新放回待处理队列
+DEFAULT_LEASE = 120.0
+
+# 同一条目最多被领取的次数，超过后记录为失败（避免导致工作者崩溃的条目无限重试）
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 没有可领取的条目时的轮询间隔（秒）
+_POLL_INTERVAL = 1.0
+
+# 每个工作进程最多同时领取的条目数
+_CLAIMS_PER_WORKER = 2
+
+def _key(item_id):
+    """由条目ID生成可用作文件名的键"""
+    return hashlib.sha1(str(item_id).encode('utf-8')).hexdigest()
+
+def _worker_name():
+    """当前工作者的名称：主机名-进程号（去掉文件名中不允许的字符）"""
+    host = re.sub(r'[^A-Za-z0-9_.-]', '_', socket.gethostname()) or 'host'
+    return f"{host}-{os.getpid()}"
+
+def _write_atomic(root, target, text):
+    """先写到临时目录，再改名到目标路径，读取方不会看到写了一半的文件"""
+    tmp_path = os.path.join(root, TMP, f"{os.path.basename(target)}.{_worker_name()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+
+def init_queue(root):
+    """
+    创建共享目录的子目录
+
+    参数:
+        root: 共享目录路径
+    """
+    for name in (PENDING, CLAIMED, RESULTS, TMP):
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+
+def enqueue(root, items):
+    """
+    把条目加入共享队列（已有结果或已在队列中的条目跳过，可重复执行）
+
+    参数:
+        root: 共享目录路径
+        items: 请求字典的可迭代对象（collect_items 的结果）
+
+    返回:
+        (加入的条目数, 跳过的条目数)
+    """
+    init_queue(root)
+    queued = _queued_keys(root)
+    added = skipped = 0
+    for item in items:
+        key = _key(item['id'])
+        if key in queued or os.path.exists(os.path.join(root, RESULTS, f"{key}.json")):
+            skipped += 1
+            continue
+        if 'error' in item:
+            # 清单中解析失败的行直接记录为失败结果
+            response = {'id': item['id'], 'status': 'error', 'error': item['error']}
+            _write_atomic(root, os.path.join(root, RESULTS, f"{key}.json"), encode_frame(response))
+        else:
+            _write_atomic(root, os.path.join(root, PENDING, f"{key}~0.json"), json.dumps(item, ensure_ascii=False))
+        queued.add(key)
+        added += 1
+    log.info(f"已加入共享队列 {root}: {added} 个，跳过 {skipped} 个")
+    return added, skipped
+
+def _queued_keys(root):
+    """待处理和已领取的条目的键"""
+    keys = set()
+    for name in (PENDING, CLAIMED):
+        for file_name in os.listdir(os.path.join(root, name)):
+            if file_name.endswith('.json'):
+                keys.add(file_name.split('~', 1)[0])
+    return keys
+
+def queue_status(root):
+    """
+    获取共享队列的状态
+
+    参数:
+        root: 共享目录路径
+
+    返回:
+        {'pending': n, 'claimed': n, 'done': n, 'failed': n, 'workers': {工作者: 领取数}}
+    """
+    init_queue(root)
+    status = {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 0, 'workers': {}}
+    status['pending'] = sum(1 for name in os.listdir(os.path.join(root, PENDING)) if name.endswith('.json'))
+    for name in os.listdir(os.path.join(root, CLAIMED)):
+        parts = name[:-len('.json')].split('~')
+        if len(parts) == 3:
+            status['claimed'] += 1
+            status['workers'][parts[2]] = status['workers'].get(parts[2], 0) + 1
+    for response in iter_results(root):
+        status['done' if response.get('status') == 'ok' else 'failed'] += 1
+    return status
+
+def iter_results(root):
+    """
+    读取共享队列中的所有结果
+
+    参数:
+        root: 共享目录路径
+
+    返回:
+        响应字典的生成器
+    """
+    results_dir = os.path.join(root, RESULTS)
+    for name in sorted(os.listdir(results_dir)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(results_dir, name), 'r', encoding='utf-8') as f:
+                yield json.loads(f.read())
+        except (OSError, ValueError) as e:
+            log.warning(f"结果文件读取失败: {name}, 错误: {str(e)}")
+
+class QueueWorker:
+    def __init__(self, root, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS, name=None):
+        """
+        初始化共享队列的工作者
+
+        参数:
+            root: 共享目录路径（NFS等所有主机都能访问的目录）
+            lease: 租约时长（秒），工作者每隔 lease/3 秒续约一次
+            max_attempts: 同一条目最多被领取的次数
+            name: 工作者名称，默认为 主机名-进程号
+        """
+        self.root = root
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.name = name or _worker_name()
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.reclaimed = 0
+        init_queue(root)
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _now(self):
+        """
+        共享文件系统上的当前时间
+
+        租约按文件修改时间判断，各主机的时钟可能不一致，因此用文件服务器写入的时间作为基准。
+        """
+        clock = self._path(TMP, f"clock.{self.name}")
+        with open(clock, 'a'):
+            pass
+        os.utime(clock, None)
+        return os.stat(clock).st_mtime
+
+    def claim(self):
+        """
+        领取一个待处理的条目
+
+        返回:
+            (请求字典, 租约文件路径)，没有可领取的条目时返回None
+        """
+        for file_name in sorted(os.listdir(self._path(PENDING))):
+            if not file_name.endswith('.json'):
+                continue
+            stem = file_name[:-len('.json')]
+            key = stem.split('~', 1)[0]
+            claim_path = self._path(CLAIMED, f"{stem}~{self.name}.json")
+            pending_path = self._path(PENDING, file_name)
+            try:
+                # 改名不会更新修改时间：先更新再改名，租约文件出现时就带着领取时间，
+                # 不会被其他工作者按放回队列前的旧时间当作过期租约回收
+                os.utime(pending_path, None)
+                os.rename(pending_path, claim_path)
+            except FileNotFoundError:
+                # 被其他工作者抢先领取
+                continue
+            if os.path.exists(self._path(RESULTS, f"{key}.json")):
+                # 租约被回收后原工作者仍然完成了该条目
+                try:
+                    os.remove(claim_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(claim_path, 'r', encoding='utf-8') as f:
+                    item = json.load(f)
+            except FileNotFoundError:
+                # 读取前被其他工作者当作过期租约回收
+                continue
+            except (OSError, ValueError) as e:
+                self._finish(claim_path, key, {'id': key, 'status': 'error', 'error': f"条目读取失败: {str(e)}"})
+                continue
+            with self._lock:
+                self._held[claim_path] = item
+            return item, claim_path
+        return None
+
+    def _finish(self, claim_path, key, response):
+        """写出结果并释放租约"""
+        _write_atomic(self.root, self._path(RESULTS, f"{key}.json"), encode_frame(response))
+        with self._lock:
+            self._held.pop(claim_path, None)
+        try:
+            os.remove(claim_path)
+        except FileNotFoundError:
+            # 租约已过期并被其他工作者回收，结果以先写完的为准（相同输入的结果相同）
+            log.warning(f"租约已被回收: {os.path.basename(claim_path)}")
+
+    def complete(self, claim_path, response):
+        """
+        条目处理完成
+
+        参数:
+            claim_path: claim 返回的租约文件路径
+            response: 响应字典
+        """
+        key = os.path.basename(claim_path).split('~', 1)[0]
+        self._finish(claim_path, key, response)
+
+    def renew(self):
+        """为所有持有的租约续约"""
+        with self._lock:
+            held = list(self._held)
+        for claim_path in held:
+            try:
+                os.utime(claim_path, None)
+            except FileNotFoundError:
+                log.warning(f"续约失败，租约已被回收: {os.path.basename(claim_path)}")
+                with self._lock:
+                    self._held.pop(claim_path, None)
+
+    def reclaim(self):
+        """
+        把过期的租约放回待处理队列（或在超过最多领取次数后记录为失败）
+
+        返回:
+            回收的条目数
+        """
+        now = self._now()
+        reclaimed = 0
+        for file_name in os.listdir(self._path(CLAIMED)):
+            parts = file_name[:-len('.json')].split('~')
+            if not file_name.endswith('.json') or len(parts) != 3:
+                continue
+            claim_path = self._path(CLAIMED, file_name)
+            try:
+                expired = now - os.stat(claim_path).st_mtime > self.lease
+            except FileNotFoundError:
+                continue
+            if not expired:
+                continue
+
+            key, attempts, owner = parts[0], int(parts[1]) + 1, parts[2]
+            if not self._requeue(claim_path, key, attempts):
+                continue
+            if attempts < self.max_attempts:
+                log.warning(f"回收工作者 {owner} 的过期租约: {key}")
+            reclaimed += 1
+
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    def _requeue(self, claim_path, key, attempts):
+        """
+        把租约放回待处理队列，领取次数达到上限时记录为失败
+
+        参数:
+            claim_path: 租约文件路径
+            key: 条目的键
+            attempts: 放回后的领取次数
+
+        返回:
+            是否成功（租约已被其他工作者处理时返回False）
+        """
+        with self._lock:
+            self._held.pop(claim_path, None)
+        if attempts >= self.max_attempts:
+            # 先改名为本工作者的租约，保证只有一个工作者写失败结果
+            own_path = self._path(CLAIMED, f"{key}~{attempts}~{self.name}.json")
+            try:
+                os.rename(claim_path, own_path)
+            except FileNotFoundError:
+                return False
+            try:
+                with open(own_path, 'r', encoding='utf-8') as f:
+                    item_id = json.load(f).get('id', key)
+            except (OSError, ValueError):
+                item_id = key
+            log.error(f"条目 {item_id} 已被领取 {attempts} 次仍未完成，记录为失败")
+            self._finish(own_path, key, {
+                'id': item_id, 'status': 'error', 'error': f"工作者多次在处理中退出（{attempts} 次）"
+            })
+            return True
+        try:
+            os.rename(claim_path, self._path(PENDING, f"{key}~{attempts}.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, claim_path):
+        """
+        放弃本工作者持有的租约（本机工作进程崩溃时），条目放回待处理队列，不写结果
+
+        参数:
+            claim_path: claim 返回的租约文件路径
+        """
+        parts = os.path.basename(claim_path)[:-len('.json')].split('~')
+        self._requeue(claim_path, parts[0], int(parts[1]) + 1)
+
+    def idle(self):
+        """共享队列中是否已没有待处理和被领取的条目"""
+        return not any(name.endswith('.json') for name in os.listdir(self._path(PENDING))) \
+            and not any(name.endswith('.json') for name in os.listdir(self._path(CLAIMED)))
+
+    def _heartbeat(self):
+        """续约线程"""
+        while not self._stopped.wait(self.lease / 3):
+            try:
+                self.renew()
+            except OSError as e:
+                log.warning(f"续约失败: {str(e)}")
+
+    def run(self, handler, workers=None, thread_budget=None, pin_cpus=False):
+        """
+        处理共享队列直到所有条目都有结果
+
+        本机启动 workers 个工作进程，领取的条目数保持在工作进程数的 _CLAIMS_PER_WORKER 倍以内，
+        其他主机上的工作者退出后，其过期租约会被本工作者回收。
+
+        参数:
+            handler: 请求处理函数（必须可被pickle）
+            workers: 本机工作进程数量，默认为CPU核数
+            thread_budget: 每个工作进程的线程预算
+            pin_cpus: 是否把每个工作进程绑定到各自的CPU上
+
+        返回:
+            (本工作者成功数, 本工作者失败数)
+        """
+        workers = workers or os.cpu_count() or 1
+        thread_budget = thread_budget or simple_threads.parse_thread_budget(None, workers)
+        cpu_sets = simple_threads.cpu_sets(workers, max(thread_budget.values())) if pin_cpus else None
+        ctx = multiprocessing.get_context('spawn')
+        max_claims = workers * _CLAIMS_PER_WORKER
+        succeeded = failed = 0
+        pending = {}
+
+        def new_executor():
+            return ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=ctx,
+                                       initializer=_init_worker,
+                                       initargs=(thread_budget, cpu_sets, ctx.Value('i', 0)))
+
+        def restart(executor):
+            """本机某个工作进程崩溃（例如内存不足被杀死）后整个进程池不可用：放回所有未完成的条目并重建进程池"""
+            log.error(f"工作进程异常退出，放回 {len(pending)} 个未完成的条目并重建进程池")
+            for item, claim_path in pending.values():
+                self.release(claim_path)
+            pending.clear()
+            executor.shutdown(wait=False, cancel_futures=True)
+            return new_executor()
+
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        log.info(f"工作者 {self.name} 开始处理共享队列: {self.root}")
+        executor = new_executor()
+        try:
+            next_reclaim = 0
+            while True:
+                if time.monotonic() >= next_reclaim:
+                    self.reclaim()
+                    next_reclaim = time.monotonic() + self.lease / 2
+
+                while len(pending) < max_claims:
+                    claimed = self.claim()
+                    if claimed is None:
+                        break
+                    item, claim_path = claimed
+                    try:
+                        pending[executor.submit(handler, item)] = (item, claim_path)
+                    except BrokenProcessPool:
+                        self.release(claim_path)
+                        executor = restart(executor)
+
+                if not pending:
+                    if self.idle():
+                        break
+                    # 其他工作者仍在处理，等待它们完成或租约过期
+                    time.sleep(_POLL_INTERVAL)
+                    continue
+
+                done, _ = wait(pending, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    item, claim_path = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except BrokenProcessPool:
+                        # 不写结果，与其他未完成的条目一起放回队列（计入领取次数）
+                        pending[future] = (item, claim_path)
+                        broken = True
+                        continue
+                    except Exception as e:
+                        log.error(f"条目 {item['id']} 分析失败: {str(e)}")
+                        response = {'id': item['id'], 'status': 'error', 'error': str(e)}
+                    if response.get('status') == 'ok':
+                        succeeded += 1
+                    else:
+                        failed += 1
+                    self.complete(claim_path, response)
+                if broken:
+                    executor = restart(executor)
+        finally:
+            self._stopped.set()
+            executor.shutdown()
+
+        log.info(f"工作者 {self.name} 完成: 成功 {succeeded} 个，失败 {failed} 个，回收租约 {self.reclaimed} 个")
+        return succeeded, failed
+
+def export_results(root, output=None):
+    """
+    把共享队列中的所有结果按行写出
+
+    参数:
+        root: 共享目录路径
+        output: 输出流，默认为标准输出
+
+    返回:
+        (成功数, 失败数)
+    """
+    output = output or sys.stdout
+    succeeded = failed = 0
+    for response in iter_results(root):
+        if response.get('status') == 'ok':
+            succeeded += 1
+        else:
+            failed += 1
+        output.write(encode_frame(response))
+    output.flush()
+    return succeeded, failed
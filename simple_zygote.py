@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import gc
+import json
+import time
+import signal
+import selectors
+import simple_logger
+import simple_config
+import simple_model
+import simple_judger
+import simple_cancel
+import simple_threads
+from simple_worker import parse_request_line, write_response
+from simple_channel import encode_frame
+from simple_singleflight import key_for_request
+from simple_scheduler import PriorityScheduler, QueueFull, normalize_priority, BULK, INTERACTIVE, DEFAULT_AGING
+from simple_admission import estimate_request_mb
+
+log = simple_logger.get_logger(__name__)
+conf = simple_config.get_config()
+
+# 单个请求的子进程最长运行时间（秒）
+DEFAULT_TIMEOUT = 600
+
+# 取消请求后等待子进程自行清理退出的时间（秒），超时后强制终止
+CANCEL_GRACE = 5
+
+class _Child:
+    def __init__(self, pid, fd, request, priority, cost, deadline, cpus=None):
+        """
+        初始化子进程句柄
+
+        参数:
+            pid: 子进程ID
+            fd: 读取子进程响应的管道
+            request: 子进程正在处理的请求
+            priority: 请求的优先级
+            cost: 请求的估计内存（MB）
+            deadline: 超时时间点（time.monotonic）
+            cpus: 子进程绑定的CPU列表，None为不绑定
+        """
+        self.pid = pid
+        self.fd = fd
+        self.request = request
+        self.priority = priority
+        self.cost = cost
+        self.started = time.monotonic()
+        self.deadline = deadline
+        self.cpus = cpus
+        self.data = b''
+        self.response = None
+        self.timed_out = False
+        self.cancelled = False
+
+def warmup():
+    """
+    在主进程中预先导入依赖、加载模型并走一遍打分流程
+
+    之后fork出的子进程通过写时复制直接继承这些状态，无需再次初始化。
+    """
+    import numpy as np
+    import pandas as pd
+    import requests
+
+    simple_config.load_config()
+    simple_model.ensure_loaded()
+
+    # 用一段合成的基频数据走一遍打分流程，预热pandas相关的代码路径
+    pitch = pd.DataFrame({'pitch': np.linspace(conf.pitch_min, conf.pitch_max - 1, 200)})
+    for gender in (None, 0, 1):
+        simple_judger.score_pitch(pitch.copy(), gender)
+
+    # 冻结当前所有对象，避免子进程中的垃圾回收触碰这些内存页而破坏写时复制
+    gc.collect()
+    gc.freeze()
+
+def _kill_group(pid):
+    """强制终止子进程所在的进程组（包括它启动的FFmpeg/Praat）"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+class ZygoteServer:
+    def __init__(self, handler, max_children=None, timeout=DEFAULT_TIMEOUT, bulk_limit=None, aging=DEFAULT_AGING,
+                 budget_mb=0, max_queue=0, cpu_sets=None):
+        """
+        初始化fork模式的常驻分析服务
+
+        主进程只负责读取请求和转发响应，每个请求在一个新fork出的子进程中处理，
+        Praat或FFmpeg导致的崩溃只影响该请求。
+
+        参数:
+            handler: 处理函数，接收请求字典和进度回调，返回响应字典
+            max_children: 同时运行的子进程数量，默认为CPU核数
+            timeout: 单个请求的最长处理时间（秒）
+            bulk_limit: 同时处理的批量请求数上限，默认为 max_children-1
+            aging: 批量请求排队超过多少秒后按交互请求对待
+            budget_mb: 同时处理的请求估计内存总量上限（MB），0为不限制
+            max_queue: 排队请求数上限，超过时立即拒绝（0为不限制）
+            cpu_sets: 子进程绑定的CPU列表（每个子进程绑定到其中运行中子进程最少的一组），None为不绑定
+        """
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("fork模式只支持提供 fork() 的系统")
+
+        self.handler = handler
+        self.max_children = max_children or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cpu_sets = cpu_sets
+        self._selector = selectors.DefaultSelector()
+        self._children = {}
+        # 排队中的请求按优先级调度
+        self._scheduler = PriorityScheduler(self.max_children, {BULK: bulk_limit}, aging, budget_mb, max_queue)
+        # 合并键 -> 等待同一结果的跟随请求；id(领头请求) -> 合并键
+        self._followers = {}
+        self._keys = {}
+
+    def _enqueue(self, request):
+        """请求排队；与排队中或正在处理的请求相同时只等待其结果"""
+        priority = normalize_priority(request.get('priority'))
+        # 主循环是单线程的：不读取文件内容计算摘要，避免大文件阻塞其他子进程的进度、响应和超时处理
+        key = key_for_request(request, quick=True)
+        if key is not None and key in self._followers:
+            log.info(f"请求 {request.get('id')} 与进行中的相同请求合并")
+            self._followers[key].append(request)
+            if priority == INTERACTIVE:
+                # 交互请求合并到排队中的批量请求时，把该批量请求提升为交互优先级
+                moved = self._scheduler.remove(lambda r: self._keys.get(id(r)) == key, BULK)
+                if moved is not None:
+                    self._scheduler.push(moved[0], INTERACTIVE, cost=moved[2])
+            return
+        # 排队已满时抛出 QueueFull，由调用方立即拒绝
+        self._scheduler.push(request, priority, cost=estimate_request_mb(request))
+        if key is not None:
+            self._followers[key] = []
+            self._keys[id(request)] = key
+
+    def _followers_of(self, request):
+        key = self._keys.get(id(request))
+        return self._followers.get(key, []) if key is not None else []
+
+    def _complete(self, request, response, stdout):
+        """输出领头请求的响应，并分发给合并的跟随请求"""
+        write_response(stdout, response)
+        key = self._keys.pop(id(request), None)
+        if key is None:
+            return
+        followers = self._followers.pop(key)
+        if not followers:
+            return
+        if response.get('status') == 'cancelled':
+            # 领头请求被取消，由第一个跟随请求接替处理
+            leader = followers.pop(0)
+            self._followers[key] = followers
+            self._keys[id(leader)] = key
+            self._scheduler.push(
+                leader,
+                normalize_priority(leader.get('priority')),
+                front=True,
+                cost=estimate_request_mb(leader)
+            )
+            return
+        for follower in followers:
+            write_response(stdout, dict(response, id=follower.get('id')))
+
+    def _dispatch(self):
+        """为调度器放行的请求fork子进程"""
+        while True:
+            entry = self._scheduler.pop()
+            if entry is None:
+                break
+            self._fork(*entry)
+
+    def _fork(self, request, priority, cost):
+        """fork一个子进程处理请求"""
+        cpus = None
+        if self.cpu_sets:
+            # 绑定到运行中的子进程最少的CPU组（按fork次数轮流时，耗时长的请求会让多个子进程挤在同一组上）
+            running = [child.cpus for child in self._children.values()]
+            cpus = min(self.cpu_sets, key=running.count)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            # 子进程：进度事件和最终响应逐帧写入管道，然后直接退出
+            exit_code = 0
+
+            def emit(message):
+                view = memoryview(encode_frame(message).encode('utf-8'))
+                while view:
+                    view = view[os.write(write_fd, view):]
+
+            try:
+                os.close(read_fd)
+                # 成为进程组长，FFmpeg/Praat留在本进程组中，主进程超时终止时一起终止
+                os.setpgid(0, 0)
+                simple_cancel.share_process_group()
+                if cpus:
+                    os.sched_setaffinity(0, cpus)
+                # 主进程用 SIGTERM 取消请求：终止FFmpeg/Praat进程组、删除临时文件后返回 cancelled 响应
+                token = simple_cancel.CancelToken()
+                simple_cancel.install_signal_handlers(token)
+                with simple_cancel.scope(token):
+                    emit(self.handler(request, emit))
+            except BaseException:
+                exit_code = 1
+            finally:
+                try:
+                    sys.stderr.flush()
+                finally:
+                    os._exit(exit_code)
+
+        os.close(write_fd)
+        try:
+            # 与子进程中的 setpgid 相同，避免主进程在子进程设置之前终止进程组
+            os.setpgid(pid, pid)
+        except (PermissionError, ProcessLookupError):
+            pass
+        child = _Child(pid, read_fd, request, priority, cost, time.monotonic() + self.timeout, cpus)
+        self._children[read_fd] = child
+        self._selector.register(read_fd, selectors.EVENT_READ, child)
+
+    def _finish(self, child, stdout):
+        """子进程结束后回收并输出响应"""
+        self._selector.unregister(child.fd)
+        os.close(child.fd)
+        del self._children[child.fd]
+        _, status = os.waitpid(child.pid, 0)
+        # 子进程退出后终止进程组中残留的FFmpeg/Praat（取消时只终止了shell等直接子进程）
+        _kill_group(child.pid)
+        self._scheduler.release(child.priority, child.cost, time.monotonic() - child.started)
+
+        request_id = child.request.get('id')
+        if child.cancelled:
+            response = {'id': request_id, 'status': 'cancelled', 'error': '已取消'}
+            if child.response is not None and child.response.get('status') == 'cancelled':
+                response = child.response
+        elif child.timed_out:
+            response = {'id': request_id, 'status': 'error', 'error': f"分析超时（{self.timeout}秒）"}
+        elif child.response is not None:
+            response = child.response
+        else:
+            if os.WIFSIGNALED(status):
+                reason = f"被信号 {os.WTERMSIG(status)} 终止"
+            else:
+                reason = f"退出码 {os.WEXITSTATUS(status)}"
+            log.error(f"请求 {request_id} 的子进程异常退出: {reason}")
+            response = {'id': request_id, 'status': 'error', 'error': f"分析进程异常退出: {reason}"}
+
+        self._complete(child.request, response, stdout)
+
+    def _receive(self, child, data, stdout):
+        """处理子进程写来的帧：进度事件立即转发，其余作为最终响应保存"""
+        child.data += data
+        *lines, child.data = child.data.split(b'\n')
+        for line in lines:
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except Exception as e:
+                log.error(f"子进程输出解析失败: {str(e)}")
+                continue
+            if message.get('type') == 'progress':
+                write_response(stdout, message)
+                for follower in self._followers_of(child.request):
+                    if follower.get('progress'):
+                        write_response(stdout, dict(message, id=follower.get('id')))
+            else:
+                child.response = message
+
+    def _cancel(self, request_id, stdout):
+        """
+        取消排队中或正在处理的请求（排队中的请求立即输出 cancelled 响应）
+
+        参数:
+            request_id: 请求ID
+            stdout: 输出流
+
+        返回:
+            'pending'（排队中）、'running'（正在处理）或None（未找到）
+        """
+        cancelled = {'id': request_id, 'status': 'cancelled', 'error': '已取消'}
+        for followers in self._followers.values():
+            for request in followers:
+                if request.get('id') == request_id:
+                    followers.remove(request)
+                    write_response(stdout, cancelled)
+                    return 'pending'
+
+        entry = self._scheduler.remove(lambda r: r.get('id') == request_id)
+        if entry is not None:
+            self._complete(entry[0], cancelled, stdout)
+            return 'pending'
+
+        for child in self._children.values():
+            if child.request.get('id') == request_id and not child.cancelled:
+                log.info(f"取消请求 {request_id}，子进程: {child.pid}")
+                child.cancelled = True
+                child.deadline = min(child.deadline, time.monotonic() + CANCEL_GRACE)
+                os.kill(child.pid, signal.SIGTERM)
+                return 'running'
+        return None
+
+    def _kill_expired(self):
+        """终止超时的子进程"""
+        now = time.monotonic()
+        for child in self._children.values():
+            if not child.timed_out and child.deadline <= now:
+                if child.cancelled:
+                    log.warning(f"请求 {child.request.get('id')} 取消后子进程 {child.pid} 未及时退出，强制终止")
+                else:
+                    log.warning(f"请求 {child.request.get('id')} 超时，终止子进程 {child.pid}")
+                child.timed_out = True
+                _kill_group(child.pid)
+
+    def _next_timeout(self):
+        if not self._children:
+            return None
+        deadline = min(child.deadline for child in self._children.values())
+        return max(0, deadline - time.monotonic())
+
+    def serve(self, stdin=None, stdout=None):
+        """
+        从输入流逐行读取JSON请求，为每个请求fork一个子进程处理
+
+        参数:
+            stdin: 输入流，默认为标准输入
+            stdout: 输出流，默认为标准输出
+
+        返回:
+            进程退出码
+        """
+        stdin = stdin or sys.stdin
+        stdout = stdout or sys.stdout
+        in_fd = stdin.fileno()
+        self._selector.register(in_fd, selectors.EVENT_READ, None)
+
+        buffer = b''
+        reading = True
+        shutdown_id = None
+
+        log.info(f"fork模式已启动，最多同时运行 {self.max_children} 个子进程")
+        write_response(stdout, {'type': 'ready'})
+
+        while reading or self._children or len(self._scheduler):
+            self._dispatch()
+
+            for key, _ in self._selector.select(self._next_timeout()):
+                if key.data is None:
+                    chunk = os.read(in_fd, 65536)
+                    if not chunk:
+                        reading = False
+                        self._selector.unregister(in_fd)
+                        continue
+
+                    buffer += chunk
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        try:
+                            request = parse_request_line(line.decode('utf-8'))
+                        except Exception as e:
+                            log.error(f"请求解析失败: {str(e)}")
+                            write_response(stdout, {'id': None, 'status': 'error', 'error': f"请求解析失败: {str(e)}"})
+                            continue
+
+                        if request is None:
+                            continue
+                        if request.get('type') == 'shutdown':
+                            # 不再接收新请求，等待进行中的请求完成后退出
+                            shutdown_id = request.get('id')
+                            reading = False
+                            self._selector.unregister(in_fd)
+                            break
+                        if request.get('type') == 'cancel':
+                            state = self._cancel(request.get('id'), stdout)
+                            write_response(stdout, {'id': request.get('id'), 'status': 'ok', 'type': 'cancel', 'cancelled': state is not None})
+                            continue
+                        try:
+                            self._enqueue(request)
+                            # 有空闲名额时立即开始处理，只有真正需要等待的请求才计入排队上限
+                            self._dispatch()
+                        except QueueFull as e:
+                            log.warning(f"请求 {request.get('id')} 被拒绝: {str(e)}")
+                            write_response(stdout, {
+                                'id': request.get('id'),
+                                'status': 'rejected',
+                                'error': str(e),
+                                'retry_after': e.retry_after
+                            })
+                        except ValueError as e:
+                            write_response(stdout, {'id': request.get('id'), 'status': 'error', 'error': str(e)})
+
+                    if not reading:
+                        break
+                else:
+                    child = key.data
+                    data = os.read(child.fd, 65536)
+                    if data:
+                        self._receive(child, data, stdout)
+                    else:
+                        self._finish(child, stdout)
+
+            self._kill_expired()
+
+        if shutdown_id is not None:
+            write_response(stdout, {'id': shutdown_id, 'status': 'ok', 'type': 'shutdown'})
+
+        log.info("fork模式已退出")
+        return 0
+
+def serve_zygote(handler, stdin=None, stdout=None, max_children=None, timeout=DEFAULT_TIMEOUT,
+                 bulk_limit=None, aging=DEFAULT_AGING, budget_mb=0, max_queue=0, thread_budget=None, pin_cpus=False):
+    """
+    预热后以fork模式提供常驻分析服务
+
+    参数:
+        handler: 处理函数，接收请求字典，返回响应字典
+        stdin: 输入流，默认为标准输入
+        stdout: 输出流，默认为标准输出
+        max_children: 同时运行的子进程数量，默认为CPU核数
+        timeout: 单个请求的最长处理时间（秒）
+        bulk_limit: 同时处理的批量请求数上限，默认为 max_children-1
+        aging: 批量请求排队超过多少秒后按交互请求对待
+        budget_mb: 同时处理的请求估计内存总量上限（MB），0为不限制
+        max_queue: 排队请求数上限，超过时立即拒绝（0为不限制）
+        thread_budget: 每个子进程的线程预算，默认按同时运行的子进程数平均分配CPU
+        pin_cpus: 是否把子进程分散绑定到各自的CPU上
+
+    返回:
+        进程退出码
+    """
+    max_children = max_children or os.cpu_count() or 1
+    thread_budget = thread_budget or simple_threads.parse_thread_budget(None, max_children)
+    cpu_sets = simple_threads.cpu_sets(max_children, max(thread_budget.values())) if pin_cpus else None
+
+    # 子进程通过fork继承环境变量和已导入的库，线程预算必须在预热（导入numpy）之前应用
+    simple_threads.apply_thread_budget(thread_budget)
+    server = ZygoteServer(handler, max_children, timeout, bulk_limit, aging, budget_mb, max_queue, cpu_sets)
+    warmup()
+    return server.serve(stdin, stdout)
@@ -11,6 +11,9 @@ const { desktopCapturer } = require('electron');
 // 初始化存储
 const store = new Store();
 
+// 分析器错误输出只保留最后64KB（错误分类只需要最近的输出）
+const STDERR_TAIL_LIMIT = 64 * 1024;
+
 // 保存主窗口引用
 let mainWindow;
 
@@ -405,6 +408,9 @@ ipcMain.handle('analyze-voice', async (event, audioFilePath, gender) => {
         try {
           const dataStr = data.toString('utf-8');
           stderrData += dataStr;
+          if (stderrData.length > STDERR_TAIL_LIMIT) {
+            stderrData = stderrData.slice(-STDERR_TAIL_LIMIT);
+          }
           console.log('分析器错误输出:', dataStr);
         } catch (e) {
           console.log('分析器错误输出(无法解码):', data);
@@ -419,7 +425,16 @@ ipcMain.handle('analyze-voice', async (event, audioFilePath, gender) => {
             // 将Buffer转换为UTF-8字符串，然后解析JSON
             const outputStr = stdoutData.toString('utf-8').trim();
             console.log('完整标准输出(UTF-8):', outputStr);
-            
+
+            // 新版分析器的标准输出只包含JSON结果（日志写入标准错误），直接解析
+            try {
+              const result = JSON.parse(outputStr);
+              resolve(result);
+              return;
+            } catch (directParseError) {
+              // 兼容旧版分析器：从混有日志的输出中提取JSON
+            }
+
             // 检查是否有调试版本的JSON（不使用ASCII转义）
             const debugJsonMatch = outputStr.match(/DEBUG_JSON_UTF8:(\{[\s\S]*\})/);
             if (debugJsonMatch) {
@@ -322,7 +322,9 @@ def analyze_voice(file_path, debug_mode=True):
                 """并行提取多个特征以提高性能"""
                 features = {}
                 
-                with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+                # 线程数受工作进程的线程预算限制（VOICE_ANALYZER_THREADS），避免多个进程同时运行时过度订阅CPU
+                max_workers = max(1, min(3, int(os.environ.get('VOICE_ANALYZER_THREADS', 3))))
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
                     # 提交频谱质心计算任务
                     cent_future = executor.submit(
                         librosa.feature.spectral_centroid, 